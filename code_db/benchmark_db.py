@@ -0,0 +1,516 @@
+"""
+==============================================================================
+BANC D'ESSAI DES REQUÊTES ET CONSEILLER D'INDEX (SQLite)
+==============================================================================
+
+run_example_queries affiche des résultats, sans dire si les index de
+SQL_SCHEMA / SQL_INDEX servent. Ici, sur une base synthétique de taille
+configurable (lignes du dataset réel tirées avec remise et bruitées) :
+    1. chaque requête du catalogue (EXAMPLE_QUERIES + requêtes ciblées)
+       est chronométrée (médiane de NB_REPETITIONS_BENCHMARK exécutions)
+       et son plan (EXPLAIN QUERY PLAN) est conservé : index utilisés,
+       tables parcourues en entier, B-tree temporaires
+    2. les index existants qu'aucune requête n'utilise sont signalés
+    3. pour les tables parcourues sans index couvrant, des index composites,
+       couvrants ou partiels sont proposés à partir des colonnes lues
+       (authorizer SQLite) et de leur rôle dans la requête (égalité,
+       intervalle, GROUP BY / ORDER BY, IS NOT NULL), puis créés un par un,
+       mesurés (avant / après) et supprimés
+
+Un index n'est retenu que si le planificateur l'utilise et qu'il divise le
+temps médian par au moins GAIN_MIN_INDEX.
+
+Exemple :
+    >>> profil, propositions = run_benchmark("dvf", taille=200_000)
+"""
+
+import copy
+import json
+import re
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from config_db import SOURCE_DVF, PATH_FILE_TO_JSON_DEFERLA, PATH_DIR_BENCHMARK
+from config_db import NB_LIGNES_BENCHMARK_DVF, NB_ANNONCES_BENCHMARK_DEFERLA, NB_REPETITIONS_BENCHMARK, GRAINE_BENCHMARK
+from config_db import GAIN_MIN_INDEX, NB_COLONNES_MAX_INDEX, NB_LIGNES_MIN_INDEX
+import dvf_database
+import deferla_database
+from compact_db import compact_database
+
+
+# CATALOGUE DES REQUÊTES
+# (nom, SQL, paramètres) ; les paramètres peuvent être une fonction de la connexion
+# (valeurs prises dans la base mesurée)
+
+def _commune_la_plus_active(conn):
+    return conn.execute("SELECT code_commune FROM mutations GROUP BY code_commune ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+
+
+def _code_postal_le_plus_frequent(conn):
+    return conn.execute("SELECT code_postal FROM annonces GROUP BY code_postal ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+
+
+CATALOGUE_DVF = [(nom, sql, None) for nom, _, sql in dvf_database.EXAMPLE_QUERIES] + [
+    ("ventes_tranche_prix", """
+        SELECT id_mutation, date_mutation, valeur_fonciere, code_commune
+        FROM mutations
+        WHERE valeur_fonciere BETWEEN ? AND ?
+    """, [200_000, 220_000]),
+    ("biens_type_surface", """
+        SELECT id_bien, surface_reelle_bati, longitude, latitude
+        FROM biens
+        WHERE type_local = ? AND surface_reelle_bati BETWEEN ? AND ?
+    """, ["Appartement", 40, 45]),
+    ("historique_commune", """
+        SELECT id_mutation, date_mutation, valeur_fonciere, prix_par_m2_habitable
+        FROM mutations
+        WHERE code_commune = ?
+        ORDER BY date_mutation DESC
+        LIMIT 50
+    """, _commune_la_plus_active),
+    ("prix_m2_commune_periode", """
+        SELECT COUNT(*) AS nb_ventes, ROUND(AVG(prix_par_m2_habitable), 2) AS prix_m2_moyen
+        FROM mutations
+        WHERE code_commune = ? AND date_mutation >= '2022-01-01'
+    """, _commune_la_plus_active),
+    ("ventes_par_nature", """
+        SELECT nature_mutation, COUNT(*) AS nb_ventes, ROUND(AVG(valeur_fonciere), 2) AS prix_moyen
+        FROM mutations
+        GROUP BY nature_mutation
+    """, None),
+]
+
+# Requetes sur les vues : memes noms et colonnes dans le schema normalise et le schema compact (compact_db.py)
+CATALOGUE_VUES_DVF = [
+    ("mutations_completes_commune", """
+        SELECT * FROM vue_mutations_complete WHERE code_commune = ? LIMIT 100
+    """, _commune_la_plus_active),
+    ("mutations_completes_par_annee", """
+        SELECT 
+            substr(date_mutation, 1, 4) AS annee,
+            COUNT(*) AS nb_ventes,
+            ROUND(AVG(valeur_fonciere), 2) AS prix_moyen,
+            ROUND(AVG(taux_hors_renegociations), 2) AS taux_moyen
+        FROM vue_mutations_complete
+        GROUP BY annee
+    """, None),
+    ("mutations_completes_par_type", """
+        SELECT type_local, nature_mutation, COUNT(*) AS nb_ventes, ROUND(AVG(prix_par_m2_habitable), 2) AS prix_m2_moyen
+        FROM vue_mutations_complete
+        GROUP BY type_local, nature_mutation
+    """, None),
+    ("stats_departement", "SELECT * FROM vue_stats_departement", None),
+]
+CATALOGUE_DVF += CATALOGUE_VUES_DVF
+
+CATALOGUE_DEFERLA = [(nom, sql, None) for nom, _, sql in deferla_database.EXAMPLE_QUERIES] + [
+    ("annonces_code_postal", """
+        SELECT id, prix, surface, pieces FROM annonces WHERE code_postal = ? ORDER BY prix
+    """, _code_postal_le_plus_frequent),
+    ("annonces_type_prix", """
+        SELECT id, prix, surface, ville FROM annonces WHERE type = ? AND prix BETWEEN ? AND ?
+    """, ["Appartement", 200_000, 300_000]),
+    ("stats_ville", "SELECT * FROM vue_stats_ville", None),
+]
+
+CATALOGUES = {"dvf": CATALOGUE_DVF, "dvf_compact": CATALOGUE_VUES_DVF, "deferla": CATALOGUE_DEFERLA}
+
+
+# BASES SYNTHÉTIQUES
+
+def build_synthetic_dvf(db_path, nb_lignes: int = NB_LIGNES_BENCHMARK_DVF, source=SOURCE_DVF,
+                        graine: int = GRAINE_BENCHMARK) -> str:
+    """
+    Base DVF synthétique de nb_lignes mutations : lignes du dataset source
+    tirées avec remise, identifiants rendus uniques, prix, surfaces et
+    coordonnées bruités (±10 %, ±50 m). Chargée par insert_data_from_polars.
+
+    Parameters
+    ----------
+    db_path : str | Path
+        Base à créer (écrasée)
+    nb_lignes : int
+        Nombre de mutations
+    source : str | Path
+        Parquet DVF servant de modèle
+    graine : int
+        Graine du tirage
+
+    Returns
+    -------
+    str
+        Chemin vers la base de données créée
+    """
+    df = pl.read_parquet(source)
+    rng = np.random.default_rng(graine)
+    df = df[rng.integers(0, df.height, nb_lignes)]
+
+    bruit_prix = pl.Series(rng.uniform(0.9, 1.1, nb_lignes))
+    bruit_surface = pl.Series(rng.uniform(0.9, 1.1, nb_lignes))
+    dx, dy = pl.Series(rng.uniform(-50, 50, nb_lignes)), pl.Series(rng.uniform(-50, 50, nb_lignes))
+    df = df.with_columns([
+        (pl.col("id_mutation") + "-s" + pl.int_range(pl.len()).cast(pl.Utf8)).alias("id_mutation"),
+        (pl.col("valeur_fonciere") * bruit_prix).alias("valeur_fonciere"),
+        (pl.col("surface_reelle_bati") * bruit_surface).alias("surface_reelle_bati"),
+        (pl.col("x_proj") + dx).alias("x_proj"),
+        (pl.col("y_proj") + dy).alias("y_proj"),
+        # ~ 1e-5 degre par metre (latitude), un peu plus en longitude
+        (pl.col("longitude") + dx * 1.35e-5).alias("longitude"),
+        (pl.col("latitude") + dy * 0.9e-5).alias("latitude"),
+    ]).with_columns([
+        (pl.col("valeur_fonciere") / pl.col("surface_reelle_bati")).alias("prix_par_m2_habitable"),
+        pl.col("valeur_fonciere").log().alias("valeur_fonciere_log"),
+    ])
+
+    Path(db_path).unlink(missing_ok=True)
+    dvf_database.create_database(db_path, verbose=False)
+    dvf_database.insert_data_from_polars(df, db_path, verbose=False)
+    return str(db_path)
+
+
+def build_synthetic_deferla(db_path, nb_annonces: int = NB_ANNONCES_BENCHMARK_DEFERLA,
+                            json_path=PATH_FILE_TO_JSON_DEFERLA, graine: int = GRAINE_BENCHMARK) -> str:
+    """
+    Base Deferla synthétique de nb_annonces annonces : annonces du JSON source
+    tirées avec remise, identifiants rendus uniques, prix et surfaces bruités.
+    Chargée par insert_data_from_json.
+
+    Returns
+    -------
+    str
+        Chemin vers la base de données créée
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    rng = np.random.default_rng(graine)
+
+    annonces = []
+    for num, i in enumerate(rng.integers(0, len(data), nb_annonces)):
+        annonce = copy.deepcopy(data[i])
+        annonce["id"] = f"{annonce['id']}-s{num}"
+        for col in ("prix", "surface"):
+            if isinstance(annonce.get(col), (int, float)) and not isinstance(annonce[col], bool):
+                annonce[col] = type(annonce[col])(annonce[col] * rng.uniform(0.9, 1.1))
+        annonces.append(annonce)
+
+    json_synthetique = Path(db_path).with_suffix(".json")
+    with open(json_synthetique, "w", encoding="utf-8") as f:
+        json.dump(annonces, f, ensure_ascii=False)
+
+    Path(db_path).unlink(missing_ok=True)
+    deferla_database.create_database(db_path)
+    deferla_database.insert_data_from_json(json_synthetique, db_path)
+    json_synthetique.unlink()
+    return str(db_path)
+
+
+# MESURES
+
+def _parametres(conn, params):
+    return params(conn) if callable(params) else params
+
+
+def _plan(conn, sql: str, params) -> list:
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params or ())]
+
+
+def _chronometrer(conn, sql: str, params, repetitions: int) -> tuple:
+    # (mediane ms, min ms, nombre de lignes) ; une execution a blanc d'abord (cache de pages chaud)
+    nb_lignes = len(conn.execute(sql, params or ()).fetchall())
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        conn.execute(sql, params or ()).fetchall()
+        durees.append((time.perf_counter() - debut) * 1000)
+    return statistics.median(durees), min(durees), nb_lignes
+
+
+def _index_utilises(plan: list) -> list:
+    return sorted({nom for ligne in plan for nom in re.findall(r"INDEX (\w+)", ligne)})
+
+
+def _parcours_complets(plan: list) -> list:
+    # Tables (alias) lues en entier, sans index
+    return [m.group(1) for ligne in plan if (m := re.match(r"SCAN (\w+)$", ligne))]
+
+
+def profile_queries(db_path, catalogue, repetitions: int = NB_REPETITIONS_BENCHMARK) -> pl.DataFrame:
+    """
+    Chronomètre chaque requête du catalogue et conserve son plan d'exécution.
+
+    Parameters
+    ----------
+    db_path : str | Path
+        Base mesurée
+    catalogue : list
+        (nom, SQL, paramètres)
+    repetitions : int
+        Exécutions mesurées par requête
+
+    Returns
+    -------
+    pl.DataFrame
+        requete, ms_median, ms_min, nb_lignes, index_utilises, parcours_complets, btree_temporaire, plan
+    """
+    conn = sqlite3.connect(db_path)
+    lignes = []
+    for nom, sql, params in catalogue:
+        params = _parametres(conn, params)
+        plan = _plan(conn, sql, params)
+        ms_median, ms_min, nb_lignes = _chronometrer(conn, sql, params, repetitions)
+        lignes.append({"requete": nom, "ms_median": ms_median, "ms_min": ms_min, "nb_lignes": nb_lignes,
+                       "index_utilises": _index_utilises(plan), "parcours_complets": _parcours_complets(plan),
+                       "btree_temporaire": any("TEMP B-TREE" in ligne for ligne in plan),
+                       "plan": " | ".join(plan)})
+    conn.close()
+    return pl.DataFrame(lignes)
+
+
+def unused_indexes(db_path, profil: pl.DataFrame) -> list:
+    """
+    Index créés explicitement (hors clés primaires / UNIQUE) qu'aucune requête du profil n'utilise.
+    """
+    conn = sqlite3.connect(db_path)
+    index = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+    conn.close()
+    utilises = set(profil["index_utilises"].explode().drop_nulls().to_list())
+    return sorted(set(index) - utilises)
+
+
+# CONSEILLER D'INDEX
+
+MOTS_CLES_SQL = {"ON", "WHERE", "JOIN", "LEFT", "INNER", "CROSS", "GROUP", "ORDER", "LIMIT", "USING", "AS", "NATURAL"}
+
+
+def _alias_tables(conn, sql: str) -> dict:
+    # alias -> table, d'apres la requete et les vues de la base (le plan d'une vue cite les alias de la vue)
+    textes = [sql] + [row[0] for row in conn.execute("SELECT sql FROM sqlite_master WHERE type = 'view'")]
+    alias = {}
+    for texte in textes:
+        for table, nom in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", texte, re.I):
+            alias.setdefault(table, table)
+            if nom and nom.upper() not in MOTS_CLES_SQL:
+                alias.setdefault(nom, table)
+    return alias
+
+
+def _colonnes_lues(conn, sql: str, params) -> dict:
+    # table -> colonnes lues par la requete (dans l'ordre), via l'authorizer a la preparation
+    lues = {}
+
+    def authorizer(action, table, colonne, base, declencheur):
+        if action == sqlite3.SQLITE_READ and table and colonne:
+            lues.setdefault(table, {})[colonne] = None
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        conn.execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+    finally:
+        conn.set_authorizer(None)
+    return {table: list(colonnes) for table, colonnes in lues.items()}
+
+
+def _roles(sql: str, table: str, colonne: str, alias: dict) -> set:
+    # Roles de la colonne dans la requete : "egalite", "intervalle", "non_null", "tri" (GROUP BY / ORDER BY)
+    roles = set()
+    motif = rf"(?<![\w.])(?:(\w+)\.)?{colonne}\b"
+    segments_tri = re.findall(r"\b(?:GROUP|ORDER)\s+BY\s+(.*?)(?=\bHAVING\b|\bORDER\b|\bLIMIT\b|\)|$)", sql, re.I | re.S)
+    for m in re.finditer(motif, sql, re.I):
+        if m.group(1) and alias.get(m.group(1)) != table:
+            continue
+        avant, apres = sql[:m.start()].rstrip(), sql[m.end():]
+        if re.match(r"\s*(?:==?(?!=)|IN\b)", apres, re.I) or re.search(r"(?<![<>!])=$", avant):
+            roles.add("egalite")
+        if re.match(r"\s*(?:<|>|BETWEEN\b|LIKE\b)", apres, re.I) or re.search(r"[<>]=?$", avant):
+            roles.add("intervalle")
+        if re.match(r"\s+IS\s+NOT\s+NULL\b", apres, re.I):
+            roles.add("non_null")
+    if any(re.search(motif, segment, re.I) for segment in segments_tri):
+        roles.add("tri")
+    return roles
+
+
+def _index_existants(conn, table: str) -> set:
+    return {tuple(row[2] for row in conn.execute(f'PRAGMA index_info("{nom}")'))
+            for _, nom, *_ in conn.execute(f'PRAGMA index_list("{table}")')}
+
+
+def _cle_primaire_entiere(conn, table: str) -> set:
+    # Colonne INTEGER PRIMARY KEY (alias du rowid) : deja presente dans tout index
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")') if row[5] and row[2].upper() == "INTEGER"}
+
+
+def propose_indexes(conn, sql: str, params) -> list:
+    """
+    Index candidats pour une requête : pour chaque table volumineuse lue sans
+    index couvrant, un index composite (égalités puis un intervalle, ou
+    colonnes de tri), sa version couvrante (+ colonnes lues) et une version
+    partielle (WHERE col IS NOT NULL) si la requête filtre les NULL.
+
+    Returns
+    -------
+    list
+        (nom de l'index, CREATE INDEX ...)
+    """
+    plan = _plan(conn, sql, params)
+    alias = _alias_tables(conn, sql)
+    a_indexer = {alias.get(m.group(1), m.group(1)) for ligne in plan
+                 if (m := re.match(r"(?:SCAN|SEARCH) (\w+)", ligne))
+                 and "COVERING INDEX" not in ligne and "PRIMARY KEY" not in ligne and "VIRTUAL TABLE" not in ligne}
+
+    candidats = {}
+    for table, colonnes in _colonnes_lues(conn, sql, params).items():
+        if table not in a_indexer:
+            continue
+        if conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] < NB_LIGNES_MIN_INDEX:
+            continue
+        colonnes = [col for col in colonnes if col not in _cle_primaire_entiere(conn, table)]
+        roles = {col: _roles(sql, table, col, alias) for col in colonnes}
+        egalites = [col for col in colonnes if "egalite" in roles[col]]
+        intervalles = [col for col in colonnes if "intervalle" in roles[col] and col not in egalites]
+        tris = [col for col in colonnes if "tri" in roles[col] and col not in egalites]
+        non_nulls = [col for col in colonnes if "non_null" in roles[col]]
+
+        cle = egalites + (intervalles[:1] or tris)
+        couvrant = (cle + [col for col in colonnes if col not in cle]) if len(colonnes) <= NB_COLONNES_MAX_INDEX else []
+        existants = _index_existants(conn, table)
+
+        propositions = [(cle, None), (couvrant, None)]
+        if non_nulls:
+            propositions += [(couvrant or cle or non_nulls, f"{non_nulls[0]} IS NOT NULL")]
+        for cols, condition in propositions:
+            if not cols or (condition is None and tuple(cols) in existants):
+                continue
+            nom = f"idx_{table}_{'_'.join(cols)}" + ("_nn" if condition else "")
+            definition = f'CREATE INDEX "{nom}" ON "{table}"({", ".join(cols)})' + (f" WHERE {condition}" if condition else "")
+            candidats[nom] = definition
+    return list(candidats.items())
+
+
+def advise_indexes(db_path, catalogue, repetitions: int = NB_REPETITIONS_BENCHMARK,
+                   gain_min: float = GAIN_MIN_INDEX) -> pl.DataFrame:
+    """
+    Teste les index proposés pour chaque requête du catalogue : création,
+    mesure avant / après, suppression. La base est modifiée pendant l'essai
+    (à lancer sur une base de banc d'essai, pas en production).
+
+    Returns
+    -------
+    pl.DataFrame
+        requete, index, definition, ms_avant, ms_apres, gain, utilise, retenu, plan_apres
+    """
+    conn = sqlite3.connect(db_path)
+    lignes = []
+    for nom, sql, params in catalogue:
+        params = _parametres(conn, params)
+        candidats = propose_indexes(conn, sql, params)
+        if not candidats:
+            continue
+        ms_avant, _, _ = _chronometrer(conn, sql, params, repetitions)
+        for index, definition in candidats:
+            conn.execute(definition)
+            plan = _plan(conn, sql, params)
+            ms_apres, _, _ = _chronometrer(conn, sql, params, repetitions)
+            conn.execute(f'DROP INDEX "{index}"')
+            utilise = index in _index_utilises(plan)
+            gain = ms_avant / ms_apres if ms_apres > 0 else float("inf")
+            lignes.append({"requete": nom, "index": index, "definition": definition,
+                           "ms_avant": ms_avant, "ms_apres": ms_apres, "gain": gain,
+                           "utilise": utilise, "retenu": utilise and gain >= gain_min,
+                           "plan_apres": " | ".join(plan)})
+    conn.close()
+    schema = {"requete": pl.Utf8, "index": pl.Utf8, "definition": pl.Utf8, "ms_avant": pl.Float64,
+              "ms_apres": pl.Float64, "gain": pl.Float64, "utilise": pl.Boolean, "retenu": pl.Boolean,
+              "plan_apres": pl.Utf8}
+    return pl.DataFrame(lignes, schema=schema)
+
+
+# RAPPORT
+
+def print_benchmark_report(profil: pl.DataFrame, propositions: pl.DataFrame, inutilises: list):
+    """
+    Affiche le profil des requêtes, les index inutilisés et les index retenus.
+    """
+    print("\n" + "="*60)
+    print("PROFIL DES REQUÊTES")
+    print("="*60)
+    for row in profil.iter_rows(named=True):
+        print(f"\n  {row['requete']}: {row['ms_median']:.2f} ms (min {row['ms_min']:.2f}), {row['nb_lignes']} lignes")
+        print(f"     index: {', '.join(row['index_utilises']) or '-'}"
+              f" | parcours complets: {', '.join(row['parcours_complets']) or '-'}"
+              f"{' | B-tree temporaire' if row['btree_temporaire'] else ''}")
+
+    print("\nINDEX INUTILISÉS PAR LE CATALOGUE:")
+    for index in inutilises:
+        print(f"  - {index}")
+
+    print("\nINDEX PROPOSÉS (retenus):")
+    meilleurs = (propositions.filter(pl.col("retenu"))
+                             .sort("gain", descending=True)
+                             .unique("requete", keep="first", maintain_order=True))
+    for row in meilleurs.iter_rows(named=True):
+        print(f"  - {row['requete']}: {row['ms_avant']:.2f} ms -> {row['ms_apres']:.2f} ms (x{row['gain']:.1f})")
+        print(f"     {row['definition']};")
+    if meilleurs.is_empty():
+        print("  (aucun)")
+    print("\n" + "="*60)
+
+
+def run_benchmark(base: str = "dvf", db_path=None, taille: int = None, reconstruire: bool = True,
+                  repetitions: int = NB_REPETITIONS_BENCHMARK):
+    """
+    Banc d'essai complet d'une base : construction de la base synthétique,
+    profil des requêtes du catalogue, index inutilisés, index proposés.
+
+    Parameters
+    ----------
+    base : str
+        "dvf", "dvf_compact" (requêtes sur les vues, schéma compact) ou "deferla"
+    db_path : str | Path, optional
+        Base de banc d'essai (défaut : PATH_DIR_BENCHMARK / "<base>_benchmark.db")
+    taille : int, optional
+        Mutations (dvf) ou annonces (deferla) de la base synthétique
+    reconstruire : bool
+        False : réutiliser la base de banc d'essai existante
+    repetitions : int
+        Exécutions mesurées par requête
+
+    Returns
+    -------
+    tuple
+        (profil, propositions) : DataFrames Polars
+    """
+    if db_path is None:
+        PATH_DIR_BENCHMARK.mkdir(parents=True, exist_ok=True)
+        db_path = PATH_DIR_BENCHMARK / f"{base}_benchmark.db"
+    if reconstruire or not Path(db_path).exists():
+        debut = time.perf_counter()
+        if base == "dvf":
+            build_synthetic_dvf(db_path, taille or NB_LIGNES_BENCHMARK_DVF)
+        elif base == "dvf_compact":
+            # Base normalisee synthetique, puis sa replique compacte
+            normalisee = Path(db_path).with_suffix(".normalise.db")
+            build_synthetic_dvf(normalisee, taille or NB_LIGNES_BENCHMARK_DVF)
+            compact_database(normalisee, db_path, verbose=False)
+            normalisee.unlink()
+        else:
+            build_synthetic_deferla(db_path, taille or NB_ANNONCES_BENCHMARK_DEFERLA)
+        print(f"✓ Base synthétique {base} construite en {time.perf_counter() - debut:.1f} s : {db_path}")
+
+    catalogue = CATALOGUES[base]
+    profil = profile_queries(db_path, catalogue, repetitions)
+    propositions = advise_indexes(db_path, catalogue, repetitions)
+    print_benchmark_report(profil, propositions, unused_indexes(db_path, profil))
+    return profil, propositions
+
+
+if __name__ == "__main__":
+    run_benchmark("dvf")
+    run_benchmark("dvf_compact")
+    run_benchmark("deferla")
@@ -0,0 +1,350 @@
+"""
+==============================================================================
+SCHÉMA COMPACT DE LA BASE DVF (réplique analytique)
+==============================================================================
+
+Le schéma normalisé (dvf_database.py) reste la base de chargement : complet,
+parallèle par shards ou incrémental (cle_mutation / empreinte). Le schéma
+compact en est une copie en lecture, construite en SQL (ATTACH + INSERT ...
+SELECT, sans passer par Python) après chaque chargement :
+    1. dates en numéro de jour (entier, jours depuis le 1970-01-01) au lieu
+       de texte 'AAAA-MM-JJ' : 1 à 3 octets au lieu de 11, comparaisons entières
+       (Polars : pl.col("jour_mutation").cast(pl.Date))
+    2. type_local et nature_mutation en tables dictionnaires (types_local,
+       natures_mutation) : un petit entier par ligne au lieu de la chaîne
+    3. proximité intégrée à biens (relation 1:1) : plus de table ni d'index
+       proximite, une vue proximite garde les mêmes colonnes
+    4. WITHOUT ROWID pour les tables à clé texte (départements, communes,
+       agrégats) : une seule B-tree au lieu de la table + l'index de la clé
+    5. colonnes et index propres au chargement incrémental (cle_mutation,
+       empreinte, idx_mut_cle) retirés, index redondants avec le R*Tree ou
+       les clés primaires retirés
+
+vue_mutations_complete, vue_stats_commune et vue_stats_departement gardent
+leur nom et leurs colonnes : les requêtes sur les vues marchent sur les deux schémas.
+
+Exemple :
+    >>> compact_database("final_dvf_immobilier.db", "final_dvf_immobilier_compact.db")
+"""
+
+import sqlite3
+from pathlib import Path
+
+from config_db import PRAGMAS_CHARGEMENT, PRAGMAS_APRES_CHARGEMENT
+from spatial_db import rtree_sql, fill_rtree
+from dvf_database import POI_PROXIMITE
+
+
+# Numero de jour (jours depuis 1970-01-01) <-> date texte 'AAAA-MM-JJ'
+def jour_sql(expression: str) -> str:
+    return f"CAST(julianday({expression}) - 2440587.5 AS INTEGER)"
+
+
+def date_sql(expression: str) -> str:
+    return f"date({expression} + 2440587.5)"
+
+
+COLONNES_PROXIMITE_COMPACT = [col for poi in POI_PROXIMITE
+                              for col in (f"nb_{poi}", f"distance_min_{poi}", f"distance_min_{poi}_manquante")]
+
+_DEFINITIONS_PROXIMITE = ",\n    ".join(
+    f"{col} {'REAL' if col.startswith('distance_min_') and not col.endswith('_manquante') else 'INTEGER'}"
+    for col in COLONNES_PROXIMITE_COMPACT
+)
+
+
+SQL_SCHEMA_COMPACT = f"""
+-- ============================================
+-- SCHÉMA COMPACT DVF (réplique analytique en lecture)
+-- ============================================
+
+CREATE TABLE departements (
+    code_departement TEXT PRIMARY KEY,
+    nb_menages_2021 INTEGER,
+    revenu_median_2021 REAL,
+    taux_chomage_2023 REAL,
+    salaire_net_horaire_moyen_2022 REAL
+) WITHOUT ROWID;
+
+CREATE TABLE communes (
+    code_commune TEXT PRIMARY KEY,
+    code_departement TEXT NOT NULL,
+    nb_menages_2021 INTEGER,
+    revenu_median_2021 REAL
+) WITHOUT ROWID;
+
+-- Clé = numéro de jour : alias du rowid, pas d'index séparé
+CREATE TABLE indicateurs_economiques (
+    jour_indicateur INTEGER PRIMARY KEY,
+    credits_habitat_hors_renegociations REAL,
+    taux_hors_renegociations REAL,
+    variations_encours_mensuelles_cvs REAL,
+    ipc REAL
+);
+
+-- Dictionnaires des valeurs catégorielles
+CREATE TABLE types_local (
+    id_type_local INTEGER PRIMARY KEY,
+    type_local TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE natures_mutation (
+    id_nature INTEGER PRIMARY KEY,
+    nature_mutation TEXT NOT NULL UNIQUE
+);
+
+-- Biens + proximité (1:1)
+CREATE TABLE biens (
+    id_bien INTEGER PRIMARY KEY,
+    id_parcelle TEXT,
+    id_type_local INTEGER REFERENCES types_local(id_type_local),
+    surface_reelle_bati REAL,
+    surface_terrain REAL,
+    longitude REAL,
+    latitude REAL,
+    x_proj REAL,
+    y_proj REAL,
+    {_DEFINITIONS_PROXIMITE}
+);
+
+CREATE TABLE mutations (
+    id_mutation INTEGER PRIMARY KEY,
+    jour_mutation INTEGER NOT NULL,     -- jours depuis 1970-01-01
+    valeur_fonciere REAL,
+    valeur_fonciere_log REAL,
+    id_nature INTEGER REFERENCES natures_mutation(id_nature),
+    id_bien INTEGER NOT NULL REFERENCES biens(id_bien),
+    code_commune TEXT NOT NULL REFERENCES communes(code_commune),
+    prix_par_m2_habitable REAL,
+    prix_par_m2_terrain REAL
+);
+
+CREATE TABLE chargements (
+    id_chargement INTEGER PRIMARY KEY,
+    date_chargement TEXT NOT NULL,
+    mode TEXT,
+    source TEXT,
+    date_mutation_max DATE,
+    nb_inserees INTEGER,
+    nb_modifiees INTEGER,
+    nb_inchangees INTEGER
+);
+
+-- Agrégats : copiés de la base normalisée
+CREATE TABLE stats_commune_mois (
+    code_commune TEXT NOT NULL,
+    mois TEXT NOT NULL,
+    type_local TEXT,
+    nb_transactions INTEGER,
+    somme_valeur REAL,
+    nb_valeur INTEGER,
+    somme_prix_m2 REAL,
+    nb_prix_m2 INTEGER,
+    prix_min REAL,
+    prix_max REAL
+);
+
+CREATE TABLE stats_commune (
+    code_commune TEXT PRIMARY KEY,
+    nb_transactions INTEGER,
+    somme_valeur REAL,
+    nb_valeur INTEGER,
+    somme_prix_m2 REAL,
+    nb_prix_m2 INTEGER,
+    prix_min REAL,
+    prix_max REAL
+) WITHOUT ROWID;
+
+CREATE TABLE stats_departement (
+    code_departement TEXT PRIMARY KEY,
+    nb_transactions INTEGER,
+    somme_valeur REAL,
+    nb_valeur INTEGER,
+    somme_prix_m2 REAL,
+    nb_prix_m2 INTEGER,
+    prix_min REAL,
+    prix_max REAL
+) WITHOUT ROWID;
+
+-- ============================================
+-- VUES (mêmes noms et colonnes que le schéma normalisé)
+-- ============================================
+
+-- Ordre des jointures impose (CROSS JOIN) : parcours de mutations puis recherches par clé primaire,
+-- au lieu de partir des communes et de relire mutations par idx_mut_commune (accès aléatoires)
+CREATE VIEW vue_mutations_complete AS
+SELECT
+    m.id_mutation,
+    {date_sql("m.jour_mutation")} AS date_mutation,
+    m.valeur_fonciere,
+    m.valeur_fonciere_log,
+    n.nature_mutation,
+    m.prix_par_m2_habitable,
+    m.prix_par_m2_terrain,
+    -- Bien
+    b.id_parcelle,
+    t.type_local,
+    b.surface_reelle_bati,
+    b.surface_terrain,
+    b.longitude,
+    b.latitude,
+    -- Commune (colonne de mutations : un filtre sur code_commune utilise idx_mut_commune)
+    m.code_commune,
+    c.nb_menages_2021 AS nb_menages_commune,
+    c.revenu_median_2021 AS revenu_median_commune,
+    -- Département
+    d.code_departement,
+    d.nb_menages_2021 AS nb_menages_departement,
+    d.revenu_median_2021 AS revenu_median_departement,
+    d.taux_chomage_2023,
+    d.salaire_net_horaire_moyen_2022,
+    -- Indicateurs économiques
+    i.credits_habitat_hors_renegociations,
+    i.taux_hors_renegociations,
+    i.ipc
+FROM mutations m
+CROSS JOIN biens b ON m.id_bien = b.id_bien
+CROSS JOIN communes c ON m.code_commune = c.code_commune
+CROSS JOIN departements d ON c.code_departement = d.code_departement
+LEFT JOIN types_local t ON b.id_type_local = t.id_type_local
+LEFT JOIN natures_mutation n ON m.id_nature = n.id_nature
+LEFT JOIN indicateurs_economiques i ON m.jour_mutation = i.jour_indicateur;
+
+CREATE VIEW vue_stats_commune AS
+SELECT
+    c.code_commune,
+    c.code_departement,
+    COALESCE(s.nb_transactions, 0) AS nb_transactions,
+    s.somme_valeur / s.nb_valeur AS prix_moyen,
+    s.somme_prix_m2 / s.nb_prix_m2 AS prix_m2_moyen,
+    s.prix_min,
+    s.prix_max
+FROM communes c
+LEFT JOIN stats_commune s ON c.code_commune = s.code_commune;
+
+CREATE VIEW vue_stats_departement AS
+SELECT
+    d.code_departement,
+    d.revenu_median_2021,
+    d.taux_chomage_2023,
+    COALESCE(s.nb_transactions, 0) AS nb_transactions,
+    s.somme_valeur / s.nb_valeur AS prix_moyen,
+    s.somme_prix_m2 / s.nb_prix_m2 AS prix_m2_moyen
+FROM departements d
+LEFT JOIN stats_departement s ON d.code_departement = s.code_departement;
+
+-- Ancienne table proximite (1:1 avec biens)
+CREATE VIEW proximite AS
+SELECT id_bien, {", ".join(COLONNES_PROXIMITE_COMPACT)}
+FROM biens;
+"""
+
+
+# Index crees apres la copie. Par rapport a SQL_INDEX : idx_mut_commune couvre aussi la date (historique
+# d'une commune), plus d'index sur les cles primaires (indicateurs), sur les petites tables (revenus),
+# sur les coordonnees (R*Tree) ni sur cle_mutation (chargement incremental, base normalisee)
+SQL_INDEX_COMPACT = """
+CREATE INDEX idx_commune_dept ON communes(code_departement);
+
+CREATE INDEX idx_bien_parcelle ON biens(id_parcelle);
+CREATE INDEX idx_bien_type ON biens(id_type_local);
+CREATE INDEX idx_bien_surface ON biens(surface_reelle_bati);
+
+CREATE INDEX idx_mut_jour ON mutations(jour_mutation);
+CREATE INDEX idx_mut_valeur ON mutations(valeur_fonciere);
+CREATE INDEX idx_mut_bien ON mutations(id_bien);
+CREATE INDEX idx_mut_commune ON mutations(code_commune, jour_mutation);
+CREATE INDEX idx_mut_nature ON mutations(id_nature);
+
+CREATE INDEX idx_stats_mois_commune ON stats_commune_mois(code_commune, mois);
+"""
+
+
+def compact_database(source_db, db_path, verbose: bool = True) -> str:
+    """
+    Construit la réplique compacte d'une base DVF normalisée.
+
+    Tout passe par SQL (ATTACH de la base normalisée, INSERT ... SELECT
+    dans l'ordre des clés) ; la base compacte est recréée à chaque appel.
+
+    Parameters
+    ----------
+    source_db : str | Path
+        Base DVF normalisée (créée par create_dvf_database.py)
+    db_path : str | Path
+        Base compacte à créer (écrasée)
+    verbose : bool
+        Afficher les tailles des deux bases
+
+    Returns
+    -------
+    str
+        Chemin vers la base compacte
+    """
+    Path(db_path).unlink(missing_ok=True)
+    conn = sqlite3.connect(db_path)
+    for nom, valeur in PRAGMAS_CHARGEMENT.items():
+        conn.execute(f"PRAGMA {nom} = {valeur}")
+    conn.executescript(SQL_SCHEMA_COMPACT)
+    conn.execute("ATTACH DATABASE ? AS src", (str(source_db),))
+
+    # References et dictionnaires
+    conn.execute("INSERT INTO departements SELECT * FROM src.departements ORDER BY code_departement")
+    conn.execute("""
+        INSERT INTO communes SELECT code_commune, code_departement, nb_menages_2021, revenu_median_2021
+        FROM src.communes ORDER BY code_commune
+    """)
+    conn.execute(f"""
+        INSERT INTO indicateurs_economiques
+        SELECT {jour_sql("date_indicateur")}, credits_habitat_hors_renegociations, taux_hors_renegociations,
+               variations_encours_mensuelles_cvs, ipc
+        FROM src.indicateurs_economiques ORDER BY 1
+    """)
+    conn.execute("""
+        INSERT INTO types_local (type_local)
+        SELECT DISTINCT type_local FROM src.biens WHERE type_local IS NOT NULL ORDER BY type_local
+    """)
+    conn.execute("""
+        INSERT INTO natures_mutation (nature_mutation)
+        SELECT DISTINCT nature_mutation FROM src.mutations WHERE nature_mutation IS NOT NULL ORDER BY nature_mutation
+    """)
+
+    # Biens (+ proximite) et mutations, dans l'ordre des cles primaires : ajout en fin de B-tree
+    colonnes_proximite = ", ".join(f"p.{col}" for col in COLONNES_PROXIMITE_COMPACT)
+    conn.execute(f"""
+        INSERT INTO biens
+        SELECT b.id_bien, b.id_parcelle, t.id_type_local, b.surface_reelle_bati, b.surface_terrain,
+               b.longitude, b.latitude, b.x_proj, b.y_proj, {colonnes_proximite}
+        FROM src.biens b
+        LEFT JOIN types_local t ON b.type_local = t.type_local
+        LEFT JOIN src.proximite p ON p.id_bien = b.id_bien
+        ORDER BY b.id_bien
+    """)
+    conn.execute(f"""
+        INSERT INTO mutations
+        SELECT m.id_mutation, {jour_sql("m.date_mutation")}, m.valeur_fonciere, m.valeur_fonciere_log,
+               n.id_nature, m.id_bien, m.code_commune, m.prix_par_m2_habitable, m.prix_par_m2_terrain
+        FROM src.mutations m
+        LEFT JOIN natures_mutation n ON m.nature_mutation = n.nature_mutation
+        ORDER BY m.id_mutation
+    """)
+
+    for table in ("chargements", "stats_commune_mois", "stats_commune", "stats_departement"):
+        conn.execute(f"INSERT INTO {table} SELECT * FROM src.{table}")
+    conn.commit()
+    conn.execute("DETACH DATABASE src")
+
+    conn.executescript(SQL_INDEX_COMPACT)
+    conn.executescript(rtree_sql("biens", "id_bien", "rtree_biens"))
+    fill_rtree(conn, "biens", "id_bien", "rtree_biens")
+    conn.execute("ANALYZE")
+    conn.commit()
+    for nom, valeur in PRAGMAS_APRES_CHARGEMENT.items():
+        conn.execute(f"PRAGMA {nom} = {valeur}")
+    conn.close()
+
+    if verbose:
+        taille_source, taille = Path(source_db).stat().st_size, Path(db_path).stat().st_size
+        print(f"✓ Base compacte créée : {db_path} ({taille / 1e6:.1f} Mo, "
+              f"{taille / taille_source:.0%} de la base normalisée)")
+    return str(db_path)
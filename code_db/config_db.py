@@ -1,4 +1,5 @@
 from pathlib import Path
+import os
 import polars as pl
 
 CURRENT_DIR = Path(__file__).resolve().parent
@@ -6,6 +7,71 @@ CURRENT_DIR = Path(__file__).resolve().parent
 BASE_PATH = CURRENT_DIR.parent
 BASE_PATH_DATA = BASE_PATH / "data"
 BASE_PATH_DATA_FINAL = BASE_PATH_DATA / "DataFrameFinal" / "df_final_propre_reduit.parquet"
+BASE_PATH_DATA_FINAL_COMPLET = BASE_PATH_DATA / "DataFrameFinal" / "df_final_propre.parquet"
+
+# Dataset charge dans final_dvf_immobilier.db (BASE_PATH_DATA_FINAL_COMPLET pour le dataset national)
+SOURCE_DVF = BASE_PATH_DATA_FINAL
 
 PATH_FILE_TO_JSON_DEFERLA = BASE_PATH / "deferla" / "immo_project" / "results" / "deferla.json"
 
+
+# Chargement en masse des bases SQLite
+TAILLE_LOT_INSERTION = 50_000
+
+# PRAGMAs pendant le chargement : journal en memoire, pas de fsync, cache de ~1 Go (valeur negative = Kio)
+PRAGMAS_CHARGEMENT = {"journal_mode": "MEMORY", "synchronous": "OFF", "cache_size": -1_000_000, "temp_store": "MEMORY"}
+# Valeurs retablies a la fin du chargement
+PRAGMAS_APRES_CHARGEMENT = {"journal_mode": "DELETE", "synchronous": "FULL"}
+# Chargement incremental : WAL, les lecteurs gardent la base ouverte pendant la mise a jour
+PRAGMAS_INCREMENTAL = {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -1_000_000, "temp_store": "MEMORY"}
+
+# "complet" : base reconstruite (DROP + chargement en masse) ; "incremental" : seules les mutations
+# nouvelles ou modifiees sont ecrites (upsert_data_from_polars)
+MODE_CHARGEMENT_DVF = "complet"
+
+# Construction parallele de final_dvf_immobilier.db : un shard par departement, fusionnes a la fin
+# (NB_WORKERS_SHARDS = 1 : chargement sequentiel dans une seule base)
+NB_WORKERS_SHARDS = os.cpu_count() or 1
+PATH_DIR_SHARDS_DVF = BASE_PATH / "shards_dvf"
+
+# Referentiel INSEE compile par code_dvf/referentiel_insee.py (Arrow IPC non compresse, lu en memory-map) :
+# valeurs des tables departements / communes (le dataset DVF ne sert qu'en repli, ou si le referentiel est absent)
+PATH_DIR_REFERENTIEL_INSEE = BASE_PATH_DATA / "Referentiel"
+PATH_FICHIER_REFERENTIEL_COMMUNE = PATH_DIR_REFERENTIEL_INSEE / "insee_commune.arrow"
+PATH_FICHIER_REFERENTIEL_DEPARTEMENT = PATH_DIR_REFERENTIEL_INSEE / "insee_departement.arrow"
+PATH_DIR_CODE_DVF = BASE_PATH / "code_dvf" # lecture du referentiel avec referentiel_insee.lire_ipc_memory_map
+
+# Index spatial (R*Tree) : coordonnees projetees en Lambert-93 (metres), comme x_proj / y_proj du dataset DVF
+PROJECTION_EPSG_INITIAL = 4326
+PROJECTION_EPSG_FINAL = 2154
+RAYON_RECHERCHE_M = 500
+
+# Couche de lecture (query_db.py) : pool de connexions en lecture seule, partage entre threads
+TAILLE_POOL_LECTURE = 8
+# Fichier mappe en memoire par chaque connexion de lecture (octets)
+MMAP_SIZE_LECTURE = 1 << 30
+# Requetes preparees gardees en cache par connexion (sqlite3 cached_statements)
+NB_REQUETES_PREPAREES = 256
+# Resultats (DataFrames) caches par base, et taille maximale d'un resultat cache
+NB_RESULTATS_CACHE = 256
+NB_LIGNES_MAX_CACHE = 100_000
+# Lignes lues par fetchmany (un DataFrame par chunk)
+TAILLE_CHUNK_RESULTATS = 50_000
+
+# Banc d'essai des requetes (benchmark_db.py) : bases synthetiques, mesures, propositions d'index
+PATH_DIR_BENCHMARK = BASE_PATH / "benchmark_db"
+NB_LIGNES_BENCHMARK_DVF = 200_000
+NB_ANNONCES_BENCHMARK_DEFERLA = 20_000
+NB_REPETITIONS_BENCHMARK = 5
+GRAINE_BENCHMARK = 42
+# Index propose retenu s'il divise le temps median par au moins GAIN_MIN_INDEX
+GAIN_MIN_INDEX = 1.5
+# Colonnes max d'un index couvrant propose, et taille min d'une table pour lui proposer un index
+NB_COLONNES_MAX_INDEX = 6
+NB_LIGNES_MIN_INDEX = 1_000
+
+# Schema de la base DVF : "normalise" (base de chargement seule) ou "compact" (en plus, replique analytique
+# compacte construite apres chaque chargement par compact_db.py : dates en numero de jour, dictionnaires,
+# proximite integree a biens)
+SCHEMA_DVF = "normalise"
+PATH_DB_DVF_COMPACT = BASE_PATH / "final_dvf_immobilier_compact.db"
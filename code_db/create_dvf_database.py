@@ -1,12 +1,24 @@
-import polars as pl
-from dvf_database import create_database, insert_data_from_polars, print_database_stats
+from dvf_database import create_database, create_database_parallel, insert_data_from_polars, upsert_data_from_polars
+from dvf_database import print_database_stats
+from compact_db import compact_database
 from config_db import *
 
-# 1. Créer la structure
-create_database(BASE_PATH / "final_dvf_immobilier.db")
+if __name__ == "__main__":
+    if MODE_CHARGEMENT_DVF == "incremental":
+        # Mise à jour : seules les mutations nouvelles ou modifiées sont écrites
+        upsert_data_from_polars(SOURCE_DVF, BASE_PATH / "final_dvf_immobilier.db")
+    elif NB_WORKERS_SHARDS > 1:
+        # 1-2. Shards par département construits en parallèle, puis fusionnés
+        create_database_parallel(SOURCE_DVF, BASE_PATH / "final_dvf_immobilier.db", NB_WORKERS_SHARDS)
+    else:
+        # 1. Créer la structure
+        create_database(BASE_PATH / "final_dvf_immobilier.db")
 
-# 2. Insérer les données
-df = pl.read_parquet(BASE_PATH_DATA_FINAL)
-insert_data_from_polars(df, BASE_PATH / "final_dvf_immobilier.db")
-# 3. Explorer
-print_database_stats(BASE_PATH / "final_dvf_immobilier.db")
\ No newline at end of file
+        # 2. Insérer les données (Parquet lu par lots, index créés à la fin)
+        insert_data_from_polars(SOURCE_DVF, BASE_PATH / "final_dvf_immobilier.db")
+    # 3. Explorer
+    print_database_stats(BASE_PATH / "final_dvf_immobilier.db")
+
+    # 4. Réplique analytique compacte (reconstruite à chaque chargement)
+    if SCHEMA_DVF == "compact":
+        compact_database(BASE_PATH / "final_dvf_immobilier.db", PATH_DB_DVF_COMPACT)
\ No newline at end of file
@@ -18,6 +18,10 @@ import sqlite3
 import json
 from pathlib import Path
 
+from config_db import RAYON_RECHERCHE_M
+from query_db import read_connection, fetch_rows, fetch_df
+from spatial_db import rtree_sql, fill_rtree, project_lon_lat, RTREE_BBOX, distance2_sql, radius_params, with_distance
+
 
 # SCHÉMA SQL
 
@@ -28,6 +32,7 @@ SQL_SCHEMA = """
 -- ============================================
 
 -- Suppression des tables existantes (dans l'ordre des dépendances)
+DROP TABLE IF EXISTS rtree_annonces;
 DROP TABLE IF EXISTS images;
 DROP TABLE IF EXISTS diagnostics;
 DROP TABLE IF EXISTS annonces;
@@ -53,6 +58,8 @@ CREATE TABLE annonces (
     code_postal TEXT,
     latitude REAL,
     longitude REAL,
+    x_proj REAL,
+    y_proj REAL,
     etat TEXT CHECK(etat IN ('Neuf', 'Excellent état', 'Bon état', 'À rafraîchir', 'À rénover', NULL)),
     salle_de_bain INTEGER,
     chauffage_type TEXT,
@@ -190,6 +197,10 @@ GROUP BY d.dpe_lettre
 ORDER BY d.dpe_lettre;
 """
 
+# Index spatial R*Tree des annonces (x_proj / y_proj, Lambert-93) tenu a jour par triggers.
+# Identifiant = rowid de annonces (id est un TEXT) : apres un VACUUM, reconstruire avec rebuild_spatial_index
+SQL_SCHEMA += rtree_sql("annonces", "rowid", "rtree_annonces")
+
 
 
 # DATABASE CREATION
@@ -241,10 +252,15 @@ def insert_data_from_json(json_path: str, db_path: str = "deferla.db"):
     
     # Activer les foreign keys
     cursor.execute("PRAGMA foreign_keys = ON;")
+    # INSERT OR REPLACE declenche alors le trigger de suppression du R*Tree pour l'ancienne ligne
+    cursor.execute("PRAGMA recursive_triggers = ON;")
     
     print(f"Insertion de {len(data)} annonces...")
     
-    for item in data:
+    # Coordonnees projetees de toutes les annonces en une fois (vectorise)
+    xs, ys = project_lon_lat([item.get("longitude") for item in data], [item.get("latitude") for item in data])
+    
+    for item, x_proj, y_proj in zip(data, xs.tolist(), ys.tolist()):
         # Convertir charges_annuelles en float si présent
         charges = None
         if item.get("charges_annuelles"):
@@ -271,9 +287,9 @@ def insert_data_from_json(json_path: str, db_path: str = "deferla.db"):
             INSERT OR REPLACE INTO annonces 
             (id, url, date_publication, type, titre, prix, honoraires,
              surface, pieces, chambres, etage, ascenseur, ville, code_postal,
-             latitude, longitude, etat, salle_de_bain, chauffage_type,
+             latitude, longitude, x_proj, y_proj, etat, salle_de_bain, chauffage_type,
              chauffe_eau, exposition, charges_annuelles, description, image_principale)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (
             item["id"],
             item["url"],
@@ -291,6 +307,8 @@ def insert_data_from_json(json_path: str, db_path: str = "deferla.db"):
             item["code_postal"],
             item["latitude"],
             item["longitude"],
+            x_proj if x_proj == x_proj else None, # NaN -> NULL (pas de coordonnees)
+            y_proj if y_proj == y_proj else None,
             item["etat"],
             item["salle_de_bain"],
             item["chauffage_type"],
@@ -346,27 +364,27 @@ def get_database_info(db_path: str = "deferla.db") -> dict:
     """
     Retourne les informations sur la structure de la base de données.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    info = {"tables": {}, "views": []}
-    
-    # Tables
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
-    tables = [row[0] for row in cursor.fetchall()]
-    
-    for table in tables:
-        cursor.execute(f"PRAGMA table_info({table})")
-        columns = [(row[1], row[2]) for row in cursor.fetchall()]
-        cursor.execute(f"SELECT COUNT(*) FROM {table}")
-        count = cursor.fetchone()[0]
-        info["tables"][table] = {"columns": columns, "count": count}
-    
-    # Vues
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='view' ORDER BY name")
-    info["views"] = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
+    # Connexion en lecture seule du pool (query_db.py)
+    with read_connection(db_path) as conn:
+        cursor = conn.cursor()
+        
+        info = {"tables": {}, "views": []}
+        
+        # Tables
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+        tables = [row[0] for row in cursor.fetchall()]
+        
+        for table in tables:
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [(row[1], row[2]) for row in cursor.fetchall()]
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            count = cursor.fetchone()[0]
+            info["tables"][table] = {"columns": columns, "count": count}
+        
+        # Vues
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='view' ORDER BY name")
+        info["views"] = [row[0] for row in cursor.fetchall()]
+        cursor.close()
     return info
 
 
@@ -395,16 +413,10 @@ def explore_table(db_path: str, table_name: str, limit: int = 5):
     """
     Affiche un aperçu d'une table.
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [row[1] for row in cursor.fetchall()]
-    
-    cursor.execute(f"SELECT * FROM {table_name} LIMIT {limit}")
-    rows = cursor.fetchall()
-    
-    conn.close()
+    # Nom de table entre guillemets (identifiant), limite liee en parametre
+    _, table_info = fetch_rows(db_path, f'PRAGMA table_info("{table_name}")')
+    columns = [row[1] for row in table_info]
+    _, rows = fetch_rows(db_path, f'SELECT * FROM "{table_name}" LIMIT ?', [limit])
     
     print(f"\nTable: {table_name}")
     print(f"Colonnes: {', '.join(columns)}")
@@ -413,35 +425,65 @@ def explore_table(db_path: str, table_name: str, limit: int = 5):
         print(f"  {row}")
 
 
-def run_query(db_path: str, query: str):
+def run_query(db_path: str, query: str, params=None):
     """
-    Exécute une requête SQL et retourne les résultats.
+    Exécute une requête SQL (paramètres ? ou :nom, liés par SQLite)
+    et retourne les résultats : (colonnes, résultats).
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(query)
-    results = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description] if cursor.description else []
-    conn.close()
-    return columns, results
+    return fetch_rows(db_path, query, params)
 
 
-# QUERIES EXAMPLE
+def run_query_df(db_path: str, query: str, params=None, cache: bool = True):
+    """
+    Exécute une requête SQL et retourne le résultat en DataFrame Polars
+    (connexion du pool, résultat mis en cache tant que la base ne change pas).
+    """
+    return fetch_df(db_path, query, params, cache)
 
-def run_example_queries(db_path: str = "deferla.db"):
+
+def rebuild_spatial_index(db_path: str = "deferla.db"):
     """
-    Exécute des exemples de requêtes sur la base de données.
+    Reconstruit le R*Tree des annonces à partir de x_proj / y_proj
+    (base créée avant l'index spatial, ou après un VACUUM qui renumérote les rowid).
     """
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    print("\n" + "="*60)
-    print("EXEMPLES DE REQUÊTES")
-    print("="*60)
+    conn.executescript(rtree_sql("annonces", "rowid", "rtree_annonces"))
+    fill_rtree(conn, "annonces", "rowid", "rtree_annonces")
+    conn.commit()
+    conn.close()
+
+
+def find_listings_within_radius(db_path: str, latitude: float, longitude: float, radius_m: float = RAYON_RECHERCHE_M,
+                                limit: int = None):
+    """
+    Annonces situées à moins de radius_m mètres d'un point, de la plus proche
+    à la plus éloignée (préfiltre R*Tree puis distance exacte en Lambert-93).
     
+    Returns
+    -------
+    tuple
+        (colonnes, résultats), dernière colonne : distance_m
+    """
+    params = radius_params(latitude, longitude, radius_m)
+    columns, results = fetch_rows(db_path, f"""
+        SELECT 
+            a.id, a.type, a.prix, a.surface, a.pieces, a.ville, a.code_postal, a.latitude, a.longitude,
+            {distance2_sql("a")} AS distance2
+        FROM rtree_annonces r
+        JOIN annonces a ON a.rowid = r.id
+        WHERE {RTREE_BBOX} AND {distance2_sql("a")} <= :rayon2
+        ORDER BY distance2
+        {"LIMIT :limit" if limit is not None else ""}
+    """, params | {"limit": limit})
+    return with_distance(columns, results)
+
+
+# QUERIES EXAMPLE
+
+# Requetes d'exemple (nom, titre, SQL) : affichees par run_example_queries, mesurees par benchmark_db.py
+EXAMPLE_QUERIES = [
     # Exemple 1: Prix moyen par type de bien
-    print("\n1. Prix moyen par type de bien:")
-    cursor.execute("""
+    ("prix_par_type", "Prix moyen par type de bien", """
         SELECT 
             type, 
             COUNT(*) AS nb_annonces,
@@ -451,13 +493,9 @@ def run_example_queries(db_path: str = "deferla.db"):
         WHERE surface > 0
         GROUP BY type
         ORDER BY nb_annonces DESC
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
-    
+    """),
     # Exemple 2: Top 5 villes les plus chères
-    print("\n2. Top 5 villes les plus chères (prix/m2):")
-    cursor.execute("""
+    ("top_villes", "Top 5 villes les plus chères (prix/m2)", """
         SELECT 
             ville,
             COUNT(*) AS nb_annonces,
@@ -468,13 +506,9 @@ def run_example_queries(db_path: str = "deferla.db"):
         HAVING nb_annonces >= 3
         ORDER BY prix_m2_moyen DESC
         LIMIT 5
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
-    
+    """),
     # Exemple 3: Répartition par DPE
-    print("\n3. Répartition par classe DPE:")
-    cursor.execute("""
+    ("repartition_dpe", "Répartition par classe DPE", """
         SELECT 
             d.dpe_lettre,
             COUNT(*) AS nb_annonces,
@@ -485,13 +519,9 @@ def run_example_queries(db_path: str = "deferla.db"):
           AND d.dpe_lettre NOT IN ('Not applicable', 'In progress')
         GROUP BY d.dpe_lettre
         ORDER BY d.dpe_lettre
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
-    
+    """),
     # Exemple 4: Annonces avec ascenseur vs sans
-    print("\n4. Comparaison ascenseur vs sans ascenseur:")
-    cursor.execute("""
+    ("ascenseur", "Comparaison ascenseur vs sans ascenseur", """
         SELECT 
             CASE WHEN ascenseur = 1 THEN 'Avec ascenseur' ELSE 'Sans ascenseur' END AS type_immeuble,
             COUNT(*) AS nb_annonces,
@@ -500,13 +530,9 @@ def run_example_queries(db_path: str = "deferla.db"):
         FROM annonces
         WHERE surface > 0 AND type = 'Appartement'
         GROUP BY ascenseur
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
-    
+    """),
     # Exemple 5: Evolution par mois
-    print("\n5. Evolution du nombre d'annonces par mois:")
-    cursor.execute("""
+    ("evolution_mensuelle", "Evolution du nombre d'annonces par mois", """
         SELECT 
             strftime('%Y-%m', date_publication) AS mois,
             COUNT(*) AS nb_annonces,
@@ -515,8 +541,21 @@ def run_example_queries(db_path: str = "deferla.db"):
         GROUP BY mois
         ORDER BY mois DESC
         LIMIT 6
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
+    """),
+]
+
+
+def run_example_queries(db_path: str = "deferla.db"):
+    """
+    Exécute des exemples de requêtes sur la base de données.
+    """
+    print("\n" + "="*60)
+    print("EXEMPLES DE REQUÊTES")
+    print("="*60)
     
-    conn.close()
+    # Connexion en lecture seule du pool (query_db.py)
+    with read_connection(db_path) as conn:
+        for num, (_, titre, sql) in enumerate(EXAMPLE_QUERIES, start=1):
+            print(f"\n{num}. {titre}:")
+            for row in conn.execute(sql).fetchall():
+                print(f"   {row}")
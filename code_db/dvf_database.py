@@ -16,33 +16,69 @@ SCHEMA :
 
 """
 
+import json
+import os
+import re
 import sqlite3
+import sys
 from pathlib import Path
 
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+from config_db import TAILLE_LOT_INSERTION, PRAGMAS_CHARGEMENT, PRAGMAS_APRES_CHARGEMENT, PRAGMAS_INCREMENTAL
+from config_db import NB_WORKERS_SHARDS, PATH_DIR_SHARDS_DVF, RAYON_RECHERCHE_M
+from config_db import PATH_FICHIER_REFERENTIEL_COMMUNE, PATH_FICHIER_REFERENTIEL_DEPARTEMENT, PATH_DIR_CODE_DVF
+from query_db import read_connection, fetch_rows, fetch_df
+from spatial_db import rtree_sql, rtree_trigger_names, fill_rtree, RTREE_BBOX, distance2_sql, radius_params, with_distance
 
-# SQL SCHEMA
+# Lecture du referentiel INSEE : meme fonction que le pipeline (code_dvf/referentiel_insee.py).
+# Les modules de code_dvf changent de repertoire courant a l'import : on le restaure (chemins relatifs de l'appelant)
+sys.path.append(str(PATH_DIR_CODE_DVF))
+_repertoire_courant = os.getcwd()
+try:
+    from referentiel_insee import lire_ipc_memory_map
+finally:
+    os.chdir(_repertoire_courant)
 
 
-SQL_SCHEMA = """
--- ============================================
--- SCHÉMA RELATIONNEL DVF (Demandes de Valeurs Foncières)
--- Base de données SQLite
--- ============================================
 
--- Suppression des tables existantes (dans l'ordre des dépendances)
+# SQL SCHEMA
+
+
+# Suppression des tables existantes (dans l'ordre des dépendances) : uniquement pour une reconstruction complète
+SQL_DROP = """
+DROP VIEW IF EXISTS vue_stats_departement;
+DROP VIEW IF EXISTS vue_stats_commune;
+DROP VIEW IF EXISTS vue_mutations_complete;
+DROP TABLE IF EXISTS stats_departement;
+DROP TABLE IF EXISTS stats_commune;
+DROP TABLE IF EXISTS stats_commune_mois;
+DROP TABLE IF EXISTS chargements;
+DROP TABLE IF EXISTS rtree_biens;
 DROP TABLE IF EXISTS mutations;
 DROP TABLE IF EXISTS proximite;
 DROP TABLE IF EXISTS biens;
 DROP TABLE IF EXISTS indicateurs_economiques;
 DROP TABLE IF EXISTS communes;
 DROP TABLE IF EXISTS departements;
+"""
+
+
+SQL_SCHEMA = """
+-- ============================================
+-- SCHÉMA RELATIONNEL DVF (Demandes de Valeurs Foncières)
+-- Base de données SQLite
+-- (idempotent : IF NOT EXISTS, une base existante n'est pas modifiée)
+-- ============================================
 
 -- ============================================
 -- TABLE: departements
 -- Données socio-économiques par département
 -- ============================================
-CREATE TABLE departements (
+CREATE TABLE IF NOT EXISTS departements (
     code_departement TEXT PRIMARY KEY,
     nb_menages_2021 INTEGER,
     revenu_median_2021 REAL,
@@ -50,13 +86,11 @@ CREATE TABLE departements (
     salaire_net_horaire_moyen_2022 REAL
 );
 
-CREATE INDEX idx_dept_revenu ON departements(revenu_median_2021);
-
 -- ============================================
 -- TABLE: communes
 -- Données démographiques par commune
 -- ============================================
-CREATE TABLE communes (
+CREATE TABLE IF NOT EXISTS communes (
     code_commune TEXT PRIMARY KEY,
     code_departement TEXT NOT NULL,
     nb_menages_2021 INTEGER,
@@ -64,14 +98,11 @@ CREATE TABLE communes (
     FOREIGN KEY (code_departement) REFERENCES departements(code_departement)
 );
 
-CREATE INDEX idx_commune_dept ON communes(code_departement);
-CREATE INDEX idx_commune_revenu ON communes(revenu_median_2021);
-
 -- ============================================
 -- TABLE: indicateurs_economiques
 -- Données macroéconomiques temporelles
 -- ============================================
-CREATE TABLE indicateurs_economiques (
+CREATE TABLE IF NOT EXISTS indicateurs_economiques (
     date_indicateur DATE PRIMARY KEY,
     credits_habitat_hors_renegociations REAL,
     taux_hors_renegociations REAL,
@@ -79,13 +110,11 @@ CREATE TABLE indicateurs_economiques (
     ipc REAL
 );
 
-CREATE INDEX idx_indic_date ON indicateurs_economiques(date_indicateur);
-
 -- ============================================
 -- TABLE: biens
 -- Caractéristiques physiques des biens immobiliers
 -- ============================================
-CREATE TABLE biens (
+CREATE TABLE IF NOT EXISTS biens (
     id_bien INTEGER PRIMARY KEY AUTOINCREMENT,
     id_parcelle TEXT,
     type_local TEXT CHECK(type_local IN ('Maison', 'Appartement', 'Dépendance', 'Local industriel. commercial ou assimilé')),
@@ -99,16 +128,11 @@ CREATE TABLE biens (
     type_local__Appartement INTEGER DEFAULT 0
 );
 
-CREATE INDEX idx_bien_parcelle ON biens(id_parcelle);
-CREATE INDEX idx_bien_type ON biens(type_local);
-CREATE INDEX idx_bien_surface ON biens(surface_reelle_bati);
-CREATE INDEX idx_bien_coords ON biens(longitude, latitude);
-
 -- ============================================
 -- TABLE: proximite
 -- Indicateurs de proximité aux services/infrastructures
 -- ============================================
-CREATE TABLE proximite (
+CREATE TABLE IF NOT EXISTS proximite (
     id_proximite INTEGER PRIMARY KEY AUTOINCREMENT,
     id_bien INTEGER NOT NULL,
     -- Gares
@@ -150,13 +174,11 @@ CREATE TABLE proximite (
     FOREIGN KEY (id_bien) REFERENCES biens(id_bien)
 );
 
-CREATE INDEX idx_prox_bien ON proximite(id_bien);
-
 -- ============================================
 -- TABLE: mutations
 -- Transactions immobilières (table principale)
 -- ============================================
-CREATE TABLE mutations (
+CREATE TABLE IF NOT EXISTS mutations (
     id_mutation INTEGER PRIMARY KEY AUTOINCREMENT,
     date_mutation DATE NOT NULL,
     valeur_fonciere REAL,
@@ -166,23 +188,77 @@ CREATE TABLE mutations (
     code_commune TEXT NOT NULL,
     prix_par_m2_habitable REAL,
     prix_par_m2_terrain REAL,
+    -- Clé naturelle (identifiant DVF + date) et empreinte du contenu : chargement incrémental
+    cle_mutation TEXT,
+    empreinte INTEGER,
     FOREIGN KEY (id_bien) REFERENCES biens(id_bien),
     FOREIGN KEY (code_commune) REFERENCES communes(code_commune),
     FOREIGN KEY (date_mutation) REFERENCES indicateurs_economiques(date_indicateur)
 );
 
-CREATE INDEX idx_mut_date ON mutations(date_mutation);
-CREATE INDEX idx_mut_valeur ON mutations(valeur_fonciere);
-CREATE INDEX idx_mut_bien ON mutations(id_bien);
-CREATE INDEX idx_mut_commune ON mutations(code_commune);
-CREATE INDEX idx_mut_nature ON mutations(nature_mutation);
+-- ============================================
+-- TABLE: chargements
+-- Historique des chargements (watermark : dernière date de mutation chargée)
+-- ============================================
+CREATE TABLE IF NOT EXISTS chargements (
+    id_chargement INTEGER PRIMARY KEY AUTOINCREMENT,
+    date_chargement TEXT NOT NULL,
+    mode TEXT CHECK(mode IN ('complet', 'incremental')),
+    source TEXT,
+    date_mutation_max DATE,
+    nb_inserees INTEGER,
+    nb_modifiees INTEGER,
+    nb_inchangees INTEGER
+);
+
+-- ============================================
+-- TABLES D'AGRÉGATS MATÉRIALISÉES
+-- Sommes et effectifs (les moyennes se recombinent), calculées au chargement
+-- et recalculées uniquement pour les communes touchées (refresh_stats)
+-- ============================================
+CREATE TABLE IF NOT EXISTS stats_commune_mois (
+    code_commune TEXT NOT NULL,
+    mois TEXT NOT NULL,                 -- 'AAAA-MM'
+    type_local TEXT,
+    nb_transactions INTEGER,
+    somme_valeur REAL,
+    nb_valeur INTEGER,
+    somme_prix_m2 REAL,
+    nb_prix_m2 INTEGER,
+    prix_min REAL,
+    prix_max REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_stats_mois_commune ON stats_commune_mois(code_commune, mois);
+
+CREATE TABLE IF NOT EXISTS stats_commune (
+    code_commune TEXT PRIMARY KEY,
+    nb_transactions INTEGER,
+    somme_valeur REAL,
+    nb_valeur INTEGER,
+    somme_prix_m2 REAL,
+    nb_prix_m2 INTEGER,
+    prix_min REAL,
+    prix_max REAL
+);
+
+CREATE TABLE IF NOT EXISTS stats_departement (
+    code_departement TEXT PRIMARY KEY,
+    nb_transactions INTEGER,
+    somme_valeur REAL,
+    nb_valeur INTEGER,
+    somme_prix_m2 REAL,
+    nb_prix_m2 INTEGER,
+    prix_min REAL,
+    prix_max REAL
+);
 
 -- ============================================
 -- VUES UTILES
 -- ============================================
 
 -- Vue complète des mutations avec toutes les informations jointes
-CREATE VIEW vue_mutations_complete AS
+CREATE VIEW IF NOT EXISTS vue_mutations_complete AS
 SELECT 
     m.id_mutation,
     m.date_mutation,
@@ -218,47 +294,77 @@ JOIN communes c ON m.code_commune = c.code_commune
 JOIN departements d ON c.code_departement = d.code_departement
 LEFT JOIN indicateurs_economiques i ON m.date_mutation = i.date_indicateur;
 
--- Vue des statistiques par commune
-CREATE VIEW vue_stats_commune AS
+-- Vue des statistiques par commune (façade sur la table matérialisée stats_commune)
+CREATE VIEW IF NOT EXISTS vue_stats_commune AS
 SELECT 
     c.code_commune,
     c.code_departement,
-    COUNT(m.id_mutation) AS nb_transactions,
-    AVG(m.valeur_fonciere) AS prix_moyen,
-    AVG(m.prix_par_m2_habitable) AS prix_m2_moyen,
-    MIN(m.valeur_fonciere) AS prix_min,
-    MAX(m.valeur_fonciere) AS prix_max
+    COALESCE(s.nb_transactions, 0) AS nb_transactions,
+    s.somme_valeur / s.nb_valeur AS prix_moyen,
+    s.somme_prix_m2 / s.nb_prix_m2 AS prix_m2_moyen,
+    s.prix_min,
+    s.prix_max
 FROM communes c
-LEFT JOIN mutations m ON c.code_commune = m.code_commune
-GROUP BY c.code_commune, c.code_departement;
+LEFT JOIN stats_commune s ON c.code_commune = s.code_commune;
 
--- Vue des statistiques par département
-CREATE VIEW vue_stats_departement AS
+-- Vue des statistiques par département (façade sur la table matérialisée stats_departement)
+CREATE VIEW IF NOT EXISTS vue_stats_departement AS
 SELECT 
     d.code_departement,
     d.revenu_median_2021,
     d.taux_chomage_2023,
-    COUNT(m.id_mutation) AS nb_transactions,
-    AVG(m.valeur_fonciere) AS prix_moyen,
-    AVG(m.prix_par_m2_habitable) AS prix_m2_moyen
+    COALESCE(s.nb_transactions, 0) AS nb_transactions,
+    s.somme_valeur / s.nb_valeur AS prix_moyen,
+    s.somme_prix_m2 / s.nb_prix_m2 AS prix_m2_moyen
 FROM departements d
-LEFT JOIN communes c ON d.code_departement = c.code_departement
-LEFT JOIN mutations m ON c.code_commune = m.code_commune
-GROUP BY d.code_departement;
+LEFT JOIN stats_departement s ON d.code_departement = s.code_departement;
+"""
+
+
+# Index crees APRES le chargement des donnees (insert_data_from_polars) : maintenir les B-tree a chaque INSERT
+# coute bien plus cher que de les construire une fois sur les tables remplies
+SQL_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_dept_revenu ON departements(revenu_median_2021);
+
+CREATE INDEX IF NOT EXISTS idx_commune_dept ON communes(code_departement);
+CREATE INDEX IF NOT EXISTS idx_commune_revenu ON communes(revenu_median_2021);
+
+CREATE INDEX IF NOT EXISTS idx_indic_date ON indicateurs_economiques(date_indicateur);
+
+CREATE INDEX IF NOT EXISTS idx_bien_parcelle ON biens(id_parcelle);
+CREATE INDEX IF NOT EXISTS idx_bien_type ON biens(type_local);
+CREATE INDEX IF NOT EXISTS idx_bien_surface ON biens(surface_reelle_bati);
+CREATE INDEX IF NOT EXISTS idx_bien_coords ON biens(longitude, latitude);
+
+CREATE INDEX IF NOT EXISTS idx_prox_bien ON proximite(id_bien);
+
+CREATE INDEX IF NOT EXISTS idx_mut_date ON mutations(date_mutation);
+CREATE INDEX IF NOT EXISTS idx_mut_valeur ON mutations(valeur_fonciere);
+CREATE INDEX IF NOT EXISTS idx_mut_bien ON mutations(id_bien);
+CREATE INDEX IF NOT EXISTS idx_mut_commune ON mutations(code_commune);
+CREATE INDEX IF NOT EXISTS idx_mut_nature ON mutations(nature_mutation);
+CREATE INDEX IF NOT EXISTS idx_mut_cle ON mutations(cle_mutation);
 """
 
 
+# Index spatial R*Tree des biens (x_proj / y_proj en metres) et ses triggers : cree avec les index,
+# rempli en une passe apres un chargement en masse (fill_rtree), puis tenu a jour par les triggers
+SQL_RTREE = rtree_sql("biens", "id_bien", "rtree_biens")
+
+
 # DATABASE CREATION
 
-def create_database(db_path: str = "dvf_immobilier.db") -> str:
+def create_database(db_path: str = "dvf_immobilier.db", reset: bool = True, verbose: bool = True) -> str:
     """
     Crée la base de données SQLite avec le schéma défini.
     
     Cette fonction :
-    1. Crée un fichier SQLite (ou le remplace s'il existe)
+    1. Crée un fichier SQLite (ou vide la base existante si reset=True)
     2. Exécute le schéma SQL pour créer toutes les tables
-    3. Crée les index pour optimiser les requêtes
-    4. Crée les vues pour faciliter l'exploration
+    3. Crée les vues pour faciliter l'exploration
+    
+    Les index (SQL_INDEX) sont créés par insert_data_from_polars, une fois
+    les données chargées (ou par create_indexes).
     
     Parameters
     ----------
@@ -266,6 +372,10 @@ def create_database(db_path: str = "dvf_immobilier.db") -> str:
         Chemin vers le fichier de base de données à créer
         Exemple: "dvf_immobilier.db" ou "/chemin/vers/ma_base.db"
         
+    reset : bool
+        Supprimer les tables existantes (SQL_DROP). False : les tables existantes
+        et leurs données sont conservées (chargement incrémental, upsert_data_from_polars)
+        
     Returns
     -------
     str
@@ -282,258 +392,824 @@ def create_database(db_path: str = "dvf_immobilier.db") -> str:
     cursor = conn.cursor()
     
     # Exécution du schéma SQL complet
+    if reset:
+        cursor.executescript(SQL_DROP)
     cursor.executescript(SQL_SCHEMA)
     
     # Sauvegarde et fermeture
     conn.commit()
     conn.close()
     
-    print(f"✓ Base de données créée : {db_path}")
+    if verbose:
+        print(f"✓ Base de données créée : {db_path}")
     return db_path
 
 
 
 # DATA ADD FROM POLARS
 
-def insert_data_from_polars(df, db_path: str = "dvf_immobilier.db", batch_size: int = 10000):
+# Correspondance colonne de la table <- colonne du dataset DVF (ordre des colonnes des INSERT)
+COLONNES_DEPARTEMENTS = {
+    "code_departement": "code_departement",
+    "nb_menages_2021": "nb_menages_2021_departement",
+    "revenu_median_2021": "revenu_median_2021_departement",
+    "taux_chomage_2023": "taux_chomage_2023_departement",
+    "salaire_net_horaire_moyen_2022": "salaire_net_horaire_moyen_2022_departement",
+}
+
+COLONNES_COMMUNES = {
+    "code_commune": "code_commune",
+    "code_departement": "code_departement",
+    "nb_menages_2021": "nb_menages_2021_commune",
+    "revenu_median_2021": "revenu_median_2021_commune",
+}
+
+# Tables de reference lues dans le referentiel INSEE compile : colonne du dataset -> colonnes du referentiel,
+# par ordre de priorite (nb_menages_estime : correction manuelle des arrondissements). Repli : valeur du dataset
+REFERENTIELS_INSEE = {
+    "departements": (PATH_FICHIER_REFERENTIEL_DEPARTEMENT, {
+        "nb_menages_2021_departement": ["nb_menages_2021_departement"],
+        "revenu_median_2021_departement": ["revenu_median_2021_departement"],
+        "taux_chomage_2023_departement": ["taux_chomage_2023_departement"],
+        "salaire_net_horaire_moyen_2022_departement": ["salaire_net_horaire_moyen_2022_departement"],
+    }),
+    "communes": (PATH_FICHIER_REFERENTIEL_COMMUNE, {
+        "nb_menages_2021_commune": ["nb_menages_2021_commune", "nb_menages_estime"],
+        "revenu_median_2021_commune": ["revenu_median_2021_commune"],
+    }),
+}
+
+COLONNES_INDICATEURS = {
+    "date_indicateur": "date_mutation",
+    "credits_habitat_hors_renegociations": "Crédits à l'habitat hors renégociations",
+    "taux_hors_renegociations": "Taux hors renégociations",
+    "variations_encours_mensuelles_cvs": "Variations d'encours mensuelles cvs",
+    "ipc": "IPC",
+}
+
+COLONNES_BIENS = {col: col for col in [
+    "id_bien", "id_parcelle", "type_local", "surface_reelle_bati", "surface_terrain",
+    "longitude", "latitude", "x_proj", "y_proj", "type_local__Maison", "type_local__Appartement",
+]}
+
+POI_PROXIMITE = ["gares", "commerces", "education", "espaces_verts", "sante",
+                 "pharmacies", "aeroports", "routes_principales", "industries"]
+
+COLONNES_PROXIMITE = {"id_bien": "id_bien"} | {
+    col: col for poi in POI_PROXIMITE
+    for col in (f"nb_{poi}", f"distance_min_{poi}", f"distance_min_{poi}_manquante")
+}
+
+COLONNES_MUTATIONS = {col: col for col in [
+    "date_mutation", "valeur_fonciere", "valeur_fonciere_log", "nature_mutation",
+    "id_bien", "code_commune", "prix_par_m2_habitable", "prix_par_m2_terrain",
+    "cle_mutation", "empreinte",
+]}
+
+# Colonnes du dataset couvertes par l'empreinte d'une mutation (tout ce qui est charge pour elle)
+COLONNES_CONTENU = list(dict.fromkeys(
+    col for correspondance in (COLONNES_BIENS, COLONNES_PROXIMITE, COLONNES_MUTATIONS)
+    for col in correspondance.values() if col not in ("id_bien", "cle_mutation", "empreinte")
+))
+
+NOMS_INDEX = re.findall(r"CREATE INDEX IF NOT EXISTS (\w+)", SQL_INDEX)
+NOMS_TRIGGERS = rtree_trigger_names("rtree_biens")
+
+
+def _sql_insert(table: str, colonnes, mode: str = "INSERT") -> str:
+    return f"{mode} INTO {table} ({', '.join(colonnes)}) VALUES ({', '.join('?' * len(colonnes))})"
+
+
+def _lignes(df, correspondance: dict):
+    # Tuples dans l'ordre des colonnes de la table, sans passer par des dictionnaires Python
+    # (dates en texte ISO 'AAAA-MM-JJ', comme dans le reste de la base)
+    return (df.select([pl.col(source).alias(cible) for cible, source in correspondance.items()])
+              .with_columns(pl.col(pl.Date).cast(pl.Utf8))
+              .iter_rows())
+
+
+def _source_lazy(source):
+    # DataFrame Polars ou chemin d'un Parquet (lu en streaming)
+    return source.lazy() if isinstance(source, pl.DataFrame) else pl.scan_parquet(source)
+
+
+def _colonnes_lot(source) -> list:
+    # Colonnes du dataset lues pour les biens / proximites / mutations (+ id_mutation DVF s'il existe)
+    colonnes_source = _source_lazy(source).collect_schema().names()
+    return COLONNES_CONTENU + (["id_mutation"] if "id_mutation" in colonnes_source else [])
+
+
+def _lire_referentiel(chemin):
+    # Lecture zero-copie du fichier Arrow IPC compile (None s'il n'a pas encore ete compile)
+    if not Path(chemin).exists():
+        return None
+    return lire_ipc_memory_map(chemin)
+
+
+def _table_reference(lf, table: str, correspondance: dict, cle: str, keep: str):
+    # Une ligne par cle presente dans le dataset ; valeurs INSEE lues dans le referentiel compile si disponible
+    ref_df = (lf.select(list(correspondance.values()))
+                .drop_nulls(subset=[cle])
+                .unique(subset=[cle], keep=keep)
+                .collect())
+    if table not in REFERENTIELS_INSEE:
+        return ref_df
+    chemin, colonnes = REFERENTIELS_INSEE[table]
+    referentiel = _lire_referentiel(chemin)
+    if referentiel is None:
+        return ref_df
+
+    sources = list(dict.fromkeys(src for srcs in colonnes.values() for src in srcs))
+    referentiel = referentiel.select([cle] + sources).rename({src: f"{src}_insee" for src in sources})
+    return (ref_df.join(referentiel, on=cle, how="left", maintain_order="left")
+                  .with_columns([pl.coalesce([pl.col(f"{src}_insee") for src in srcs] + [pl.col(col)])
+                                   .cast(ref_df.schema[col], strict=False).alias(col)
+                                 for col, srcs in colonnes.items()])
+                  .select(ref_df.columns))
+
+
+# Empreinte : combinaison colonne par colonne (h = melange(h * BASE + valeur)) en arithmetique 64 bits numpy :
+#   - colonnes numeriques / dates : bits du float64 (null -> NaN)
+#   - colonnes texte : polynome 64 bits des octets UTF-8, calcule (vectorise) une fois par valeur distincte
+# Vectorise sur tout le lot, et stable (ne depend ni de la version de Polars ni du processus)
+BASE_EMPREINTE = np.uint64(0x100000001B3)
+EMPREINTE_NULL = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _melanger(h):
+    # Melange final splitmix64 (tableaux uint64)
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _hacher_textes(textes: pl.Series) -> np.ndarray:
+    # Polynome 64 bits des octets UTF-8 de chaque texte (sans null), tous les textes en une fois
+    tableau = textes.to_arrow(compat_level=pl.CompatLevel.oldest())
+    if isinstance(tableau, pa.ChunkedArray):
+        tableau = tableau.combine_chunks()
+    tableau = tableau.cast(pa.large_binary())
+    offsets = np.frombuffer(tableau.buffers()[1], dtype=np.int64)[tableau.offset:tableau.offset + len(tableau) + 1]
+    longueurs = np.diff(offsets)
+    resultat = np.zeros(len(longueurs), dtype=np.uint64)
+    if offsets[-1] > offsets[0]:
+        octets = np.frombuffer(tableau.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]].astype(np.uint64)
+        positions = np.arange(len(octets)) - np.repeat(offsets[:-1] - offsets[0], longueurs)
+        puissances = np.cumprod(np.full(int(longueurs.max()), BASE_EMPREINTE, dtype=np.uint64))
+        non_vides = longueurs > 0
+        resultat[non_vides] = np.add.reduceat((octets + np.uint64(1)) * puissances[positions],
+                                              (offsets[:-1] - offsets[0])[non_vides])
+    return resultat ^ longueurs.astype(np.uint64)
+
+
+def _valeurs_empreinte(serie: pl.Series) -> np.ndarray:
+    # Colonne -> entiers 64 bits a combiner dans l'empreinte
+    if serie.dtype == pl.Utf8:
+        distinctes = serie.drop_nulls().unique()
+        codes = serie.replace_strict(distinctes, pl.Series(_hacher_textes(distinctes), dtype=pl.UInt64),
+                                     default=None, return_dtype=pl.UInt64)
+        return codes.fill_null(EMPREINTE_NULL).to_numpy()
+    if serie.dtype == pl.Date:
+        serie = serie.to_physical()
+    return serie.cast(pl.Float64).fill_null(float("nan")).to_numpy().view(np.uint64)
+
+
+def _empreintes(batch, colonnes: list) -> pl.Series:
+    # Empreinte 64 bits (Int64) du contenu de chaque ligne, sur les colonnes donnees (dans cet ordre)
+    h = np.zeros(batch.height, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for col in colonnes:
+            h = _melanger(h * BASE_EMPREINTE + _valeurs_empreinte(batch[col]))
+    return pl.Series("empreinte", h.view(np.int64), dtype=pl.Int64)
+
+
+def _preparer_lot(batch):
+    # Ajoute la cle naturelle et l'empreinte de chaque mutation :
+    #   - cle_mutation : identifiant DVF + date (les identifiants DVF sont propres a chaque millesime) ;
+    #     sans id_mutation dans la source, l'empreinte sert de cle
+    #   - empreinte : hachage stable 64 bits du contenu charge (_empreintes, vectorise), pour detecter les mutations modifiees
+    batch = batch.with_columns(
+        pl.col("longitude").cast(pl.Float64, strict=False),
+        pl.col("latitude").cast(pl.Float64, strict=False),
+    )
+    batch = batch.with_columns(_empreintes(batch, COLONNES_CONTENU))
+    if "id_mutation" in batch.columns:
+        cle = pl.concat_str([pl.col("id_mutation"), pl.col("date_mutation").cast(pl.Utf8)], separator="|")
+    else:
+        cle = pl.col("empreinte").cast(pl.Utf8)
+    return batch.with_columns(cle.alias("cle_mutation"))
+
+
+def _inserer_lot(cursor, batch):
+    # Un bien, sa proximite et sa mutation par ligne (id_bien deja attribues)
+    cursor.executemany(_sql_insert("biens", COLONNES_BIENS), _lignes(batch, COLONNES_BIENS))
+    cursor.executemany(_sql_insert("proximite", COLONNES_PROXIMITE), _lignes(batch, COLONNES_PROXIMITE))
+    cursor.executemany(_sql_insert("mutations", COLONNES_MUTATIONS), _lignes(batch, COLONNES_MUTATIONS))
+
+
+def _enregistrer_chargement(conn, mode: str, source, nb_inserees: int, nb_modifiees: int = 0, nb_inchangees: int = 0):
+    # Watermark : date du chargement et derniere date de mutation presente dans la base
+    conn.execute("""
+        INSERT INTO chargements
+        (date_chargement, mode, source, date_mutation_max, nb_inserees, nb_modifiees, nb_inchangees)
+        VALUES (datetime('now'), ?, ?, (SELECT MAX(date_mutation) FROM mutations), ?, ?, ?)
+    """, (mode, str(source) if not isinstance(source, pl.DataFrame) else "DataFrame",
+          nb_inserees, nb_modifiees, nb_inchangees))
+
+
+def _iter_batches(source, batch_size: int, colonnes: list):
+    # Lots de batch_size lignes, seules les colonnes utiles sont lues
+    if isinstance(source, pl.DataFrame):
+        for i in range(0, source.height, batch_size):
+            yield source.slice(i, batch_size).select(colonnes)
+    else:
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=batch_size, columns=colonnes):
+            yield pl.from_arrow(batch)
+
+
+def _nombre_lignes(source) -> int:
+    return source.height if isinstance(source, pl.DataFrame) else pq.ParquetFile(source).metadata.num_rows
+
+
+def _appliquer_pragmas(conn, pragmas: dict):
+    for nom, valeur in pragmas.items():
+        conn.execute(f"PRAGMA {nom} = {valeur}")
+
+
+def drop_indexes(conn):
+    """
+    Supprime les index de SQL_INDEX et les triggers du R*Tree (avant un chargement en masse).
+    """
+    for nom in NOMS_INDEX:
+        conn.execute(f"DROP INDEX IF EXISTS {nom}")
+    for nom in NOMS_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {nom}")
+
+
+def _creer_index_spatial(conn):
+    # R*Tree + triggers, reconstruit a partir de biens (apres un chargement fait sans les triggers)
+    conn.executescript(SQL_RTREE)
+    fill_rtree(conn, "biens", "id_bien", "rtree_biens")
+
+
+def create_indexes(db_path: str = "dvf_immobilier.db"):
     """
-    Insère les données du DataFrame Polars dans la base SQLite normalisée.
+    Crée (si besoin) les index de SQL_INDEX puis met à jour les statistiques
+    de l'optimiseur (ANALYZE).
+    
+    Parameters
+    ----------
+    db_path : str
+        Chemin vers la base de données
+    """
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SQL_INDEX)
+    _creer_index_spatial(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+# AGREGATS MATERIALISES
+
+AGREGATS_MUTATIONS = """
+    COUNT(*) AS nb_transactions,
+    SUM(m.valeur_fonciere) AS somme_valeur,
+    COUNT(m.valeur_fonciere) AS nb_valeur,
+    SUM(m.prix_par_m2_habitable) AS somme_prix_m2,
+    COUNT(m.prix_par_m2_habitable) AS nb_prix_m2,
+    MIN(m.valeur_fonciere) AS prix_min,
+    MAX(m.valeur_fonciere) AS prix_max
+"""
+
+AGREGATS_STATS = """
+    SUM(s.nb_transactions), SUM(s.somme_valeur), SUM(s.nb_valeur),
+    SUM(s.somme_prix_m2), SUM(s.nb_prix_m2), MIN(s.prix_min), MAX(s.prix_max)
+"""
+
+
+def _rafraichir_stats(conn, codes_communes=None):
+    # Recalcule les tables stats_* : tout (codes_communes=None) ou seulement les communes touchees
+    # et leurs departements (lecture des mutations par l'index idx_mut_commune)
+    if codes_communes is None:
+        filtre_commune, filtre_departement, params = "", "", ()
+    else:
+        codes = json.dumps(sorted({code for code in codes_communes if code is not None}))
+        filtre_commune = "WHERE code_commune IN (SELECT value FROM json_each(?))"
+        filtre_departement = """WHERE code_departement IN (
+            SELECT code_departement FROM communes WHERE code_commune IN (SELECT value FROM json_each(?)))"""
+        params = (codes,)
+    
+    conn.execute(f"DELETE FROM stats_commune_mois {filtre_commune}", params)
+    conn.execute(f"""
+        INSERT INTO stats_commune_mois
+        SELECT m.code_commune, substr(m.date_mutation, 1, 7), b.type_local, {AGREGATS_MUTATIONS}
+        FROM (SELECT * FROM mutations {filtre_commune}) m
+        JOIN biens b ON m.id_bien = b.id_bien
+        GROUP BY m.code_commune, substr(m.date_mutation, 1, 7), b.type_local
+    """, params)
+    
+    conn.execute(f"DELETE FROM stats_commune {filtre_commune}", params)
+    conn.execute(f"""
+        INSERT INTO stats_commune
+        SELECT m.code_commune, {AGREGATS_MUTATIONS}
+        FROM (SELECT * FROM mutations {filtre_commune}) m
+        GROUP BY m.code_commune
+    """, params)
+    
+    conn.execute(f"DELETE FROM stats_departement {filtre_departement}", params)
+    conn.execute(f"""
+        INSERT INTO stats_departement
+        SELECT c.code_departement, {AGREGATS_STATS}
+        FROM stats_commune s
+        JOIN (SELECT * FROM communes {filtre_departement}) c ON s.code_commune = c.code_commune
+        GROUP BY c.code_departement
+    """, params)
+
+
+def refresh_stats(db_path: str = "dvf_immobilier.db", codes_communes=None):
+    """
+    Recalcule les tables d'agrégats (stats_commune_mois, stats_commune,
+    stats_departement) lues par vue_stats_commune et vue_stats_departement.
+    
+    Parameters
+    ----------
+    db_path : str
+        Chemin vers la base de données
+    codes_communes : list, optional
+        Communes dont les mutations ont changé : seules ces communes et leurs
+        départements sont recalculés. None : recalcul complet
+    """
+    conn = sqlite3.connect(db_path)
+    _rafraichir_stats(conn, codes_communes)
+    conn.commit()
+    conn.close()
+
+
+def insert_data_from_polars(df, db_path: str = "dvf_immobilier.db", batch_size: int = TAILLE_LOT_INSERTION,
+                            with_indexes: bool = True, verbose: bool = True):
+    """
+    Insère les données DVF dans la base SQLite normalisée (chargement en masse).
     
     Cette fonction :
-    1. Extrait les données uniques pour les tables de référence
-    2. Insère les départements, communes, indicateurs économiques
-    3. Insère les biens, proximités et mutations par lots
+    1. Passe la connexion en mode chargement (PRAGMAS_CHARGEMENT) et supprime les index
+    2. Insère les départements, communes (valeurs du référentiel INSEE compilé s'il existe),
+       indicateurs économiques (valeurs uniques)
+    3. Insère les biens, proximités et mutations par lots avec executemany :
+       les id_bien sont attribués à l'avance (plus de lastrowid ligne par ligne)
+    4. Crée les index une fois les tables remplies, calcule les agrégats (stats_*),
+       puis rétablit les PRAGMAs
     
     Parameters
     ----------
-    df : pl.DataFrame
-        Le DataFrame Polars contenant les données DVF enrichies
-        Doit contenir toutes les colonnes du dataset original
+    df : pl.DataFrame | str | Path
+        Le DataFrame Polars contenant les données DVF enrichies,
+        ou le chemin d'un fichier Parquet (lu par lots, sans le charger en mémoire :
+        adapté au dataset national complet)
         
     db_path : str
         Chemin vers la base de données SQLite
         
     batch_size : int
-        Taille des lots pour l'insertion (défaut: 10000)
+        Taille des lots pour l'insertion (défaut: TAILLE_LOT_INSERTION)
         Augmenter pour plus de vitesse, diminuer si problèmes de mémoire
+        
+    with_indexes : bool
+        Créer les index à la fin (False pour les shards, indexés après la fusion)
+        
+    verbose : bool
+        Afficher la progression (False dans les processus de construction des shards)
 
     """
-    import polars as pl
+    log = print if verbose else (lambda *args, **kwargs: None)
     
     # Import optionnel de tqdm pour la barre de progression
     try:
         from tqdm import tqdm
-        use_tqdm = True
+        use_tqdm = verbose
     except ImportError:
         use_tqdm = False
-        print("  (Installez tqdm pour avoir une barre de progression: pip install tqdm)")
+        log("  (Installez tqdm pour avoir une barre de progression: pip install tqdm)")
     
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
-    # Activer les foreign keys
+    # Activer les foreign keys, mode chargement, index construits a la fin
     cursor.execute("PRAGMA foreign_keys = ON;")
+    _appliquer_pragmas(conn, PRAGMAS_CHARGEMENT)
+    drop_indexes(conn)
     
-    print("Insertion des données...")
+    log("Insertion des données...")
+    lf = _source_lazy(df)
     
-    # DÉPARTEMENTS (données uniques)
-
-    print("  → Départements...")
-    dept_df = df.select([
-        "code_departement",
-        "nb_menages_2021_departement",
-        "revenu_median_2021_departement",
-        "taux_chomage_2023_departement",
-        "salaire_net_horaire_moyen_2022_departement"
-    ]).unique(subset=["code_departement"]).drop_nulls(subset=["code_departement"])
-    
-    for row in dept_df.iter_rows():
-        cursor.execute("""
-            INSERT OR IGNORE INTO departements 
-            (code_departement, nb_menages_2021, revenu_median_2021, 
-             taux_chomage_2023, salaire_net_horaire_moyen_2022)
-            VALUES (?, ?, ?, ?, ?)
-        """, row)
-    
-    conn.commit()
-    print(f"      {dept_df.height} départements insérés")
-    
-    # COMMUNES (données uniques)
-    print("  → Communes...")
-    commune_df = df.select([
-        "code_commune",
-        "code_departement",
-        "nb_menages_2021_commune",
-        "revenu_median_2021_commune"
-    ]).unique(subset=["code_commune"]).drop_nulls(subset=["code_commune"])
-    
-    for row in commune_df.iter_rows():
-        cursor.execute("""
-            INSERT OR IGNORE INTO communes 
-            (code_commune, code_departement, nb_menages_2021, revenu_median_2021)
-            VALUES (?, ?, ?, ?)
-        """, row)
-    
-    conn.commit()
-    print(f"      {commune_df.height} communes insérées")
-
-    # INDICATEURS ÉCONOMIQUES
-    print("  → Indicateurs économiques...")
-    indic_df = df.select([
-        "date_mutation",
-        "Crédits à l'habitat hors renégociations",
-        "Taux hors renégociations",
-        "Variations d'encours mensuelles cvs",
-        "IPC"
-    ]).unique(subset=["date_mutation"]).drop_nulls(subset=["date_mutation"])
-    
-    for row in indic_df.iter_rows():
-        cursor.execute("""
-            INSERT OR IGNORE INTO indicateurs_economiques 
-            (date_indicateur, credits_habitat_hors_renegociations, 
-             taux_hors_renegociations, variations_encours_mensuelles_cvs, ipc)
-            VALUES (?, ?, ?, ?, ?)
-        """, (str(row[0]), row[1], row[2], row[3], row[4]))
-    
-    conn.commit()
-    print(f"      {indic_df.height} dates d'indicateurs insérées")
+    # TABLES DE RÉFÉRENCE (données uniques)
+    references = [
+        ("departements", COLONNES_DEPARTEMENTS, "code_departement", "départements insérés"),
+        ("communes", COLONNES_COMMUNES, "code_commune", "communes insérées"),
+        ("indicateurs_economiques", COLONNES_INDICATEURS, "date_mutation", "dates d'indicateurs insérées"),
+    ]
+    for table, correspondance, cle, libelle in references:
+        log(f"  → {table}...")
+        ref_df = _table_reference(lf, table, correspondance, cle, keep="first")
+        cursor.executemany(_sql_insert(table, correspondance, "INSERT OR IGNORE"), _lignes(ref_df, correspondance))
+        conn.commit()
+        log(f"      {ref_df.height} {libelle}")
     
     # BIENS, PROXIMITÉ et MUTATIONS
 
-    print("  → Biens, Proximité et Mutations...")
+    log("  → Biens, Proximité et Mutations...")
     
-    total_rows = len(df)
+    total_rows = _nombre_lignes(df)
+    colonnes_lot = _colonnes_lot(df)
+    
+    # Prochain id_bien libre : les id sont attribues ici, pour tout le lot d'un coup
+    id_bien = cursor.execute("SELECT COALESCE(MAX(id_bien), 0) + 1 FROM biens").fetchone()[0]
     
     # Créer l'itérateur avec ou sans tqdm
+    batches = _iter_batches(df, batch_size, colonnes_lot)
     if use_tqdm:
-        iterator = tqdm(range(0, total_rows, batch_size), desc="      Batches")
+        iterator = tqdm(batches, total=-(-total_rows // batch_size), desc="      Batches")
     else:
-        iterator = range(0, total_rows, batch_size)
-        print(f"      Total: {total_rows} lignes, {(total_rows // batch_size) + 1} batches")
+        iterator = batches
+        log(f"      Total: {total_rows} lignes, {-(-total_rows // batch_size)} batches")
     
-    for i in iterator:
-        batch = df.slice(i, batch_size)
-        
-        for row in batch.iter_rows(named=True):
-            # -----------------------------------------------------------------
-            # Insérer le bien
-            # -----------------------------------------------------------------
-            cursor.execute("""
-                INSERT INTO biens 
-                (id_parcelle, type_local, surface_reelle_bati, surface_terrain,
-                 longitude, latitude, x_proj, y_proj, 
-                 type_local__Maison, type_local__Appartement)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                row["id_parcelle"],
-                row["type_local"],
-                row["surface_reelle_bati"],
-                row["surface_terrain"],
-                float(row["longitude"]) if row["longitude"] else None,
-                float(row["latitude"]) if row["latitude"] else None,
-                row["x_proj"],
-                row["y_proj"],
-                row["type_local__Maison"],
-                row["type_local__Appartement"]
-            ))
-            
-            id_bien = cursor.lastrowid
-            
-            # -----------------------------------------------------------------
-            # Insérer la proximité
-            # -----------------------------------------------------------------
-            cursor.execute("""
-                INSERT INTO proximite 
-                (id_bien, nb_gares, distance_min_gares, distance_min_gares_manquante,
-                 nb_commerces, distance_min_commerces, distance_min_commerces_manquante,
-                 nb_education, distance_min_education, distance_min_education_manquante,
-                 nb_espaces_verts, distance_min_espaces_verts, distance_min_espaces_verts_manquante,
-                 nb_sante, distance_min_sante, distance_min_sante_manquante,
-                 nb_pharmacies, distance_min_pharmacies, distance_min_pharmacies_manquante,
-                 nb_aeroports, distance_min_aeroports, distance_min_aeroports_manquante,
-                 nb_routes_principales, distance_min_routes_principales, distance_min_routes_principales_manquante,
-                 nb_industries, distance_min_industries, distance_min_industries_manquante)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                id_bien,
-                row["nb_gares"], row["distance_min_gares"], row["distance_min_gares_manquante"],
-                row["nb_commerces"], row["distance_min_commerces"], row["distance_min_commerces_manquante"],
-                row["nb_education"], row["distance_min_education"], row["distance_min_education_manquante"],
-                row["nb_espaces_verts"], row["distance_min_espaces_verts"], row["distance_min_espaces_verts_manquante"],
-                row["nb_sante"], row["distance_min_sante"], row["distance_min_sante_manquante"],
-                row["nb_pharmacies"], row["distance_min_pharmacies"], row["distance_min_pharmacies_manquante"],
-                row["nb_aeroports"], row["distance_min_aeroports"], row["distance_min_aeroports_manquante"],
-                row["nb_routes_principales"], row["distance_min_routes_principales"], row["distance_min_routes_principales_manquante"],
-                row["nb_industries"], row["distance_min_industries"], row["distance_min_industries_manquante"]
-            ))
-            
-            # -----------------------------------------------------------------
-            # Insérer la mutation
-            # -----------------------------------------------------------------
-            cursor.execute("""
-                INSERT INTO mutations 
-                (date_mutation, valeur_fonciere, valeur_fonciere_log, nature_mutation,
-                 id_bien, code_commune, prix_par_m2_habitable, prix_par_m2_terrain)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                str(row["date_mutation"]),
-                row["valeur_fonciere"],
-                row["valeur_fonciere_log"],
-                row["nature_mutation"],
-                id_bien,
-                row["code_commune"],
-                row["prix_par_m2_habitable"],
-                row["prix_par_m2_terrain"]
-            ))
-        
+    progress = 0
+    for batch in iterator:
+        batch = _preparer_lot(batch).with_columns(
+            pl.int_range(id_bien, id_bien + batch.height, dtype=pl.Int64).alias("id_bien"))
+        _inserer_lot(cursor, batch)
         conn.commit()
+        id_bien += batch.height
         
         # Afficher la progression si pas de tqdm
+        progress += batch.height
         if not use_tqdm:
-            progress = min(i + batch_size, total_rows)
-            print(f"      Progression: {progress}/{total_rows} ({100*progress/total_rows:.1f}%)")
+            log(f"      Progression: {progress}/{total_rows} ({100*progress/max(total_rows, 1):.1f}%)")
+    
+    # Index et statistiques de l'optimiseur sur les tables remplies
+    if with_indexes:
+        log("  → Index...")
+        conn.executescript(SQL_INDEX)
+        _creer_index_spatial(conn)
+        log("  → Agrégats...")
+        _rafraichir_stats(conn)
+        conn.execute("ANALYZE")
+    _enregistrer_chargement(conn, "complet", df, total_rows)
+    conn.commit()
+    _appliquer_pragmas(conn, PRAGMAS_APRES_CHARGEMENT)
     
     conn.close()
-    print(f"✓ {total_rows} enregistrements insérés dans {db_path}")
+    log(f"✓ {total_rows} enregistrements insérés dans {db_path}")
 
-# Exploration functions
 
-def get_database_info(db_path: str = "dvf_immobilier.db") -> dict:
+# CHARGEMENT INCREMENTAL
+
+def _sql_upsert(table: str, colonnes, cle: str) -> str:
+    maj = ", ".join(f"{col} = excluded.{col}" for col in colonnes if col != cle)
+    return _sql_insert(table, colonnes) + f" ON CONFLICT({cle}) DO UPDATE SET {maj}"
+
+
+def _mettre_a_jour_lot(cursor, batch):
+    # Mutations modifiees : bien, proximite et mutation mis a jour en place (meme id_bien)
+    for table, correspondance in (("biens", COLONNES_BIENS), ("proximite", COLONNES_PROXIMITE),
+                                  ("mutations", COLONNES_MUTATIONS)):
+        colonnes = [col for col in correspondance if col != "id_bien"]
+        cursor.executemany(
+            f"UPDATE {table} SET {', '.join(f'{col} = ?' for col in colonnes)} WHERE id_bien = ?",
+            _lignes(batch, {col: correspondance[col] for col in colonnes} | {"id_bien": "id_bien"}),
+        )
+
+
+def _verifier_base_incrementale(conn, db_path):
+    # Base construite avant le chargement incremental : colonnes cle_mutation / empreinte absentes de mutations.
+    # Table vide : colonnes ajoutees. Sinon les mutations deja chargees ne peuvent pas etre rapprochees
+    # (l'identifiant DVF n'est pas stocke) : reconstruction complete necessaire
+    colonnes = {ligne[1] for ligne in conn.execute("PRAGMA table_info(mutations)")}
+    manquantes = [col for col in ("cle_mutation", "empreinte") if col not in colonnes]
+    if not manquantes:
+        return
+    if conn.execute("SELECT EXISTS (SELECT 1 FROM mutations)").fetchone()[0]:
+        conn.close()
+        raise RuntimeError(f"{db_path} : base antérieure au chargement incrémental (colonnes {', '.join(manquantes)} "
+                           "absentes de mutations). Reconstruire la base (MODE_CHARGEMENT_DVF = \"complet\").")
+    for col, type_sql in (("cle_mutation", "TEXT"), ("empreinte", "INTEGER")):
+        if col in manquantes:
+            conn.execute(f"ALTER TABLE mutations ADD COLUMN {col} {type_sql}")
+
+
+def upsert_data_from_polars(df, db_path: str = "dvf_immobilier.db", batch_size: int = TAILLE_LOT_INSERTION,
+                            verbose: bool = True) -> dict:
     """
-    Retourne les informations sur la structure de la base de données.
+    Chargement incrémental : n'insère que les mutations nouvelles ou modifiées.
+    
+    Cette fonction :
+    1. Crée les tables et index manquants (la base existante est conservée)
+    2. Met à jour en place les départements, communes, indicateurs économiques (UPSERT)
+    3. Pour chaque lot, compare la clé naturelle (cle_mutation) et l'empreinte de chaque
+       mutation avec la base : insertion des nouvelles, mise à jour des modifiées,
+       les inchangées ne sont pas touchées
+    4. Recalcule les agrégats (stats_*) des seules communes touchées
+    5. Enregistre le chargement (watermark) dans la table chargements
+    
+    Tout le chargement est une seule transaction, en mode WAL (PRAGMAS_INCREMENTAL) :
+    les lecteurs gardent la base ouverte et voient l'ancienne version jusqu'au commit final.
     
     Parameters
     ----------
+    df : pl.DataFrame | str | Path
+        DataFrame Polars ou chemin d'un Parquet (publication DVF complète ou partielle)
+        
     db_path : str
-        Chemin vers la base de données
+        Chemin vers la base de données SQLite
+        
+    batch_size : int
+        Taille des lots comparés à la base
         
     Returns
     -------
     dict
-        Informations sur les tables, vues et leurs colonnes
+        Nombre de mutations insérées, modifiées, inchangées
+
+    Raises
+    ------
+    RuntimeError
+        Base déjà remplie construite avant le chargement incrémental
+        (sans cle_mutation / empreinte) : reconstruction complète nécessaire
     """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
+    cursor.execute("PRAGMA foreign_keys = ON;")
+    _appliquer_pragmas(conn, PRAGMAS_INCREMENTAL)
+    conn.executescript(SQL_SCHEMA)
+    _verifier_base_incrementale(conn, db_path)
+    conn.executescript(SQL_INDEX)
+    conn.executescript(SQL_RTREE)
+    # Base anterieure a l'index spatial : R*Tree vide alors que biens est rempli, construit une fois
+    if cursor.execute("SELECT EXISTS (SELECT 1 FROM biens) AND NOT EXISTS (SELECT 1 FROM rtree_biens)").fetchone()[0]:
+        fill_rtree(conn, "biens", "id_bien", "rtree_biens")
+    # Base anterieure aux agregats materialises : tables stats_* vides, calculees entierement a la fin
+    stats_a_construire = cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM mutations) AND NOT EXISTS (SELECT 1 FROM stats_commune)").fetchone()[0]
+    
+    log("Chargement incrémental...")
+    lf = _source_lazy(df)
     
-    info = {"tables": {}, "views": {}}
+    # TABLES DE RÉFÉRENCE : mises a jour en place
+    references = [
+        ("departements", COLONNES_DEPARTEMENTS, "code_departement"),
+        ("communes", COLONNES_COMMUNES, "code_commune"),
+        ("indicateurs_economiques", COLONNES_INDICATEURS, "date_mutation"),
+    ]
+    for table, correspondance, cle in references:
+        ref_df = _table_reference(lf, table, correspondance, cle, keep="last")
+        cursor.executemany(_sql_upsert(table, correspondance, next(iter(correspondance))),
+                           _lignes(ref_df, correspondance))
+        log(f"  → {table} : {ref_df.height} lignes à jour")
     
-    # Tables
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
-    tables = [row[0] for row in cursor.fetchall()]
+    # MUTATIONS : nouvelles / modifiees / inchangees
+    stats = {"nb_inserees": 0, "nb_modifiees": 0, "nb_inchangees": 0}
+    id_bien = cursor.execute("SELECT COALESCE(MAX(id_bien), 0) + 1 FROM biens").fetchone()[0]
+    communes_touchees = set()
     
-    for table in tables:
-        cursor.execute(f"PRAGMA table_info({table})")
-        columns = [(row[1], row[2]) for row in cursor.fetchall()]
-        cursor.execute(f"SELECT COUNT(*) FROM {table}")
-        count = cursor.fetchone()[0]
-        info["tables"][table] = {"columns": columns, "count": count}
+    for batch in _iter_batches(df, batch_size, _colonnes_lot(df)):
+        batch = _preparer_lot(batch).unique(subset=["cle_mutation"], keep="last", maintain_order=True)
+        
+        # Etat en base des cles du lot (recherche par l'index idx_mut_cle)
+        existants = pl.DataFrame(
+            cursor.execute(
+                "SELECT cle_mutation, id_bien, empreinte, code_commune FROM mutations "
+                "WHERE cle_mutation IN (SELECT value FROM json_each(?))",
+                (json.dumps(batch["cle_mutation"].to_list()),),
+            ).fetchall(),
+            schema={"cle_mutation": pl.Utf8, "id_bien": pl.Int64, "empreinte_base": pl.Int64,
+                    "code_commune_base": pl.Utf8},
+            orient="row",
+        ).unique(subset=["cle_mutation"], keep="last")
+        batch = batch.join(existants, on="cle_mutation", how="left", maintain_order="left")
+        
+        nouveaux = batch.filter(pl.col("id_bien").is_null()).with_columns(
+            pl.int_range(id_bien, id_bien + pl.len(), dtype=pl.Int64).alias("id_bien"))
+        modifies = batch.filter(pl.col("id_bien").is_not_null() & pl.col("empreinte").ne_missing(pl.col("empreinte_base")))
+        
+        _inserer_lot(cursor, nouveaux)
+        _mettre_a_jour_lot(cursor, modifies)
+        id_bien += nouveaux.height
+        communes_touchees.update(nouveaux["code_commune"].to_list() + modifies["code_commune"].to_list()
+                                 + modifies["code_commune_base"].to_list())
+        
+        stats["nb_inserees"] += nouveaux.height
+        stats["nb_modifiees"] += modifies.height
+        stats["nb_inchangees"] += batch.height - nouveaux.height - modifies.height
     
-    # Vues
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='view' ORDER BY name")
-    views = [row[0] for row in cursor.fetchall()]
-    info["views"] = views
+    # Agregats : seules les communes touchees (et leurs departements) sont recalculees
+    _rafraichir_stats(conn, None if stats_a_construire else communes_touchees)
+    _enregistrer_chargement(conn, "incremental", df, **stats)
+    conn.commit()
+    conn.execute("PRAGMA optimize")
+    conn.close()
     
+    log(f"✓ {stats['nb_inserees']} mutations insérées, {stats['nb_modifiees']} modifiées, "
+        f"{stats['nb_inchangees']} inchangées dans {db_path}")
+    return stats
+
+
+def get_watermark(db_path: str = "dvf_immobilier.db") -> dict:
+    """
+    Retourne le dernier chargement enregistré (date, mode, date_mutation_max, compteurs),
+    ou None si la base n'a jamais été chargée.
+    """
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute("SELECT * FROM chargements ORDER BY id_chargement DESC LIMIT 1")
+    row = cursor.fetchone()
+    columns = [desc[0] for desc in cursor.description]
     conn.close()
+    return dict(zip(columns, row)) if row else None
+
+# CONSTRUCTION PARALLELE PAR DEPARTEMENT
+
+def _nom_shard(code_departement) -> str:
+    return f"shard_{code_departement if code_departement is not None else 'inconnu'}.db"
+
+
+def build_shard(source, code_departement, shard_path) -> str:
+    """
+    Construit la base d'un seul département (processus de travail).
+    
+    Les lignes du département sont lues dans le Parquet source (filtre poussé
+    jusqu'à la lecture), puis chargées sans index : la base finale est indexée
+    après la fusion.
+    
+    Returns
+    -------
+    str
+        Chemin du shard construit
+    """
+    df = (pl.scan_parquet(source)
+            .filter(pl.col("code_departement").eq_missing(pl.lit(code_departement, dtype=pl.Utf8)))
+            .collect())
+    create_database(shard_path, verbose=False)
+    insert_data_from_polars(df, shard_path, with_indexes=False, verbose=False)
+    return str(shard_path)
+
+
+def merge_shards(shard_paths, db_path: str = "dvf_immobilier.db"):
+    """
+    Fusionne des shards départementaux dans la base finale (ATTACH + INSERT ... SELECT).
+    
+    - départements, communes, indicateurs économiques : INSERT OR IGNORE,
+      les lignes déjà présentes (mêmes dates d'indicateurs dans tous les shards) sont dédupliquées
+    - biens : id_bien décalé du plus grand id_bien déjà fusionné
+    - proximité, mutations : id_proximite / id_mutation attribués par la base finale,
+      id_bien décalé comme pour les biens
+    
+    Parameters
+    ----------
+    shard_paths : list
+        Chemins des shards (créés par build_shard)
+    db_path : str
+        Chemin vers la base de données finale (créée par create_database)
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    _appliquer_pragmas(conn, PRAGMAS_CHARGEMENT)
+    drop_indexes(conn)
+    
+    colonnes_biens = [col for col in COLONNES_BIENS if col != "id_bien"]
+    colonnes_proximite = [col for col in COLONNES_PROXIMITE if col != "id_bien"]
+    colonnes_mutations = [col for col in COLONNES_MUTATIONS if col != "id_bien"]
+    
+    for shard_path in shard_paths:
+        conn.execute("ATTACH DATABASE ? AS shard", (str(shard_path),))
+        decalage = conn.execute("SELECT COALESCE(MAX(id_bien), 0) FROM biens").fetchone()[0]
+        
+        for table in ("departements", "communes", "indicateurs_economiques"):
+            conn.execute(f"INSERT OR IGNORE INTO {table} SELECT * FROM shard.{table}")
+        conn.execute(f"""
+            INSERT INTO biens (id_bien, {', '.join(colonnes_biens)})
+            SELECT id_bien + ?, {', '.join(colonnes_biens)} FROM shard.biens ORDER BY id_bien
+        """, (decalage,))
+        conn.execute(f"""
+            INSERT INTO proximite (id_bien, {', '.join(colonnes_proximite)})
+            SELECT id_bien + ?, {', '.join(colonnes_proximite)} FROM shard.proximite ORDER BY id_proximite
+        """, (decalage,))
+        conn.execute(f"""
+            INSERT INTO mutations (id_bien, {', '.join(colonnes_mutations)})
+            SELECT id_bien + ?, {', '.join(colonnes_mutations)} FROM shard.mutations ORDER BY id_mutation
+        """, (decalage,))
+        
+        conn.commit()
+        conn.execute("DETACH DATABASE shard")
+    
+    conn.executescript(SQL_INDEX)
+    _creer_index_spatial(conn)
+    _rafraichir_stats(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    _appliquer_pragmas(conn, PRAGMAS_APRES_CHARGEMENT)
+    conn.close()
+
+
+def create_database_parallel(source, db_path: str = "dvf_immobilier.db", nb_workers: int = NB_WORKERS_SHARDS,
+                             shard_dir=PATH_DIR_SHARDS_DVF) -> str:
+    """
+    Construit la base DVF en parallèle : un shard SQLite par département,
+    construits par nb_workers processus, puis fusionnés dans db_path.
+    
+    Le temps de construction des shards (insertion) est divisé par le nombre de cœurs ;
+    seules la fusion (INSERT ... SELECT, sans passer par Python) et la création des index
+    restent séquentielles.
+    
+    Parameters
+    ----------
+    source : str | Path
+        Chemin du Parquet DVF (chaque processus n'en lit que son département)
+    db_path : str
+        Chemin vers la base de données finale
+    nb_workers : int
+        Nombre de processus
+    shard_dir : Path
+        Dossier temporaire des shards (supprimés après la fusion)
+        
+    Returns
+    -------
+    str
+        Chemin vers la base de données créée
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    import shutil
+    
+    # Plus gros departements en premier : ils ne finissent pas seuls a la fin
+    effectifs = dict(pl.scan_parquet(source).group_by("code_departement").len().collect().iter_rows())
+    departements = sorted(effectifs, key=lambda dep: -effectifs[dep])
+    
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    shard_paths = [shard_dir / _nom_shard(dep) for dep in departements]
+    for shard_path in shard_paths:
+        shard_path.unlink(missing_ok=True)
+    
+    print(f"Construction de {len(departements)} shards ({nb_workers} processus)...")
+    # spawn : pas de fork d'un processus qui a deja demarre les threads de Polars
+    with ProcessPoolExecutor(max_workers=nb_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        list(executor.map(build_shard, [source] * len(departements), departements, shard_paths))
+    
+    print("Fusion des shards...")
+    create_database(db_path)
+    merge_shards(sorted(shard_paths), db_path)
+    shutil.rmtree(shard_dir)
+    
+    conn = sqlite3.connect(db_path)
+    _enregistrer_chargement(conn, "complet", source, sum(effectifs.values()))
+    conn.commit()
+    conn.close()
+    
+    print(f"✓ {sum(effectifs.values())} enregistrements insérés dans {db_path}")
+    return db_path
+
+
+# Exploration functions
+
+def get_database_info(db_path: str = "dvf_immobilier.db") -> dict:
+    """
+    Retourne les informations sur la structure de la base de données.
+    
+    Parameters
+    ----------
+    db_path : str
+        Chemin vers la base de données
+        
+    Returns
+    -------
+    dict
+        Informations sur les tables, vues et leurs colonnes
+    """
+    # Connexion en lecture seule du pool (query_db.py)
+    with read_connection(db_path) as conn:
+        cursor = conn.cursor()
+        
+        info = {"tables": {}, "views": {}}
+        
+        # Tables
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+        tables = [row[0] for row in cursor.fetchall()]
+        
+        for table in tables:
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [(row[1], row[2]) for row in cursor.fetchall()]
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            count = cursor.fetchone()[0]
+            info["tables"][table] = {"columns": columns, "count": count}
+        
+        # Vues
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='view' ORDER BY name")
+        views = [row[0] for row in cursor.fetchall()]
+        info["views"] = views
+        cursor.close()
     return info
 
 
@@ -576,18 +1252,10 @@ def explore_table(db_path: str, table_name: str, limit: int = 5):
     limit : int
         Nombre de lignes à afficher
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Colonnes
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [row[1] for row in cursor.fetchall()]
-    
-    # Données
-    cursor.execute(f"SELECT * FROM {table_name} LIMIT {limit}")
-    rows = cursor.fetchall()
-    
-    conn.close()
+    # Nom de table entre guillemets (identifiant), limite liee en parametre
+    _, table_info = fetch_rows(db_path, f'PRAGMA table_info("{table_name}")')
+    columns = [row[1] for row in table_info]
+    _, rows = fetch_rows(db_path, f'SELECT * FROM "{table_name}" LIMIT ?', [limit])
     
     print(f"\nTable: {table_name}")
     print(f"Colonnes: {', '.join(columns)}")
@@ -596,7 +1264,7 @@ def explore_table(db_path: str, table_name: str, limit: int = 5):
         print(f"  {row}")
 
 
-def run_query(db_path: str, query: str):
+def run_query(db_path: str, query: str, params=None):
     """
     Exécute une requête SQL et retourne les résultats.
     
@@ -605,45 +1273,94 @@ def run_query(db_path: str, query: str):
     db_path : str
         Chemin vers la base de données
     query : str
-        Requête SQL à exécuter
+        Requête SQL à exécuter (paramètres ? ou :nom)
+    params : list | tuple | dict, optional
+        Valeurs des paramètres, liées par SQLite
         
     Returns
     -------
     tuple
         (colonnes, résultats)
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(query)
-    results = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description] if cursor.description else []
-    conn.close()
-    return columns, results
-
+    return fetch_rows(db_path, query, params)
 
-# =============================================================================
-# QUERIES EXAMPLES
-# =============================================================================
 
-def run_example_queries(db_path: str = "dvf_immobilier.db"):
+def run_query_df(db_path: str, query: str, params=None, cache: bool = True) -> pl.DataFrame:
     """
-    Exécute des exemples de requêtes sur la base de données.
+    Exécute une requête SQL et retourne le résultat en DataFrame Polars
+    (connexion du pool, résultat mis en cache tant que la base ne change pas).
     
     Parameters
     ----------
     db_path : str
         Chemin vers la base de données
+    query : str
+        Requête SQL à exécuter (paramètres ? ou :nom)
+    params : list | tuple | dict, optional
+        Valeurs des paramètres, liées par SQLite
+    cache : bool
+        False pour les requêtes non déterministes
+        
+    Returns
+    -------
+    pl.DataFrame
+    
+    Example
+    -------
+    >>> run_query_df("dvf_immobilier.db", "SELECT * FROM vue_stats_commune WHERE code_departement = ?", ["75"])
     """
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    return fetch_df(db_path, query, params, cache)
+
+
+def find_sales_within_radius(db_path: str, latitude: float, longitude: float, radius_m: float = RAYON_RECHERCHE_M,
+                             limit: int = None):
+    """
+    Ventes (mutations) des biens situés à moins de radius_m mètres d'un point,
+    de la plus proche à la plus éloignée.
     
-    print("\n" + "="*60)
-    print("EXEMPLES DE REQUÊTES")
-    print("="*60)
+    Préfiltre par le R*Tree (boîte englobante du cercle), puis distance exacte
+    sur les coordonnées projetées (Lambert-93).
     
+    Parameters
+    ----------
+    db_path : str
+        Chemin vers la base de données
+    latitude, longitude : float
+        Centre de la recherche (degrés)
+    radius_m : float
+        Rayon en mètres
+    limit : int, optional
+        Nombre maximal de ventes renvoyées
+        
+    Returns
+    -------
+    tuple
+        (colonnes, résultats), dernière colonne : distance_m
+    """
+    params = radius_params(latitude, longitude, radius_m)
+    columns, results = fetch_rows(db_path, f"""
+        SELECT 
+            m.id_mutation, m.date_mutation, m.valeur_fonciere, m.prix_par_m2_habitable, m.code_commune,
+            b.id_bien, b.type_local, b.surface_reelle_bati, b.longitude, b.latitude,
+            {distance2_sql("b")} AS distance2
+        FROM rtree_biens r
+        JOIN biens b ON b.id_bien = r.id
+        JOIN mutations m ON m.id_bien = b.id_bien
+        WHERE {RTREE_BBOX} AND {distance2_sql("b")} <= :rayon2
+        ORDER BY distance2
+        {"LIMIT :limit" if limit is not None else ""}
+    """, params | {"limit": limit})
+    return with_distance(columns, results)
+
+
+# =============================================================================
+# QUERIES EXAMPLES
+# =============================================================================
+
+# Requetes d'exemple (nom, titre, SQL) : affichees par run_example_queries, mesurees par benchmark_db.py
+EXAMPLE_QUERIES = [
     # Exemple 1: Prix moyen par type de bien
-    print("\n1. Prix moyen par type de bien:")
-    cursor.execute("""
+    ("prix_par_type", "Prix moyen par type de bien", """
         SELECT 
             b.type_local, 
             COUNT(*) AS nb_ventes,
@@ -653,13 +1370,9 @@ def run_example_queries(db_path: str = "dvf_immobilier.db"):
         JOIN biens b ON m.id_bien = b.id_bien
         GROUP BY b.type_local
         ORDER BY prix_moyen DESC
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
-    
+    """),
     # Exemple 2: Top 5 départements les plus chers
-    print("\n2. Top 5 départements les plus chers (prix/m2):")
-    cursor.execute("""
+    ("top_departements", "Top 5 départements les plus chers (prix/m2)", """
         SELECT 
             d.code_departement,
             COUNT(*) AS nb_ventes,
@@ -671,13 +1384,9 @@ def run_example_queries(db_path: str = "dvf_immobilier.db"):
         GROUP BY d.code_departement
         ORDER BY prix_m2_moyen DESC
         LIMIT 5
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
-    
+    """),
     # Exemple 3: Évolution par année
-    print("\n3. Evolution du prix moyen par annee:")
-    cursor.execute("""
+    ("evolution_annuelle", "Evolution du prix moyen par annee", """
         SELECT 
             strftime('%Y', date_mutation) AS annee,
             COUNT(*) AS nb_ventes,
@@ -685,13 +1394,9 @@ def run_example_queries(db_path: str = "dvf_immobilier.db"):
         FROM mutations
         GROUP BY annee
         ORDER BY annee
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
-    
+    """),
     # Exemple 4: Corrélation avec les indicateurs économiques
-    print("\n4. Prix moyen par niveau de taux d'interet:")
-    cursor.execute("""
+    ("prix_par_taux", "Prix moyen par niveau de taux d'interet", """
         SELECT 
             CASE 
                 WHEN i.taux_hors_renegociations < 2 THEN 'Taux < 2%'
@@ -705,8 +1410,26 @@ def run_example_queries(db_path: str = "dvf_immobilier.db"):
         JOIN indicateurs_economiques i ON m.date_mutation = i.date_indicateur
         GROUP BY tranche_taux
         ORDER BY tranche_taux
-    """)
-    for row in cursor.fetchall():
-        print(f"   {row}")
+    """),
+]
+
+
+def run_example_queries(db_path: str = "dvf_immobilier.db"):
+    """
+    Exécute des exemples de requêtes sur la base de données.
     
-    conn.close()
+    Parameters
+    ----------
+    db_path : str
+        Chemin vers la base de données
+    """
+    print("\n" + "="*60)
+    print("EXEMPLES DE REQUÊTES")
+    print("="*60)
+    
+    # Connexion en lecture seule du pool (query_db.py)
+    with read_connection(db_path) as conn:
+        for num, (_, titre, sql) in enumerate(EXAMPLE_QUERIES, start=1):
+            print(f"\n{num}. {titre}:")
+            for row in conn.execute(sql).fetchall():
+                print(f"   {row}")
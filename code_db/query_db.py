@@ -0,0 +1,370 @@
+"""
+==============================================================================
+COUCHE DE LECTURE (SQLite -> Polars)
+==============================================================================
+
+Ouvrir une connexion par requête (sqlite3.connect + lecture du schéma) coûte
+plus cher que la plupart des requêtes elles-mêmes. Ici, par base :
+    1. un pool de connexions en lecture seule (URI mode=ro, query_only),
+       partagé entre threads, avec mmap_size et cache de requêtes préparées
+    2. des paramètres toujours liés (?, :nom), jamais interpolés dans le SQL
+    3. des résultats lus par fetchmany et renvoyés en DataFrame Polars
+       (ou Arrow), un DataFrame par chunk
+    4. un cache LRU des résultats, clé (SQL, paramètres, génération) : la
+       génération change dès qu'une connexion du pool voit PRAGMA data_version
+       bouger (commit d'une autre connexion) ou le fichier remplacé
+
+Utilisé par dvf_database.py et deferla_database.py.
+
+Exemple :
+    >>> df = fetch_df("final_dvf_immobilier.db",
+    ...               "SELECT * FROM vue_stats_commune WHERE code_departement = ?", ["75"])
+    >>> for chunk in iter_df("final_dvf_immobilier.db", "SELECT * FROM mutations"): ...
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import polars as pl
+
+from config_db import TAILLE_POOL_LECTURE, MMAP_SIZE_LECTURE, NB_REQUETES_PREPAREES
+from config_db import NB_RESULTATS_CACHE, NB_LIGNES_MAX_CACHE, TAILLE_CHUNK_RESULTATS
+
+
+class _Connexion(sqlite3.Connection):
+    # Connexion du pool : porte le fichier ouvert et le dernier data_version vu
+    fichier = None
+    data_version = None
+
+
+def _identite_fichier(path: Path):
+    # (device, inode) : change si la base est supprimee puis recreee
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def _cle_params(params):
+    # Parametres -> cle hashable (None si non hashable : pas de cache)
+    if params is None:
+        cle = ()
+    elif isinstance(params, dict):
+        cle = tuple(sorted(params.items()))
+    else:
+        cle = tuple(params)
+    try:
+        hash(cle)
+    except TypeError:
+        return None
+    return cle
+
+
+def _noms_uniques(colonnes: list) -> list:
+    # Polars refuse les noms de colonnes en double (SELECT * sur une jointure) : suffixes _1, _2...
+    vus, noms = {}, []
+    for col in colonnes:
+        nom = col
+        while nom in vus:
+            vus[col] += 1
+            nom = f"{col}_{vus[col]}"
+        vus[nom] = 0
+        noms.append(nom)
+    return noms
+
+
+def _dataframe(colonnes: list, lignes: list) -> pl.DataFrame:
+    if not lignes:
+        return pl.DataFrame({col: [] for col in colonnes})
+    return pl.DataFrame(lignes, schema=colonnes, orient="row", infer_schema_length=None)
+
+
+class ReadPool:
+    """
+    Pool de connexions en lecture seule sur une base SQLite, thread-safe.
+
+    Au plus `size` connexions, ouvertes à la demande et réutilisées ;
+    un thread qui en demande une de plus attend qu'une connexion soit rendue.
+
+    Parameters
+    ----------
+    db_path : str | Path
+        Chemin vers la base de données (doit exister)
+    size : int
+        Nombre maximal de connexions
+    """
+
+    def __init__(self, db_path, size: int = TAILLE_POOL_LECTURE):
+        self.db_path = Path(db_path).resolve()
+        self.size = size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._libres = queue.LifoQueue()
+        self._places = threading.BoundedSemaphore(size)
+        self._verrou = threading.Lock()
+        self._fichier = None
+        self._cache = OrderedDict()
+
+    def _ouvrir(self, fichier) -> _Connexion:
+        conn = sqlite3.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True, factory=_Connexion,
+                               check_same_thread=False, cached_statements=NB_REQUETES_PREPAREES)
+        conn.execute(f"PRAGMA mmap_size = {int(MMAP_SIZE_LECTURE)}")
+        conn.execute("PRAGMA query_only = ON")
+        conn.fichier = fichier
+        return conn
+
+    def _invalider(self):
+        # Appele sous self._verrou
+        self.generation += 1
+        self._cache.clear()
+
+    def _verifier_version(self, conn: _Connexion) -> int:
+        # Generation courante ; incrementee si la base a change depuis le dernier passage de cette connexion
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        with self._verrou:
+            # Nouvelle connexion : on ne sait pas ce qu'elle a manque, invalidation par prudence
+            if version != conn.data_version:
+                self._invalider()
+                conn.data_version = version
+            return self.generation
+
+    def _prendre(self) -> _Connexion:
+        fichier = _identite_fichier(self.db_path)
+        with self._verrou:
+            if fichier != self._fichier:
+                # Base recreee : les connexions ouvertes lisent encore l'ancien fichier
+                self._fichier = fichier
+                self._invalider()
+                while True:
+                    try:
+                        self._libres.get_nowait().close()
+                    except queue.Empty:
+                        break
+        try:
+            return self._libres.get_nowait()
+        except queue.Empty:
+            return self._ouvrir(fichier)
+
+    @contextmanager
+    def connection(self):
+        """
+        Emprunte une connexion (rendue au pool en sortie du bloc with).
+
+        Yields
+        ------
+        tuple
+            (connexion, génération des données vue par cette connexion)
+        """
+        self._places.acquire()
+        conn = None
+        try:
+            conn = self._prendre()
+            yield conn, self._verifier_version(conn)
+        finally:
+            if conn is not None:
+                if conn.fichier == self._fichier and not conn.in_transaction:
+                    self._libres.put(conn)
+                else:
+                    conn.close()
+            self._places.release()
+
+    def cache_get(self, cle):
+        with self._verrou:
+            resultat = self._cache.get(cle)
+            if resultat is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(cle)
+            return resultat
+
+    def cache_put(self, cle, resultat: pl.DataFrame):
+        if resultat.height > NB_LIGNES_MAX_CACHE:
+            return
+        with self._verrou:
+            # Generation depassee pendant la requete : le resultat est peut-etre deja perime
+            if cle[-1] != self.generation:
+                return
+            self._cache[cle] = resultat
+            self._cache.move_to_end(cle)
+            while len(self._cache) > NB_RESULTATS_CACHE:
+                self._cache.popitem(last=False)
+
+    def close(self):
+        with self._verrou:
+            self._invalider()
+            self._fichier = None
+            while True:
+                try:
+                    self._libres.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+_POOLS = {}
+_VERROU_POOLS = threading.Lock()
+
+
+def get_pool(db_path) -> ReadPool:
+    """
+    Pool de lecture de la base (un seul par fichier et par processus).
+    """
+    cle = str(Path(db_path).resolve())
+    with _VERROU_POOLS:
+        if cle not in _POOLS:
+            _POOLS[cle] = ReadPool(cle)
+        return _POOLS[cle]
+
+
+def close_pools():
+    """
+    Ferme toutes les connexions de lecture et vide les caches.
+    """
+    with _VERROU_POOLS:
+        for pool in _POOLS.values():
+            pool.close()
+        _POOLS.clear()
+
+
+@contextmanager
+def read_connection(db_path):
+    """
+    Connexion en lecture seule empruntée au pool de la base.
+
+    Example
+    -------
+    >>> with read_connection("deferla.db") as conn:
+    ...     conn.execute("SELECT COUNT(*) FROM annonces").fetchone()
+    """
+    with get_pool(db_path).connection() as (conn, _):
+        yield conn
+
+
+def fetch_rows(db_path, sql: str, params=None) -> tuple:
+    """
+    Exécute une requête sur une connexion du pool.
+
+    Parameters
+    ----------
+    db_path : str | Path
+        Chemin vers la base de données
+    sql : str
+        Requête SQL (paramètres ? ou :nom)
+    params : list | tuple | dict, optional
+        Valeurs des paramètres
+
+    Returns
+    -------
+    tuple
+        (colonnes, résultats)
+    """
+    with read_connection(db_path) as conn:
+        cursor = conn.execute(sql, params or ())
+        try:
+            results = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+        finally:
+            cursor.close()
+    return columns, results
+
+
+def iter_df(db_path, sql: str, params=None, chunk_size: int = TAILLE_CHUNK_RESULTATS):
+    """
+    Résultats d'une requête par chunks de chunk_size lignes (un DataFrame Polars
+    par chunk), sans jamais charger tout le résultat en mémoire.
+
+    La connexion reste empruntée (et la lecture ouverte) tant que le
+    générateur n'est pas épuisé ou fermé.
+
+    Yields
+    ------
+    pl.DataFrame
+    """
+    with read_connection(db_path) as conn:
+        cursor = conn.execute(sql, params or ())
+        try:
+            columns = _noms_uniques([desc[0] for desc in cursor.description] if cursor.description else [])
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield _dataframe(columns, rows)
+        finally:
+            cursor.close()
+
+
+def fetch_df(db_path, sql: str, params=None, cache: bool = True,
+             chunk_size: int = TAILLE_CHUNK_RESULTATS) -> pl.DataFrame:
+    """
+    Exécute une requête et renvoie le résultat en DataFrame Polars.
+
+    Le résultat est mis en cache (LRU, clé SQL + paramètres + génération des
+    données) ; il est recalculé dès que la base a changé.
+
+    Parameters
+    ----------
+    db_path : str | Path
+        Chemin vers la base de données
+    sql : str
+        Requête SQL (paramètres ? ou :nom)
+    params : list | tuple | dict, optional
+        Valeurs des paramètres
+    cache : bool
+        False pour les requêtes non déterministes (random(), date('now')...)
+    chunk_size : int
+        Lignes lues par fetchmany
+
+    Returns
+    -------
+    pl.DataFrame
+    """
+    pool = get_pool(db_path)
+    cle_params = _cle_params(params) if cache else None
+    with pool.connection() as (conn, generation):
+        cle = (sql, cle_params, generation)
+        if cle_params is not None:
+            resultat = pool.cache_get(cle)
+            if resultat is not None:
+                return resultat
+
+        cursor = conn.execute(sql, params or ())
+        try:
+            columns = _noms_uniques([desc[0] for desc in cursor.description] if cursor.description else [])
+            chunks = []
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunks.append(_dataframe(columns, rows))
+        finally:
+            cursor.close()
+
+    if not chunks:
+        resultat = _dataframe(columns, [])
+    else:
+        # Une colonne entierement NULL dans un chunk est de type Null : type commun a tous les chunks
+        resultat = pl.concat(chunks, how="vertical_relaxed") if len(chunks) > 1 else chunks[0]
+    if cle_params is not None:
+        pool.cache_put(cle, resultat)
+    return resultat
+
+
+def fetch_arrow(db_path, sql: str, params=None, cache: bool = True):
+    """
+    Comme fetch_df, résultat en table Arrow (pyarrow.Table).
+    """
+    return fetch_df(db_path, sql, params, cache).to_arrow()
+
+
+def cache_info(db_path) -> dict:
+    """
+    Statistiques du pool et du cache de résultats d'une base.
+    """
+    pool = get_pool(db_path)
+    with pool._verrou:
+        return {"generation": pool.generation, "hits": pool.hits, "misses": pool.misses,
+                "entries": len(pool._cache), "connections_free": pool._libres.qsize(), "size": pool.size}
@@ -0,0 +1,131 @@
+"""
+==============================================================================
+INDEX SPATIAL R*Tree (SQLite)
+==============================================================================
+
+Les index B-tree (longitude, latitude) ne savent pas répondre à
+"les ventes à moins de 500 m de ce point" : seule la première colonne
+borne la recherche, toute la bande de longitude est parcourue.
+
+Ici les coordonnées projetées (Lambert-93, en mètres) sont indexées dans une
+table virtuelle R*Tree, tenue à jour par des triggers (INSERT / UPDATE / DELETE) :
+    1. préfiltre : boîte englobante du cercle, lue dans le R*Tree
+    2. filtre exact : distance euclidienne (en mètres) sur x_proj / y_proj
+
+Utilisé par dvf_database.py (biens) et deferla_database.py (annonces).
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from config_db import PROJECTION_EPSG_INITIAL, PROJECTION_EPSG_FINAL
+
+
+# Prefiltre R*Tree (alias r) : boites qui intersectent la boite englobante du cercle
+RTREE_BBOX = "r.x_min <= :x_max AND r.x_max >= :x_min AND r.y_min <= :y_max AND r.y_max >= :y_min"
+
+
+@lru_cache(maxsize=None)
+def _transformer():
+    # Construire un Transformer est couteux : une seule fois par processus
+    from pyproj import Transformer
+    return Transformer.from_crs(PROJECTION_EPSG_INITIAL, PROJECTION_EPSG_FINAL, always_xy=True)
+
+
+def project_lon_lat(longitude, latitude):
+    """
+    Projette des coordonnées GPS (degrés) en Lambert-93 (mètres).
+
+    Parameters
+    ----------
+    longitude, latitude : float ou tableau
+        Coordonnées en degrés (None / NaN acceptés)
+
+    Returns
+    -------
+    tuple
+        (x, y) : tableaux numpy float64, NaN si la coordonnée est manquante
+    """
+    lon = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+    lat = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+    x, y = _transformer().transform(lon, lat)
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    manquant = ~(np.isfinite(x) & np.isfinite(y))
+    x[manquant], y[manquant] = np.nan, np.nan
+    return x, y
+
+
+def rtree_sql(table: str, id_column: str, rtree: str) -> str:
+    """
+    SQL de la table R*Tree d'une table ayant des colonnes x_proj / y_proj,
+    et des triggers qui la tiennent à jour (idempotent : IF NOT EXISTS).
+
+    Parameters
+    ----------
+    table : str
+        Table indexée (ex: "biens")
+    id_column : str
+        Identifiant entier des lignes (ex: "id_bien", ou "rowid")
+    rtree : str
+        Nom de la table R*Tree (ex: "rtree_biens")
+    """
+    return f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {rtree} USING rtree(id, x_min, x_max, y_min, y_max);
+
+CREATE TRIGGER IF NOT EXISTS trg_{rtree}_insert AFTER INSERT ON {table}
+WHEN NEW.x_proj IS NOT NULL AND NEW.y_proj IS NOT NULL
+BEGIN
+    INSERT INTO {rtree} VALUES (NEW.{id_column}, NEW.x_proj, NEW.x_proj, NEW.y_proj, NEW.y_proj);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{rtree}_update AFTER UPDATE OF x_proj, y_proj ON {table}
+BEGIN
+    DELETE FROM {rtree} WHERE id = OLD.{id_column};
+    INSERT INTO {rtree} SELECT NEW.{id_column}, NEW.x_proj, NEW.x_proj, NEW.y_proj, NEW.y_proj
+    WHERE NEW.x_proj IS NOT NULL AND NEW.y_proj IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{rtree}_delete AFTER DELETE ON {table}
+BEGIN
+    DELETE FROM {rtree} WHERE id = OLD.{id_column};
+END;
+"""
+
+
+def rtree_trigger_names(rtree: str) -> list:
+    return [f"trg_{rtree}_insert", f"trg_{rtree}_update", f"trg_{rtree}_delete"]
+
+
+def fill_rtree(conn, table: str, id_column: str, rtree: str):
+    """
+    (Re)construit le R*Tree en une passe sur la table, après un chargement
+    en masse fait sans les triggers.
+    """
+    conn.execute(f"DELETE FROM {rtree}")
+    conn.execute(f"""
+        INSERT INTO {rtree}
+        SELECT {id_column}, x_proj, x_proj, y_proj, y_proj FROM {table}
+        WHERE x_proj IS NOT NULL AND y_proj IS NOT NULL
+    """)
+
+
+def distance2_sql(alias: str) -> str:
+    # Distance au carre (m^2) entre le point recherche (:x, :y) et la ligne de l'alias
+    return f"(({alias}.x_proj - :x) * ({alias}.x_proj - :x) + ({alias}.y_proj - :y) * ({alias}.y_proj - :y))"
+
+
+def radius_params(latitude: float, longitude: float, radius_m: float) -> dict:
+    """
+    Paramètres nommés d'une recherche dans un rayon : centre projeté,
+    boîte englobante (préfiltre R*Tree) et rayon au carré (filtre exact).
+    """
+    x, y = project_lon_lat(longitude, latitude)
+    x, y = float(x[0]), float(y[0])
+    return {"x": x, "y": y, "rayon2": radius_m * radius_m,
+            "x_min": x - radius_m, "x_max": x + radius_m, "y_min": y - radius_m, "y_max": y + radius_m}
+
+
+def with_distance(columns: list, rows: list) -> tuple:
+    # Derniere colonne des resultats = distance au carre -> distance en metres
+    return columns[:-1] + ["distance_m"], [row[:-1] + (row[-1] ** 0.5,) for row in rows]
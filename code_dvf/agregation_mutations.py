@@ -0,0 +1,70 @@
+import polars as pl
+
+
+# Agregation des lignes DVF au niveau de la mutation (une ligne = une vente)
+#
+# Dans DVF une mutation (id_mutation) est repetee sur plusieurs lignes :
+#   - une ligne par local (maison, appartement) et par parcelle de la vente
+#   - pour une meme parcelle, chaque local est repete pour chaque nature de culture du terrain (surface_terrain differente)
+#   - valeur_fonciere est celle de TOUTE la mutation, recopiee sur chaque ligne
+# Avant, on gardait toutes ces lignes : traitements en double dans les etapes suivantes, et un prix au m2
+# calcule avec la surface d'un seul local (ex : vente de 2 appartements -> prix au m2 double).
+#
+# Ici, les doublons du fichier (lignes identiques, numero de disposition et de lot compris) sont d'abord supprimes,
+# puis deux group_by (DataFrame ou LazyFrame, compatibles streaming) :
+#   1. par (id_mutation, id_parcelle) : surface_terrain = somme des cultures (une culture = nature de culture + surface,
+#      deux cultures de meme surface comptent deux fois), surface_reelle_bati = somme des locaux (une fois chacun,
+#      pas une fois par culture)
+#   2. par id_mutation : somme des surfaces et des locaux. Les colonnes descriptives (type_local, adresse, coordonnees, ...)
+#      sont celles du plus grand local de la vente
+# Nouvelle colonne nombre_locaux : nombre de locaux (maisons / appartements) vendus ensemble.
+
+
+COLONNES_SURFACE = ["surface_reelle_bati", "surface_terrain"]
+# Discriminants d'un local dans la vente (deux lots identiques vendus ensemble restent deux lignes) ; retires du resultat
+COLONNES_LOCAL = ["numero_disposition", "lot1_numero"]
+# Identifient une culture de la parcelle avec surface_terrain ; retirees du resultat
+COLONNES_CULTURE = ["code_nature_culture", "code_nature_culture_speciale"]
+
+
+def _somme_ou_null(col):
+    # Somme des valeurs renseignees ; null si aucune valeur (garde le comportement "surface inconnue")
+    return pl.when(pl.col(col).is_not_null().any()).then(pl.col(col).sum()).otherwise(None).alias(col)
+
+
+def agreger_mutations(df):
+    colonnes_source = df.collect_schema().names()
+    colonnes_local = [col for col in COLONNES_LOCAL if col in colonnes_source]
+    colonnes_culture = [col for col in COLONNES_CULTURE if col in colonnes_source]
+    # Doublons du fichier : meme ligne, discriminants du local (disposition, lot) compris. Deux appartements
+    # identiques de la meme vente ont des numeros de lot differents : ils sont gardes tous les deux
+    df = df.unique(subset=colonnes_source)
+    colonnes = [col for col in colonnes_source if col not in colonnes_local + colonnes_culture]
+    colonnes_descriptives = [col for col in colonnes if col not in COLONNES_SURFACE + ["id_mutation", "id_parcelle"]]
+
+    # 1. Par parcelle : les locaux sont repetes pour chaque culture (nb_cultures = nombre de cultures distinctes,
+    #    une culture etant identifiee par sa disposition, sa nature et sa surface, pas par sa seule surface)
+    culture = pl.struct([col for col in colonnes_local if col == "numero_disposition"] + colonnes_culture + ["surface_terrain"])
+    nb_cultures = culture.n_unique()
+    par_parcelle = df.group_by(["id_mutation", "id_parcelle"]).agg(
+        [(pl.col("surface_reelle_bati").sum() / nb_cultures).alias("surface_reelle_bati"),
+         pl.col("surface_reelle_bati").is_not_null().any().alias("surface_bati_renseignee"),
+         culture.unique().struct.field("surface_terrain").sum().alias("surface_terrain"),
+         pl.col("surface_terrain").is_not_null().any().alias("surface_terrain_renseignee"),
+         (pl.len() / nb_cultures).round(0).cast(pl.Int32).alias("nombre_locaux")]
+        + [pl.col(col).sort_by("surface_reelle_bati", descending=True, nulls_last=True).first() for col in colonnes_descriptives]
+    ).with_columns([
+        pl.when(pl.col("surface_bati_renseignee")).then(pl.col("surface_reelle_bati")).alias("surface_reelle_bati"),
+        pl.when(pl.col("surface_terrain_renseignee")).then(pl.col("surface_terrain")).alias("surface_terrain"),
+    ]).drop(["surface_bati_renseignee", "surface_terrain_renseignee"])
+
+    # 2. Par mutation : une ligne par vente, descriptif de la parcelle qui porte le plus de surface batie
+    par_mutation = par_parcelle.group_by("id_mutation").agg(
+        [_somme_ou_null(col) for col in COLONNES_SURFACE]
+        + [pl.col("nombre_locaux").sum()]
+        + [pl.col(col).sort_by("surface_reelle_bati", descending=True, nulls_last=True).first()
+           for col in colonnes_descriptives + ["id_parcelle"]]
+    )
+
+    # Ordre des colonnes d'origine, nombre_locaux en fin
+    return par_mutation.select(colonnes + ["nombre_locaux"])
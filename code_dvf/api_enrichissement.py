@@ -0,0 +1,161 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import polars as pl
+
+from config import POINT_INTERET_FICHIER, HOTE_API_ENRICHISSEMENT, PORT_API_ENRICHISSEMENT
+from projection import projeter_lon_lat
+from features_spatiales import charger_coordonnees_poi, construire_kdtrees_depuis_coords, calculer_features_spatiales
+from referentiel_insee import charger_referentiel_commune, charger_referentiel_departement
+from referentiel_insee import encoder_code_commune, encoder_code_departement
+
+
+# API d'enrichissement spatial a la volee (annonce Deferla, adresse saisie dans une appli, ...)
+#
+# Le batch (traitement_open_street_map.py) ne produit les features nb_* / distance_min_* que pour data_vf_oms.parquet.
+# Ici on charge les POI et on construit les KD-Tree UNE SEULE FOIS (index "chauds"), puis chaque appel
+# ne coute qu'une projection + quelques requetes KD-Tree : quelques millisecondes par point.
+#
+# Les features viennent de calculer_features_spatiales() : exactement la meme definition que le batch.
+#
+# Utilisation en Python :
+#   >>> enrichisseur = EnrichisseurSpatial()
+#   >>> enrichisseur.enrichir_point(48.8566, 2.3522)
+#   >>> enrichisseur.enrichir(latitudes, longitudes)   # DataFrame Polars, un point par ligne
+#
+# Utilisation HTTP (optionnelle, uniquement en local) :
+#   >>> python api_enrichissement.py
+#   GET  /features?lat=48.8566&lon=2.3522
+#   POST /features   {"points": [[48.8566, 2.3522], [45.76, 4.83]]}
+
+
+class EnrichisseurSpatial:
+    # Garde en memoire les KD-Tree des POI pour repondre rapidement aux requetes
+
+    def __init__(self, point_interet_fichier=POINT_INTERET_FICHIER):
+        debut = time.perf_counter()
+        coords_dict = charger_coordonnees_poi(point_interet_fichier)
+        self.kdtree_dict = construire_kdtrees_depuis_coords(coords_dict)
+
+        # Referentiel INSEE precompile, en memory-map (meme tables que le batch)
+        self.df_commune = charger_referentiel_commune().select(["cle_commune", "nb_menages_2021_commune", "revenu_median_2021_commune"])
+        self.df_departement = charger_referentiel_departement().drop("code_departement")
+        self.duree_chargement = time.perf_counter() - debut
+
+        # Premier appel a vide : construit le Transformer pyproj (cache) pour que la 1ere vraie requete soit rapide
+        self.enrichir([48.8566], [2.3522])
+
+    def enrichir(self, latitudes, longitudes):
+        # Enrichit un ou plusieurs points (lat, lon en degres) : renvoie un DataFrame Polars
+        # Colonnes : latitude, longitude, x_proj, y_proj, nb_<poi>, distance_min_<poi>
+        lat = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        x_proj, y_proj = projeter_lon_lat(lon, lat)
+
+        features = calculer_features_spatiales(x_proj, y_proj, self.kdtree_dict)
+
+        colonnes = {"latitude": lat, "longitude": lon, "x_proj": x_proj, "y_proj": y_proj}
+        colonnes.update(features)
+        return pl.DataFrame(colonnes)
+
+    def enrichir_point(self, latitude, longitude):
+        # Raccourci pour un seul point : renvoie un dictionnaire (meme cles que rajout_features_un_element)
+        return self.enrichir([latitude], [longitude]).row(0, named=True)
+
+    def enrichir_dataframe(self, df):
+        # Ajoute les features a un DataFrame Polars qui possede deja latitude / longitude (ou x_proj / y_proj)
+        if "x_proj" in df.columns and "y_proj" in df.columns:
+            x_proj = df["x_proj"].cast(pl.Float64).to_numpy()
+            y_proj = df["y_proj"].cast(pl.Float64).to_numpy()
+        else:
+            x_proj, y_proj = projeter_lon_lat(df["longitude"].cast(pl.Float64).to_numpy(),
+                                              df["latitude"].cast(pl.Float64).to_numpy())
+            df = df.with_columns([pl.Series("x_proj", x_proj), pl.Series("y_proj", y_proj)])
+
+        features = calculer_features_spatiales(x_proj, y_proj, self.kdtree_dict)
+        return df.with_columns([pl.Series(col, valeurs) for col, valeurs in features.items()])
+
+    def ajouter_insee(self, df):
+        # Ajoute les indicateurs INSEE (commune / departement) a un DataFrame qui a code_commune et/ou code_departement
+        if "code_commune" in df.columns:
+            df = (df.with_columns(encoder_code_commune(pl.col("code_commune")).alias("cle_commune"))
+                    .join(self.df_commune, on="cle_commune", how="left")
+                    .drop("cle_commune"))
+        if "code_departement" in df.columns:
+            df = (df.with_columns(encoder_code_departement(pl.col("code_departement")).alias("cle_departement"))
+                    .join(self.df_departement, on="cle_departement", how="left")
+                    .drop("cle_departement"))
+        return df
+
+
+def _nettoyer_pour_json(lignes):
+    # NaN n'est pas du JSON valide : on le remplace par null
+    return [{cle: (None if isinstance(val, float) and np.isnan(val) else val) for cle, val in ligne.items()}
+            for ligne in lignes]
+
+
+def creer_serveur_http(enrichisseur, hote=HOTE_API_ENRICHISSEMENT, port=PORT_API_ENRICHISSEMENT):
+    # Petit serveur HTTP local (bibliotheque standard, pas de dependance en plus)
+    # Les KD-Tree sont partages en lecture seule entre les threads du serveur
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _repondre(self, code, contenu):
+            corps = json.dumps(contenu).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corps)))
+            self.end_headers()
+            self.wfile.write(corps)
+
+        def _traiter(self, latitudes, longitudes):
+            debut = time.perf_counter()
+            lignes = enrichisseur.enrichir(latitudes, longitudes).to_dicts()
+            duree_ms = (time.perf_counter() - debut) * 1000
+            self._repondre(200, {"resultats": _nettoyer_pour_json(lignes), "duree_ms": round(duree_ms, 3)})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/features":
+                self._repondre(404, {"erreur": "route inconnue"})
+                return
+            params = parse_qs(url.query)
+            try:
+                self._traiter([float(params["lat"][0])], [float(params["lon"][0])])
+            except (KeyError, ValueError):
+                self._repondre(400, {"erreur": "parametres lat et lon attendus"})
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/features":
+                self._repondre(404, {"erreur": "route inconnue"})
+                return
+            try:
+                taille = int(self.headers.get("Content-Length", 0))
+                points = json.loads(self.rfile.read(taille))["points"]
+                latitudes = [float(p[0]) for p in points]
+                longitudes = [float(p[1]) for p in points]
+            except (KeyError, ValueError, TypeError, IndexError):
+                self._repondre(400, {"erreur": 'corps attendu : {"points": [[lat, lon], ...]}'})
+                return
+            self._traiter(latitudes, longitudes)
+
+        def log_message(self, format, *args):
+            # Pas de log a chaque requete (latence)
+            pass
+
+    return ThreadingHTTPServer((hote, port), Handler)
+
+
+if __name__ == "__main__":
+    enrichisseur = EnrichisseurSpatial()
+    print(f"Index POI charges en {enrichisseur.duree_chargement:.2f} s")
+
+    serveur = creer_serveur_http(enrichisseur)
+    print(f"API d'enrichissement en ecoute sur http://{HOTE_API_ENRICHISSEMENT}:{PORT_API_ENRICHISSEMENT}/features")
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        serveur.server_close()
@@ -0,0 +1,182 @@
+import os
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_FICHIER_DF_FINAL_PROPRE, PATH_DIR_MODELE, PATH_FICHIER_CLUSTERS_GEO
+from config import MODE_CLUSTERS_GEO, NB_CLUSTERS_GEO, NB_CLUSTERS_GEO_PAR_DEPARTEMENT, TAILLE_ECHANTILLON_INIT_CLUSTERS
+from config import NB_POINTS_MIN_INIT_CLUSTERS
+from config import GRAINE_ENTRAINEMENT
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+from scipy.spatial import cKDTree
+from sklearn.cluster import MiniBatchKMeans, kmeans_plusplus
+
+from tri_spatial import ecrire_parquet_spatial
+
+
+# Clusters geographiques (colonne geo_cluster) a l'echelle nationale
+#
+# Un KMeans classique sur des millions de coordonnees ne tient pas dans le budget de temps : ici
+#   - MiniBatchKMeans sur x_proj / y_proj, en streaming sur les row groups du Parquet (seules 2-3 colonnes lues)
+#   - le fichier final est trie spatialement (tri_spatial.py) : un row group = une petite zone. Pour ne pas biaiser
+#     l'apprentissage, les centroides sont initialises (k-means++) sur un echantillon aleatoire de toute la France,
+#     puis les row groups sont lus dans un ordre aleatoire. En mode departement, l'echantillon de chaque departement
+#     a au moins NB_POINTS_MIN_INIT_CLUSTERS points : tous les departements presents ont leurs centroides
+#   - mode "national" (NB_CLUSTERS_GEO clusters) ou "departement" (NB_CLUSTERS_GEO_PAR_DEPARTEMENT par departement)
+#   - les centroides sont sauvegardes (clusters_geo.parquet) : nouvelles ventes et annonces sont affectees sans re-apprendre
+#   - affectation = centroide le plus proche, par KD-Tree sur les centroides (vectorise)
+#
+# Table des centroides : geo_cluster (Int32), code_departement ("" en mode national), x_centre, y_centre
+
+
+def _coordonnees_row_group(fichier, i):
+    # (departements, coordonnees) des points valides du row group i
+    df = pl.from_arrow(fichier.read_row_group(i, columns=["x_proj", "y_proj", "code_departement"]))
+    df = df.filter(pl.col("x_proj").is_finite() & pl.col("y_proj").is_finite())
+    return df["code_departement"].fill_null("").to_numpy(), df.select(["x_proj", "y_proj"]).to_numpy().astype(np.float64)
+
+
+def _groupes(departements, mode):
+    # Cle de groupe de chaque point : un seul groupe "" en mode national
+    return departements if mode == "departement" else np.full(len(departements), "", dtype=object)
+
+
+def _fractions_echantillon(chemin, mode, fraction, nb_points_min):
+    # Fraction tiree par groupe : la fraction uniforme, relevee pour les departements trop petits pour
+    # avoir nb_points_min points dans l'echantillon (un departement absent du tirage n'aurait aucun centroide)
+    if mode != "departement":
+        return {"": fraction}
+    effectifs = (pl.scan_parquet(chemin)
+                   .group_by(pl.col("code_departement").fill_null(""))
+                   .agg(pl.len().alias("nb"))
+                   .collect(engine="streaming"))
+    return {dep: max(fraction, min(1.0, nb_points_min / nb)) for dep, nb in effectifs.iter_rows()}
+
+
+def ajuster_clusters(chemin=PATH_FICHIER_DF_FINAL_PROPRE, mode=MODE_CLUSTERS_GEO, nb_clusters=None,
+                     taille_echantillon=TAILLE_ECHANTILLON_INIT_CLUSTERS, graine=GRAINE_ENTRAINEMENT,
+                     nb_points_min=NB_POINTS_MIN_INIT_CLUSTERS):
+    # Apprend les centroides en streaming, renvoie la table des centroides
+    if nb_clusters is None:
+        nb_clusters = NB_CLUSTERS_GEO_PAR_DEPARTEMENT if mode == "departement" else NB_CLUSTERS_GEO
+    fichier = pq.ParquetFile(chemin)
+    nb_row_groups = fichier.metadata.num_row_groups
+    rng = np.random.default_rng(graine)
+    fraction = min(1.0, taille_echantillon / max(fichier.metadata.num_rows, 1))
+    fractions = _fractions_echantillon(chemin, mode, fraction, nb_points_min)
+
+    # 1. Echantillon aleatoire (fraction du groupe dans chaque row group) pour l'initialisation
+    echantillon_groupes, echantillon_coords = [], []
+    for i in range(nb_row_groups):
+        departements, coords = _coordonnees_row_group(fichier, i)
+        groupes = _groupes(departements, mode)
+        valeurs, indices = np.unique(groupes, return_inverse=True)
+        seuils = np.array([fractions.get(groupe, fraction) for groupe in valeurs], dtype=np.float64)[indices]
+        garde = rng.random(len(coords)) < seuils
+        echantillon_groupes.append(groupes[garde])
+        echantillon_coords.append(coords[garde])
+    echantillon_groupes = np.concatenate(echantillon_groupes)
+    echantillon_coords = np.concatenate(echantillon_coords)
+
+    # 2. Un MiniBatchKMeans par groupe, initialise en k-means++ sur l'echantillon du groupe
+    modeles = {}
+    for groupe in np.unique(echantillon_groupes):
+        coords = np.unique(echantillon_coords[echantillon_groupes == groupe], axis=0)
+        k = min(nb_clusters, len(coords))
+        centres, _ = kmeans_plusplus(coords, n_clusters=k, random_state=graine)
+        modeles[groupe] = MiniBatchKMeans(n_clusters=k, init=centres, n_init=1, random_state=graine)
+        modeles[groupe].partial_fit(coords)
+
+    # 3. Passe en streaming sur tous les points, row groups dans un ordre aleatoire
+    for i in rng.permutation(nb_row_groups):
+        departements, coords = _coordonnees_row_group(fichier, i)
+        groupes = _groupes(departements, mode)
+        for groupe in np.unique(groupes):
+            if groupe in modeles:
+                modeles[groupe].partial_fit(coords[groupes == groupe])
+
+    # Table des centroides, identifiants consecutifs
+    lignes = [(groupe, x, y) for groupe in sorted(modeles) for x, y in modeles[groupe].cluster_centers_]
+    return pl.DataFrame({"geo_cluster": np.arange(len(lignes), dtype=np.int32),
+                         "code_departement": [groupe for groupe, _, _ in lignes],
+                         "x_centre": [x for _, x, _ in lignes],
+                         "y_centre": [y for _, _, y in lignes]})
+
+
+def sauver_clusters(centroides, chemin=PATH_FICHIER_CLUSTERS_GEO):
+    os.makedirs(PATH_DIR_MODELE, exist_ok=True)
+    centroides.write_parquet(chemin)
+
+
+def charger_clusters(chemin=PATH_FICHIER_CLUSTERS_GEO):
+    return pl.read_parquet(chemin)
+
+
+def assigner_clusters(x, y, departements, centroides):
+    # Centroide le plus proche pour chaque point (KD-Tree sur les centroides), -1 si pas de coordonnees
+    # En mode departement, seuls les centroides du departement du point sont candidats
+    # (departement inconnu des centroides -> tous les centroides)
+    points = np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    resultat = np.full(len(points), -1, dtype=np.int32)
+    valides = np.isfinite(points).all(axis=1)
+
+    groupes_centroides = centroides["code_departement"].to_numpy()
+    ids = centroides["geo_cluster"].to_numpy()
+    centres = centroides.select(["x_centre", "y_centre"]).to_numpy()
+    par_departement = not (groupes_centroides == "").all()
+
+    groupes_points = np.asarray(departements, dtype=object) if par_departement else np.full(len(points), "", dtype=object)
+    connus = np.isin(groupes_points, np.unique(groupes_centroides))
+
+    for groupe in np.unique(groupes_points[valides & connus]):
+        masque = valides & (groupes_points == groupe)
+        candidats = groupes_centroides == groupe
+        _, idx = cKDTree(centres[candidats]).query(points[masque], k=1)
+        resultat[masque] = ids[candidats][idx]
+
+    inconnus = valides & ~connus
+    if inconnus.any():
+        _, idx = cKDTree(centres).query(points[inconnus], k=1)
+        resultat[inconnus] = ids[idx]
+    return resultat
+
+
+def _geo_cluster_struct(serie, centroides):
+    champs = serie.struct.unnest()
+    return pl.Series("geo_cluster", assigner_clusters(champs["x_proj"].cast(pl.Float64).to_numpy(),
+                                                      champs["y_proj"].cast(pl.Float64).to_numpy(),
+                                                      champs["code_departement"].fill_null("").to_numpy(),
+                                                      centroides))
+
+
+def ajouter_geo_cluster(df, centroides):
+    # Ajoute la colonne geo_cluster (DataFrame ou LazyFrame) ; -1 si pas de coordonnees
+    return df.with_columns(
+        pl.struct(["x_proj", "y_proj", "code_departement"])
+        .map_batches(lambda serie: _geo_cluster_struct(serie, centroides), return_dtype=pl.Int32)
+        .alias("geo_cluster")
+    )
+
+
+def clusters_geographiques(chemin=PATH_FICHIER_DF_FINAL_PROPRE, mode=MODE_CLUSTERS_GEO):
+    # Etape du pipeline : apprend et sauvegarde les centroides, puis ajoute geo_cluster au dataset final
+    centroides = ajuster_clusters(chemin, mode)
+    sauver_clusters(centroides)
+
+    # Reecriture en streaming (fichier temporaire puis remplacement), ordre des lignes et row groups conserves
+    lf = pl.scan_parquet(chemin)
+    if "geo_cluster" in lf.collect_schema().names():
+        lf = lf.drop("geo_cluster")
+    fichier_temporaire = Path(chemin).with_suffix(".tmp.parquet")
+    ecrire_parquet_spatial(ajouter_geo_cluster(lf, centroides), fichier_temporaire)
+    os.replace(fichier_temporaire, chemin)
+    return centroides
+
+
+if __name__ == "__main__":
+    centroides = clusters_geographiques()
+    print(f"{centroides.height} clusters geographiques ({MODE_CLUSTERS_GEO}) -> {PATH_FICHIER_CLUSTERS_GEO}")
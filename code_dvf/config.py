@@ -1,4 +1,5 @@
 from pathlib import Path
+import datetime
 import polars as pl
 
 CURRENT_DIR = Path(__file__).resolve().parent
@@ -33,7 +34,14 @@ PATH_DIR_OSM_TRIEE = PATH_DIR_OSM / "donnee_triee" #Contiendra que les gares, ae
 
 #Donnee eco
 PATH_DIR_ECO = BASE_PATH_DATA / "Economie_global"
-PATH_FICHIER_ECO = PATH_DIR_ECO / "df_eco.csv"
+PATH_FICHIER_ECO = PATH_DIR_ECO / "df_eco.parquet" # Artefact type produit par traitement_economie_global.py
+PATH_FICHIER_ECO_EMPREINTE = PATH_DIR_ECO / "df_eco_sources.json" # Empreinte des CSV sources (reconstruction si changement)
+DATE_DEBUT_ECO = datetime.date(2015, 1, 1)
+
+
+# Jointure temporelle des series eco (jointure_temporelle.py)
+LAG_MOIS_ECO = 0 # Decalage en mois : une vente du mois m recoit la valeur publiee pour le mois m - LAG_MOIS_ECO
+FFILL_MAX_MOIS_ECO = 12 # Nombre max de mois ou l'on prolonge la derniere valeur connue (None = sans limite)
 
 
 #Donnee INSEE 2021
@@ -43,6 +51,18 @@ PATH_DIR_INSEE = BASE_PATH_DATA / "INSEE_2021"
 PATH_FICHIER_INSEE_DONNEE_COMMUNE = PATH_DIR_INSEE  / "niv_vie_commune_2021.csv"
 PATH_FICHIER_INSEE_DONNEE_DEPARTEMENT = PATH_DIR_INSEE  / "niv_vie_departement.csv"
 
+# Referentiel INSEE precompile (Arrow IPC non compresse, lu en memory-map) : referentiel_insee.py
+PATH_DIR_REFERENTIEL = BASE_PATH_DATA / "Referentiel"
+PATH_FICHIER_REFERENTIEL_COMMUNE = PATH_DIR_REFERENTIEL / "insee_commune.arrow"
+PATH_FICHIER_REFERENTIEL_DEPARTEMENT = PATH_DIR_REFERENTIEL / "insee_departement.arrow"
+PATH_FICHIER_REFERENTIEL_EMPREINTE = PATH_DIR_REFERENTIEL / "insee_sources.json"
+
+# Modele de prix (entrainement.py) : modele final + checkpoint de reprise
+PATH_DIR_MODELE = BASE_PATH_DATA / "Modele"
+PATH_FICHIER_MODELE = PATH_DIR_MODELE / "modele_prix.joblib"
+PATH_FICHIER_CHECKPOINT = PATH_DIR_MODELE / "checkpoint.joblib"
+PATH_FICHIER_CLUSTERS_GEO = PATH_DIR_MODELE / "clusters_geo.parquet" # Centroides des clusters geographiques (clusters_geographiques.py)
+
 #----------------FICHIER DATAFRAME_FINAL----------------#
 PATH_DIR_DF_FINAL = BASE_PATH_DATA / "DataFrameFinal"
 
@@ -57,6 +77,32 @@ PATH_FICHIER_DF_VF_OSM = PATH_DIR_DF_VF_OSM / "data_vf_oms.parquet"
 PATH_DIR_DF_VF_OSM_ECO_INSEE = PATH_DIR_DF_FINAL / "DataFrame_VF+OMS+Eco+INSEE"
 PATH_FICHIER_DF_VF_OSM_ECO_INSEE = PATH_DIR_DF_VF_OSM_ECO_INSEE / "df_vf_oms_eco_insee.parquet"
 
+PATH_FICHIER_DF_FINAL_PROPRE = PATH_DIR_DF_FINAL / "df_final_propre.parquet"
+PATH_FICHIER_DF_FINAL_REDUIT = PATH_DIR_DF_FINAL / "df_final_propre_reduit.parquet" # Echantillon (base de donnees, envoi)
+
+# Feature store (feature_store.py) : matrices float32 memory-mappables pour l'entrainement
+PATH_DIR_FEATURE_STORE = PATH_DIR_DF_FINAL / "FeatureStore"
+PATH_FICHIER_FEATURES_X = PATH_DIR_FEATURE_STORE / "X.npy"
+PATH_FICHIER_FEATURES_Y = PATH_DIR_FEATURE_STORE / "y.npy"
+PATH_FICHIER_FEATURES_META = PATH_DIR_FEATURE_STORE / "meta.json"
+
+
+#----------------FICHIER DEFERLA (annonces scrapees)----------------#
+PATH_FICHIER_JSON_DEFERLA = BASE_PATH / "deferla.json"
+PATH_DB_DEFERLA = BASE_PATH / "final_deferla.db"
+TABLE_ANNONCES_ENRICHIES = "annonces_enrichies" # Table compagnon de "annonces" avec les features geo / eco / INSEE
+TABLE_ANNONCES_SCOREES = "annonces_scorees" # Prix predit par le modele pour chaque annonce (scoring.py)
+
+# Correspondance type d'annonce Deferla -> type_local DVF (les autres types ne sont pas des logements comparables)
+TYPE_DEFERLA_VERS_TYPE_LOCAL = {
+    "Appartement": "Appartement",
+    "Duplex": "Appartement",
+    "Loft": "Appartement",
+    "Maison": "Maison",
+    "Maison de ville": "Maison",
+    "Chalet": "Maison"
+}
+
 
 #----------------  AUTRE CONSTANTE POUR LES DONNEES  ----------------#
 
@@ -118,13 +164,21 @@ TYPE_COLUMN_CSV_SALE = {
 # Il y'avait bcp de Nan/None, dans cette colonne, on l'a donc mise de cote. 
 # On aurait pu peut etre traite ces Nan d'une certaine maniere.
 # Idee : premier modele si assez d'element qui predise nbr_piece_principale, puis utiliser le modele pour remplir.
-COLUMN_FINAL = ['date_mutation','valeur_fonciere','code_postal','nom_commune',"code_commune",
+COLUMN_FINAL = ['id_mutation','date_mutation','valeur_fonciere','code_postal','nom_commune',"code_commune",
                 'nature_mutation','code_departement','id_parcelle','type_local',
                 'surface_reelle_bati','surface_terrain','longitude','latitude',"adresse_numero",
-                "adresse_suffixe","adresse_nom_voie","adresse_code_voie"]
+                "adresse_suffixe","adresse_nom_voie","adresse_code_voie",
+                # Disposition, lot, nature de culture : identifient les locaux et les lignes de terrain d'une vente
+                # (agregation_mutations.py, non conserves)
+                "numero_disposition","lot1_numero","code_nature_culture","code_nature_culture_speciale"]
+
+
+# Types de biens gardes au premier nettoyage (sert aussi au One-Hot Encoding de type_local dans fin_nettoyage.py)
+TYPES_LOCAL = ["Appartement", "Maison"]
 
 
 TYPE_COLUMN_CSV_PROPRE = {
+    "id_mutation": pl.Utf8,
     "date_mutation": pl.Date,              
     "valeur_fonciere": pl.Float64,         
     "surface_reelle_bati": pl.Float64,     
@@ -142,10 +196,13 @@ TYPE_COLUMN_CSV_PROPRE = {
     "surface_terrain": pl.Float64,         
     "longitude": pl.Float64,               
     "latitude": pl.Float64,                
+    "x_proj": pl.Float64,
+    "y_proj": pl.Float64,
     "prix_par_m2_habitable" : pl.Float64,
     "prix_par_m2_terrain" : pl.Float64,
     "annee" : pl.Int32,
-    "annee_mois": pl.Utf8
+    "annee_mois": pl.Utf8,
+    "nombre_locaux": pl.Int32
 }
 
 
@@ -195,6 +252,69 @@ TAGS_UTILISE = TAGS_UTILISE = {
 
 PROJECTION_EPSG_INITIAL = 4326
 PROJECTION_EPSG_FINAL = 2154
+TAILLE_CHUNK_PROJECTION = 1_000_000 # Nombre de points projetes par appel a pyproj (memoire bornee)
+TAILLE_CHUNK_FEATURES = 200_000 # Nombre de points interroges par requete KD-Tree vectorisee
+
+# Colonnes du feature store (ordre fixe = ordre des colonnes de la matrice X) et cible
+COLONNES_FEATURES = (["surface_reelle_bati", "surface_terrain", "nombre_locaux", "x_proj", "y_proj"]
+                     + [prefixe + poi for poi in POINT_INTERET for prefixe in ("nb_", "distance_min_")]
+                     + ["nb_ventes_comparables", "prix_m2_median_comparables"] # ventes_comparables.py
+                     + ["Crédits à l'habitat hors renégociations", "Taux hors renégociations",
+                        "Variations d'encours mensuelles cvs", "IPC", "eco_anciennete_mois"]
+                     + ["nb_menages_2021_commune", "revenu_median_2021_commune",
+                        "nb_menages_2021_departement", "revenu_median_2021_departement",
+                        "taux_chomage_2023_departement", "salaire_net_horaire_moyen_2022_departement"]
+                     + ["distance_min_" + poi + "_manquante" for poi in POINT_INTERET]
+                     + ["type_local__" + type_local for type_local in TYPES_LOCAL]
+                     + ["geo_cluster"]) # identifiant de cluster, encode en one-hot par entrainement.py
+COLONNE_CIBLE = "valeur_fonciere_log"
+TAILLE_BATCH_FEATURES = 100_000 # Lignes par batch (construction du feature store et entrainement)
+
+# Entrainement hors memoire du modele de prix (entrainement.py)
+NB_EPOQUES = 5
+TAILLE_BLOC_ENTRAINEMENT = 10_000 # Un batch = TAILLE_BATCH_FEATURES lignes prises dans des blocs contigus tires au hasard
+CHECKPOINT_TOUS_BATCHS = 20
+PART_VALIDATION = 0.1 # Lignes tenues a l'ecart (tirage deterministe par hachage de l'indice de ligne)
+GRAINE_ENTRAINEMENT = 42
+
+# Clusters geographiques (clusters_geographiques.py) : MiniBatchKMeans sur x_proj / y_proj, colonne geo_cluster
+MODE_CLUSTERS_GEO = "national" # "national" : NB_CLUSTERS_GEO clusters pour la France ; "departement" : clusters par departement
+NB_CLUSTERS_GEO = 100
+NB_CLUSTERS_GEO_PAR_DEPARTEMENT = 10
+TAILLE_ECHANTILLON_INIT_CLUSTERS = 200_000 # Points tires au hasard pour initialiser les centroides (k-means++)
+NB_POINTS_MIN_INIT_CLUSTERS = 1_000 # Mode departement : points tires au minimum par departement (petits departements)
+
+# Tri spatial des fichiers Parquet par courbe de Hilbert sur x_proj / y_proj (tri_spatial.py)
+TRI_SPATIAL = True # Les etapes d'enrichissement et finale ecrivent des fichiers tries par cle de Hilbert
+EMPRISE_LAMBERT93 = (0, 6_000_000, 1_300_000, 7_200_000) # xmin, ymin, xmax, ymax (metropole + Corse), hors emprise -> bord
+ORDRE_HILBERT = 16 # Grille 2^16 x 2^16 (cellules d'environ 20 m)
+TAILLE_ROW_GROUP_SPATIAL = 100_000 # Lignes par row group : min / max par row group = petites boites spatiales
+
+# Ventes comparables (ventes_comparables.py) : k ventes anterieures les plus proches, dans un rayon et une fenetre temporelle
+K_VENTES_COMPARABLES = 10
+RAYON_VENTES_COMPARABLES = 1000 # metres
+FENETRE_JOURS_VENTES_COMPARABLES = 365
+SURECHANTILLONNAGE_VENTES_COMPARABLES = 4 # On demande k * 4 voisins au KD-Tree avant le filtre sur la date
+SURFACE_MIN_VENTES_COMPARABLES = 9 # m2, en dessous le prix au m2 n'a pas de sens (surface manquante ou lot annexe)
+VENTES_COMPARABLES_PIPELINE = True # pipeline_final.py ajoute les colonnes au fichier d'entree si elles sont absentes
+
+# Filtre des valeurs foncieres aberrantes par segment departement x type_local x annee (filtre_aberrants.py)
+PRECISION_RELATIVE_SKETCH = 0.01 # Erreur relative max des quantiles approches (largeur des seaux logarithmiques)
+MIN_VENTES_SEGMENT = 200 # En dessous, le segment utilise les seuils globaux (quantiles trop instables)
+
+# Echantillons du dataset final (echantillonnage.py)
+TAILLES_ECHANTILLON = [10_000] # Plusieurs tailles possibles en une passe, la plus petite est df_final_propre_reduit.parquet
+GRAINE_ECHANTILLON = 42
+STRATES_ECHANTILLON = ["code_departement", "type_local", "annee"] # [] = echantillon uniforme
+
+# API d'enrichissement a la volee (api_enrichissement.py)
+HOTE_API_ENRICHISSEMENT = "127.0.0.1"
+PORT_API_ENRICHISSEMENT = 8765
+
+# Scoring des annonces (scoring.py)
+TAILLE_BATCH_SCORING = 50_000 # Annonces par batch en mode catalogue
+BUDGET_LATENCE_P99_MS = 50 # Budget de latence p99 en mode unitaire (alerte si depasse)
+NB_LATENCES_SUIVIES = 10_000 # Fenetre glissante des latences pour p50 / p99
 
 POINT_INTERET_LOURD_ANCIENNE_VERSION_1 = ["commerces","industries","espaces_verts","education"]
 POINT_INTERET_LOURD = []
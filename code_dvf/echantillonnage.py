@@ -0,0 +1,135 @@
+import os
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_FICHIER_DF_FINAL_PROPRE, PATH_FICHIER_DF_FINAL_REDUIT
+from config import TAILLES_ECHANTILLON, GRAINE_ECHANTILLON, STRATES_ECHANTILLON
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+
+# Echantillons (uniformes ou stratifies) du dataset final, en streaming sur les row groups du Parquet
+#
+# Avant (__main__ de fin_nettoyage.py) : relecture de tout df_final_propre.parquet en memoire pour un df.sample(n=10000).
+# Ici :
+#   - chaque ligne recoit une cle pseudo-aleatoire deterministe : hachage (splitmix64) de sa position dans le fichier et
+#     de la graine. Meme fichier + meme graine = meme echantillon, quelle que soit la version de Polars
+#   - echantillon uniforme sans remise de taille n = les n lignes de plus petite cle ("bottom-k") : on ne garde en memoire
+#     que les meilleures candidates pendant la lecture des row groups
+#   - les echantillons sont emboites : l'echantillon de 1 000 est inclus dans celui de 10 000.
+#     Plusieurs tailles sont donc produites en UNE passe
+#   - stratifie (departement, type, annee) : allocation proportionnelle calculee par une passe de comptage
+#     (3 colonnes lues), puis bottom-k dans chaque strate
+
+
+TAILLE_BATCH_ECHANTILLON = 200_000
+
+
+def cles_aleatoires(positions, graine=GRAINE_ECHANTILLON):
+    # splitmix64 : positions (uint64) -> cles pseudo-aleatoires uniformes (uint64)
+    z = positions.astype(np.uint64) + np.uint64((graine * 0x9E3779B97F4A7C15) % 2**64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def expressions_strates(strates):
+    # "annee" est deduite de date_mutation, les autres strates sont des colonnes du dataset
+    return [pl.col("date_mutation").cast(pl.Date).dt.year().alias("annee") if strate == "annee" else pl.col(strate)
+            for strate in strates]
+
+
+def allocation_proportionnelle(effectifs, taille):
+    # Quota par strate proportionnel a son effectif (methode des plus forts restes : la somme vaut exactement taille)
+    total = effectifs["nb"].sum()
+    taille = min(taille, total)
+    part = effectifs["nb"].cast(pl.Float64) * taille / total
+    quota = part.floor().cast(pl.Int64)
+    reste = taille - quota.sum()
+
+    # Les 'reste' strates avec la plus grande partie fractionnaire recoivent une ligne de plus
+    ordre = (part - quota).arg_sort(descending=True)[:reste]
+    bonus = np.zeros(len(quota), dtype=np.int64)
+    bonus[ordre.to_numpy()] = 1
+    return quota + pl.Series(bonus)
+
+
+def calculer_quotas(chemin, tailles, strates):
+    # Passe de comptage : une ligne par strate, une colonne quota_<taille> par taille demandee
+    if not strates:
+        total = pl.scan_parquet(chemin).select(pl.len()).collect().item()
+        return pl.DataFrame({f"quota_{taille}": [min(taille, total)] for taille in tailles})
+
+    effectifs = (pl.scan_parquet(chemin)
+                   .select(expressions_strates(strates))
+                   .group_by(strates)
+                   .agg(pl.len().alias("nb"))
+                   .collect(engine="streaming")
+                   .sort(strates))
+    return effectifs.with_columns([allocation_proportionnelle(effectifs, taille).alias(f"quota_{taille}")
+                                   for taille in tailles])
+
+
+def echantillonner(chemin=PATH_FICHIER_DF_FINAL_PROPRE, tailles=TAILLES_ECHANTILLON, strates=STRATES_ECHANTILLON,
+                   graine=GRAINE_ECHANTILLON, taille_batch=TAILLE_BATCH_ECHANTILLON):
+    # Renvoie {taille: DataFrame} ; une seule lecture du fichier (plus une passe de comptage si stratifie)
+    tailles = sorted(tailles)
+    quotas = calculer_quotas(chemin, tailles, strates)
+    colonnes_quotas = [f"quota_{taille}" for taille in tailles]
+
+    # Colonnes techniques strate_i (pas de collision avec les colonnes du dataset, ex : annee)
+    cles_strates = [f"strate_{i}" for i in range(len(strates))]
+    quotas = quotas.rename(dict(zip(strates, cles_strates)))
+
+    def quota(taille):
+        return pl.col(f"quota_{taille}") if strates else pl.lit(quotas[f"quota_{taille}"][0])
+
+    rang = pl.col("cle_echantillon").rank("ordinal")
+    if strates:
+        rang = rang.over(cles_strates)
+
+    candidats = None
+    position = 0
+    for batch in pq.ParquetFile(chemin).iter_batches(batch_size=taille_batch):
+        df = pl.from_arrow(batch)
+        positions = np.arange(position, position + df.height, dtype=np.uint64)
+        df = df.with_columns([pl.Series("cle_echantillon", cles_aleatoires(positions, graine)),
+                              pl.Series("position_echantillon", positions)])
+        position += df.height
+
+        if strates:
+            df = (df.with_columns([expr.alias(cle) for cle, expr in zip(cles_strates, expressions_strates(strates))])
+                    .join(quotas.drop("nb"), on=cles_strates, how="left", nulls_equal=True))
+
+        # Bottom-k : on ne garde que les lignes qui peuvent encore entrer dans le plus grand echantillon
+        candidats = df if candidats is None else pl.concat([candidats, df], how="vertical_relaxed")
+        candidats = candidats.filter(rang <= quota(tailles[-1]))
+
+    if candidats is None:
+        raise ValueError(f"Fichier vide : {chemin}")
+
+    # Echantillons emboites : pour chaque taille, les quota_<taille> plus petites cles (de chaque strate)
+    colonnes_techniques = ["cle_echantillon", "position_echantillon"] + cles_strates + (colonnes_quotas if strates else [])
+    return {taille: candidats.filter(rang <= quota(taille)).sort("position_echantillon").drop(colonnes_techniques)
+            for taille in tailles}
+
+
+def chemin_echantillon(taille, tailles=TAILLES_ECHANTILLON):
+    # La plus petite taille garde le nom historique (lu par code_db), les autres sont suffixees par leur taille
+    if taille == min(tailles):
+        return PATH_FICHIER_DF_FINAL_REDUIT
+    return PATH_FICHIER_DF_FINAL_REDUIT.with_name(f"df_final_propre_reduit_{taille}.parquet")
+
+
+def ecrire_echantillons(chemin=PATH_FICHIER_DF_FINAL_PROPRE, tailles=TAILLES_ECHANTILLON, strates=STRATES_ECHANTILLON,
+                        graine=GRAINE_ECHANTILLON):
+    for taille, df in echantillonner(chemin, tailles, strates, graine).items():
+        df.write_parquet(chemin_echantillon(taille, tailles))
+
+
+if __name__ == "__main__":
+    ecrire_echantillons()
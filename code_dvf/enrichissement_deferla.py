@@ -0,0 +1,175 @@
+import os
+import json
+import sqlite3
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_FICHIER_JSON_DEFERLA, PATH_DB_DEFERLA, TABLE_ANNONCES_ENRICHIES
+from config import PATH_FICHIER_DF_VF, TYPE_DEFERLA_VERS_TYPE_LOCAL
+
+import numpy as np
+import polars as pl
+from scipy.spatial import cKDTree
+
+from projection import ajouter_projection
+from api_enrichissement import EnrichisseurSpatial
+from fusion_vf_eco_insee import fusion_eco, fusion_insee
+
+
+# Enrichissement en batch des annonces Deferla (scrapees par DeferlaSpider.parse)
+#
+# Les annonces ont une latitude / longitude mais aucune feature de localisation : on ne peut pas les scorer
+# avec les memes entrees que les donnees DVF d'entrainement. Ce script :
+#   1. charge le catalogue (deferla.json ou table "annonces" de final_deferla.db)
+#   2. projette toutes les annonces en une fois (Lambert-93)
+#   3. calcule les features nb_* / distance_min_* avec les memes KD-Tree que le batch DVF (une seule requete vectorisee)
+#   4. fait les jointures eco (mois de publication) et INSEE (commune / departement)
+#   5. ecrit le resultat dans la table compagnon "annonces_enrichies" de final_deferla.db
+
+
+COLONNES_ANNONCES = ["id", "date_publication", "type", "prix", "surface", "pieces",
+                     "ville", "code_postal", "latitude", "longitude"]
+
+
+def charger_annonces_json(chemin_json=PATH_FICHIER_JSON_DEFERLA):
+    # Meme normalisation que insert_data_from_json (prix parfois sous forme de dictionnaire)
+    with open(chemin_json, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    lignes = []
+    for item in data:
+        prix = item.get("prix")
+        if isinstance(prix, dict):
+            prix = prix.get("value") or prix.get("commission")
+        ligne = {col: item.get(col) for col in COLONNES_ANNONCES}
+        ligne["prix"] = prix
+        lignes.append(ligne)
+
+    return pl.DataFrame(lignes, schema={"id": pl.Utf8, "date_publication": pl.Utf8, "type": pl.Utf8,
+                                        "prix": pl.Float64, "surface": pl.Float64, "pieces": pl.Int64,
+                                        "ville": pl.Utf8, "code_postal": pl.Utf8,
+                                        "latitude": pl.Float64, "longitude": pl.Float64})
+
+
+def charger_annonces_db(db_path=PATH_DB_DEFERLA):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.execute(f"SELECT {', '.join(COLONNES_ANNONCES)} FROM annonces")
+    rows = cursor.fetchall()
+    conn.close()
+
+    return pl.DataFrame(rows, schema={"id": pl.Utf8, "date_publication": pl.Utf8, "type": pl.Utf8,
+                                      "prix": pl.Float64, "surface": pl.Float64, "pieces": pl.Int64,
+                                      "ville": pl.Utf8, "code_postal": pl.Utf8,
+                                      "latitude": pl.Float64, "longitude": pl.Float64}, orient="row")
+
+
+def preparer_colonnes_dvf(df):
+    # Aligne les annonces sur les colonnes du dataset DVF pour pouvoir reutiliser les memes jointures
+    code_postal = pl.col("code_postal")
+    return df.with_columns([
+        pl.col("date_publication").str.strptime(pl.Date, "%Y-%m-%d", strict=False).alias("date_mutation"),
+        pl.col("type").replace_strict(TYPE_DEFERLA_VERS_TYPE_LOCAL, default=None).alias("type_local"),
+        pl.col("prix").alias("valeur_fonciere"),
+        pl.col("surface").alias("surface_reelle_bati"),
+        pl.col("ville").alias("nom_commune"),
+        # Departement depuis le code postal : 97x pour l'outre-mer, 2A / 2B pour la Corse
+        pl.when(code_postal.str.slice(0, 2) == "97").then(code_postal.str.slice(0, 3))
+        .when(code_postal.str.slice(0, 2) == "20")
+        .then(pl.when(code_postal.cast(pl.Int32, strict=False) < 20200).then(pl.lit("2A")).otherwise(pl.lit("2B")))
+        .otherwise(code_postal.str.slice(0, 2))
+        .alias("code_departement")
+    ])
+
+
+def construire_index_communes(chemin_dvf=PATH_FICHIER_DF_VF):
+    # KD-Tree des ventes DVF (x_proj / y_proj) et code_commune associe, None si le fichier DVF n'existe pas
+    if not Path(chemin_dvf).exists():
+        return None
+
+    df_ref = (pl.scan_parquet(chemin_dvf)
+              .select(["x_proj", "y_proj", "code_commune"])
+              .drop_nulls()
+              .unique(subset=["x_proj", "y_proj"])
+              .collect())
+    return cKDTree(df_ref.select(["x_proj", "y_proj"]).to_numpy()), df_ref["code_commune"].to_numpy()
+
+
+def rattacher_code_commune(df, chemin_dvf=PATH_FICHIER_DF_VF, distance_max=2000, index_communes=None):
+    # Les annonces n'ont pas de code commune INSEE (seulement ville / code postal)
+    # On prend le code_commune de la vente DVF la plus proche (KD-Tree sur x_proj / y_proj), si a moins de distance_max metres
+    # index_communes : index deja construit (construire_index_communes), pour ne pas relire le fichier DVF a chaque appel
+    if index_communes is None:
+        index_communes = construire_index_communes(chemin_dvf)
+    if index_communes is None:
+        return df.with_columns(pl.lit(None, dtype=pl.Utf8).alias("code_commune"))
+    tree, codes_communes = index_communes
+
+    points = df.select(["x_proj", "y_proj"]).to_numpy()
+    valides = np.isfinite(points).all(axis=1)
+    codes = np.full(len(points), None, dtype=object)
+    if valides.any():
+        dist, idx = tree.query(points[valides], k=1, distance_upper_bound=distance_max)
+        trouves = np.isfinite(dist)
+        codes_valides = np.full(valides.sum(), None, dtype=object)
+        codes_valides[trouves] = codes_communes[idx[trouves]]
+        codes[valides] = codes_valides
+
+    return df.with_columns(pl.Series("code_commune", codes.tolist(), dtype=pl.Utf8))
+
+
+def enrichir_annonces(df_annonces, enrichisseur=None):
+    # Enrichit tout le catalogue en une seule passe vectorisee (pas d'annonce par annonce)
+    if enrichisseur is None:
+        enrichisseur = EnrichisseurSpatial()
+
+    df = df_annonces.filter(pl.col("latitude").is_not_null() & pl.col("longitude").is_not_null())
+    df = preparer_colonnes_dvf(df)
+    df = ajouter_projection(df)
+    df = enrichisseur.enrichir_dataframe(df)
+    df = rattacher_code_commune(df)
+    df = fusion_eco(df)
+    df = fusion_insee(df)
+    return df
+
+
+def ecrire_table_sqlite(df, db_path=PATH_DB_DEFERLA, table=TABLE_ANNONCES_ENRICHIES):
+    # Ecrit la table compagnon (recreee a chaque execution), cle = id de l'annonce
+    types_sql = {col: ("INTEGER" if dtype.is_integer() or dtype == pl.Boolean
+                       else "REAL" if dtype.is_float()
+                       else "TEXT")
+                 for col, dtype in df.schema.items()}
+    colonnes_sql = ",\n    ".join(f'"{col}" {types_sql[col]}' + (" PRIMARY KEY" if col == "id" else "")
+                                   for col in df.columns)
+
+    # Dates en texte ISO (comme dans le reste de la base)
+    df = df.with_columns([pl.col(col).cast(pl.Utf8) for col, dtype in df.schema.items() if dtype in (pl.Date, pl.Datetime)])
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    cursor.execute(f"""
+        CREATE TABLE {table} (
+    {colonnes_sql},
+    FOREIGN KEY (id) REFERENCES annonces(id)
+        )
+    """)
+    marqueurs = ", ".join("?" for _ in df.columns)
+    noms = ", ".join(f'"{col}"' for col in df.columns)
+    cursor.executemany(f"INSERT INTO {table} ({noms}) VALUES ({marqueurs})", df.iter_rows())
+    conn.commit()
+    conn.close()
+
+
+def enrichissement_deferla(source="json"):
+    # source = "json" (deferla.json) ou "db" (table annonces de final_deferla.db)
+    df_annonces = charger_annonces_json() if source == "json" else charger_annonces_db()
+    df_enrichi = enrichir_annonces(df_annonces)
+    ecrire_table_sqlite(df_enrichi)
+    print(f"✓ {df_enrichi.height} annonces enrichies dans {PATH_DB_DEFERLA} (table {TABLE_ANNONCES_ENRICHIES})")
+    return df_enrichi
+
+
+if __name__ == "__main__":
+    enrichissement_deferla(source="db")
@@ -0,0 +1,172 @@
+import os
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_DIR_MODELE, PATH_FICHIER_MODELE, PATH_FICHIER_CHECKPOINT
+from config import TAILLE_BATCH_FEATURES, TAILLE_BLOC_ENTRAINEMENT, NB_EPOQUES, PATH_FICHIER_CLUSTERS_GEO
+from config import CHECKPOINT_TOUS_BATCHS, PART_VALIDATION, GRAINE_ENTRAINEMENT
+
+import time
+
+import joblib
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
+
+from feature_store import ouvrir_feature_store
+from echantillonnage import cles_aleatoires
+from clusters_geographiques import charger_clusters
+
+
+# Entrainement hors memoire du modele de prix (cible : log de la valeur fonciere)
+#
+# Le dataset national ne tient pas forcement en RAM : on lit le feature store (X.npy / y.npy en memory-map)
+# par batchs, et on n'utilise que des modeles incrementaux (partial_fit) :
+#   1. passe "statistiques" : StandardScaler (moyenne / variance cumulees)
+#   2. passes "regression" : SGDRegressor sur les features standardisees + cluster geographique (geo_cluster) en one-hot
+# Les clusters geographiques sont appris par clusters_geographiques.py (MiniBatchKMeans, centroides sauvegardes).
+# Les valeurs manquantes (NaN) sont remplacees par la moyenne (0 apres standardisation).
+#
+# Les batchs melangent des blocs contigus tires au hasard (TAILLE_BLOC_ENTRAINEMENT lignes) : le store est range par
+# departement, un batch couvre donc plusieurs departements, tout en gardant des lectures sequentielles.
+# Une part PART_VALIDATION des lignes (tirage deterministe par hachage de l'indice) n'est jamais apprise : RMSE de validation
+# a chaque epoque.
+#
+# Checkpoint (joblib) tous les CHECKPOINT_TOUS_BATCHS batchs : un entrainement interrompu reprend au dernier checkpoint.
+# Memoire utilisee : un batch + les modeles, quelle que soit la taille du dataset.
+
+
+def est_validation(indices, part_validation=PART_VALIDATION, graine=GRAINE_ENTRAINEMENT):
+    # Tirage deterministe : la meme ligne est toujours en validation (ou toujours en apprentissage)
+    seuil = np.uint64(int(part_validation * 2**32))
+    return (cles_aleatoires(indices, graine) >> np.uint64(32)) < seuil
+
+
+def plan_batchs(n_lignes, epoque, taille_batch=TAILLE_BATCH_FEATURES, taille_bloc=TAILLE_BLOC_ENTRAINEMENT,
+                graine=GRAINE_ENTRAINEMENT):
+    # Liste des batchs d'une epoque : chaque batch = liste de debuts de blocs (ordre aleatoire, reproductible par epoque)
+    debuts = np.arange(0, n_lignes, taille_bloc)
+    np.random.default_rng([graine, epoque]).shuffle(debuts)
+    blocs_par_batch = max(1, taille_batch // taille_bloc)
+    return [debuts[i:i + blocs_par_batch] for i in range(0, len(debuts), blocs_par_batch)]
+
+
+def lire_batch(store, debuts_blocs, taille_bloc=TAILLE_BLOC_ENTRAINEMENT):
+    # Concatene les blocs d'un batch (seule copie en memoire : le batch courant)
+    n_lignes = store["X"].shape[0]
+    plages = [(debut, min(debut + taille_bloc, n_lignes)) for debut in debuts_blocs]
+    indices = np.concatenate([np.arange(d, f, dtype=np.uint64) for d, f in plages])
+    X = np.concatenate([store["X"][d:f] for d, f in plages])
+    y = np.concatenate([store["y"][d:f] for d, f in plages])
+    return indices, X, y
+
+
+def construire_matrice(X, scaler, nb_clusters, colonnes):
+    # Features brutes (float32) -> matrice du regresseur : features standardisees (NaN -> 0) + one-hot de geo_cluster
+    X_norm = np.nan_to_num(scaler.transform(X), nan=0.0, posinf=0.0, neginf=0.0).astype(np.float32)
+
+    i_cluster = colonnes.index("geo_cluster")
+    clusters = X[:, i_cluster]
+    X_norm[:, i_cluster] = 0 # l'identifiant n'a pas de sens numerique, seul le one-hot est utilise
+
+    one_hot = np.zeros((len(X), nb_clusters), dtype=np.float32)
+    connus = np.isfinite(clusters) & (clusters >= 0) & (clusters < nb_clusters)
+    one_hot[np.nonzero(connus)[0], clusters[connus].astype(np.int64)] = 1
+    return np.hstack([X_norm, one_hot])
+
+
+def etat_initial(graine=GRAINE_ENTRAINEMENT):
+    if not Path(PATH_FICHIER_CLUSTERS_GEO).exists():
+        raise FileNotFoundError(f"Centroides des clusters geographiques absents ({PATH_FICHIER_CLUSTERS_GEO}) : "
+                                "lancer clusters_geographiques.py avant l'entrainement")
+    return {"scaler": StandardScaler(),
+            "nb_clusters": charger_clusters(PATH_FICHIER_CLUSTERS_GEO).height,
+            "modele": SGDRegressor(penalty="l2", alpha=1e-5, learning_rate="invscaling", eta0=0.01,
+                                   random_state=graine),
+            "phase": "statistiques", "epoque": 0, "batch": 0, "metriques": []}
+
+
+def sauver_checkpoint(etat):
+    os.makedirs(PATH_DIR_MODELE, exist_ok=True)
+    fichier_temporaire = PATH_FICHIER_CHECKPOINT.with_suffix(".tmp")
+    joblib.dump(etat, fichier_temporaire)
+    os.replace(fichier_temporaire, PATH_FICHIER_CHECKPOINT) # remplacement atomique : pas de checkpoint a moitie ecrit
+
+
+def evaluer(store, etat, colonnes, taille_batch=TAILLE_BATCH_FEATURES):
+    # RMSE (log) et erreur relative mediane sur les lignes de validation, en streaming
+    somme_carres, n, erreurs_relatives = 0.0, 0, []
+    for debut in range(0, store["X"].shape[0], taille_batch):
+        fin = min(debut + taille_batch, store["X"].shape[0])
+        validation = est_validation(np.arange(debut, fin, dtype=np.uint64))
+        X, y = store["X"][debut:fin][validation], store["y"][debut:fin][validation]
+        garde = ~np.isnan(y)
+        if not garde.any():
+            continue
+        prediction = etat["modele"].predict(construire_matrice(X[garde], etat["scaler"], etat["nb_clusters"], colonnes))
+        somme_carres += float(np.sum((prediction - y[garde]) ** 2))
+        n += int(garde.sum())
+        erreurs_relatives.append(np.abs(np.expm1(prediction - y[garde]))) # |prix predit / prix reel - 1|
+    if n == 0:
+        return {"rmse_log": float("nan"), "erreur_relative_mediane": float("nan"), "n_validation": 0}
+    return {"rmse_log": (somme_carres / n) ** 0.5,
+            "erreur_relative_mediane": float(np.median(np.concatenate(erreurs_relatives))),
+            "n_validation": n}
+
+
+def entrainer(reprise=True, nb_epoques=NB_EPOQUES, taille_batch=TAILLE_BATCH_FEATURES,
+              checkpoint_tous=CHECKPOINT_TOUS_BATCHS, verbose=True):
+    store = ouvrir_feature_store()
+    colonnes = store["colonnes"]
+    n_lignes = store["X"].shape[0]
+    etat = joblib.load(PATH_FICHIER_CHECKPOINT) if reprise and PATH_FICHIER_CHECKPOINT.exists() else etat_initial()
+
+    # 1. Statistiques du scaler (une passe)
+    if etat["phase"] == "statistiques":
+        batchs = plan_batchs(n_lignes, 0, taille_batch)
+        for num in range(etat["batch"], len(batchs)):
+            indices, X, _ = lire_batch(store, batchs[num])
+            X = X[~est_validation(indices)]
+            etat["scaler"].partial_fit(X)
+
+            etat["batch"] = num + 1
+            if etat["batch"] % checkpoint_tous == 0:
+                sauver_checkpoint(etat)
+        etat.update(phase="regression", epoque=0, batch=0)
+        sauver_checkpoint(etat)
+
+    # 2. Regression : nb_epoques passes de partial_fit
+    while etat["epoque"] < nb_epoques:
+        debut = time.perf_counter()
+        batchs = plan_batchs(n_lignes, etat["epoque"] + 1, taille_batch)
+        for num in range(etat["batch"], len(batchs)):
+            indices, X, y = lire_batch(store, batchs[num])
+            garde = ~est_validation(indices) & ~np.isnan(y)
+            if garde.any():
+                etat["modele"].partial_fit(construire_matrice(X[garde], etat["scaler"], etat["nb_clusters"], colonnes), y[garde])
+
+            etat["batch"] = num + 1
+            if etat["batch"] % checkpoint_tous == 0:
+                sauver_checkpoint(etat)
+
+        metriques = evaluer(store, etat, colonnes, taille_batch)
+        metriques.update(epoque=etat["epoque"] + 1, duree_s=round(time.perf_counter() - debut, 2))
+        etat["metriques"].append(metriques)
+        if verbose:
+            print(metriques)
+        etat.update(epoque=etat["epoque"] + 1, batch=0)
+        sauver_checkpoint(etat)
+
+    # Modele final : tout ce qu'il faut pour predire (voir scoring)
+    modele_final = {"scaler": etat["scaler"], "nb_clusters": etat["nb_clusters"], "modele": etat["modele"],
+                    "colonnes": colonnes, "cible": store["cible"], "metriques": etat["metriques"]}
+    joblib.dump(modele_final, PATH_FICHIER_MODELE)
+    os.remove(PATH_FICHIER_CHECKPOINT) # entrainement termine : le prochain repart de zero
+    return modele_final
+
+
+if __name__ == "__main__":
+    entrainer()
+    print(f"Modele sauvegarde : {PATH_FICHIER_MODELE}")
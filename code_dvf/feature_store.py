@@ -0,0 +1,147 @@
+import os
+import json
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_FICHIER_DF_FINAL_PROPRE, PATH_DIR_FEATURE_STORE
+from config import PATH_FICHIER_FEATURES_X, PATH_FICHIER_FEATURES_Y, PATH_FICHIER_FEATURES_META
+from config import COLONNES_FEATURES, COLONNE_CIBLE, TAILLE_BATCH_FEATURES
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+
+# Feature store : le dataset final sous forme de matrices float32 memory-mappables (.npy non compresses)
+#
+# Avant : chaque job (entrainement, evaluation, clustering) relisait df_final_propre.parquet et le convertissait en NumPy.
+# Ici le dataset est converti UNE fois :
+#   - X.npy : matrice (n_lignes, n_features) float32, colonnes dans l'ordre de COLONNES_FEATURES (null -> NaN)
+#   - y.npy : cible (COLONNE_CIBLE) float32
+#   - meta.json : colonnes, nombre de lignes, plages de lignes par departement, empreinte du Parquet source
+# Les lignes sont regroupees par departement (un departement = une plage de lignes contigue, ordre du fichier conserve
+# a l'interieur) : une partition est une simple tranche, sans copie.
+#
+# Ouverture en np.load(mmap_mode="r") : demarrage instantane, seules les pages lues sont chargees,
+# et elles sont partagees entre processus (plusieurs jobs sur la meme machine = une seule copie en memoire).
+#
+# Exemple :
+#   >>> store = ouvrir_feature_store()
+#   >>> for X, y in iterer_batches(store, taille_batch=100_000): ...
+#   >>> X_75, y_75 = partition(store, "75")
+
+
+def empreinte_source(chemin):
+    # Taille + date de modification du Parquet source : le store est reconstruit si le dataset final change
+    stat = os.stat(chemin)
+    return {"fichier": str(Path(chemin).name), "taille": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def construire_feature_store(chemin=PATH_FICHIER_DF_FINAL_PROPRE, colonnes=COLONNES_FEATURES, cible=COLONNE_CIBLE,
+                             taille_batch=TAILLE_BATCH_FEATURES):
+    # Deux passes en streaming (jamais tout le dataset en memoire) :
+    #   1. comptage des lignes par departement -> plage de lignes de chaque departement
+    #   2. lecture par batchs, chaque ligne est ecrite directement a sa place dans X.npy / y.npy
+
+    # Colonne absente du Parquet (ex. geo_cluster : clusters_geographiques.py pas lance, ou dataset final reecrit
+    # ensuite par pipeline_final.py / fin_nettoyage.py) : erreur, plutot qu'un bloc de features vide a l'entrainement
+    presentes = set(pq.ParquetFile(chemin).schema_arrow.names)
+    manquantes = [col for col in list(colonnes) + [cible] if col not in presentes]
+    if manquantes:
+        raise ValueError(f"Colonnes absentes de {chemin} : {manquantes}"
+                         + (" (lancer clusters_geographiques.py)" if "geo_cluster" in manquantes else ""))
+    colonnes_lues = list(colonnes) + [cible, "code_departement"]
+
+    effectifs = (pl.scan_parquet(chemin)
+                   .group_by("code_departement")
+                   .agg(pl.len().alias("nb"))
+                   .collect()
+                   .sort("code_departement", nulls_last=True))
+    n_lignes = int(effectifs["nb"].sum())
+    fins = np.cumsum(effectifs["nb"].to_numpy())
+    debuts = fins - effectifs["nb"].to_numpy()
+    departements = effectifs["code_departement"].fill_null("").to_list()
+
+    os.makedirs(PATH_DIR_FEATURE_STORE, exist_ok=True)
+    X = np.lib.format.open_memmap(PATH_FICHIER_FEATURES_X, mode="w+", dtype=np.float32, shape=(n_lignes, len(colonnes)))
+    y = np.lib.format.open_memmap(PATH_FICHIER_FEATURES_Y, mode="w+", dtype=np.float32, shape=(n_lignes,))
+
+    curseur = dict(zip(departements, debuts.tolist()))
+    indice_departement = pl.DataFrame({"code_departement": departements,
+                                       "indice_departement": np.arange(len(departements), dtype=np.int32)})
+
+    for batch in pq.ParquetFile(chemin).iter_batches(batch_size=taille_batch, columns=colonnes_lues):
+        df = (pl.from_arrow(batch)
+                .with_columns(pl.col("code_departement").fill_null(""))
+                .join(indice_departement, on="code_departement", how="left", maintain_order="left"))
+
+        # Position de destination de chaque ligne : curseur du departement + rang de la ligne dans son departement
+        rang = df.select(pl.int_range(pl.len()).over("indice_departement").alias("rang"))["rang"].to_numpy()
+        base = np.array([curseur[dep] for dep in departements], dtype=np.int64)[df["indice_departement"].to_numpy()]
+        positions = base + rang
+
+        X[positions] = df.select([pl.col(col).cast(pl.Float32) for col in colonnes]).to_numpy()
+        y[positions] = df[cible].cast(pl.Float32).to_numpy()
+        for dep, nb in df.group_by("code_departement").len().iter_rows():
+            curseur[dep] += nb
+
+    X.flush()
+    y.flush()
+    del X, y
+
+    meta = {"colonnes": list(colonnes), "cible": cible, "n_lignes": n_lignes,
+            "partitions": {dep: [int(d), int(f)] for dep, d, f in zip(departements, debuts, fins)},
+            "source": empreinte_source(chemin)}
+    with open(PATH_FICHIER_FEATURES_META, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+
+def feature_store_a_jour(chemin=PATH_FICHIER_DF_FINAL_PROPRE, colonnes=COLONNES_FEATURES):
+    if not all(Path(f).exists() for f in (PATH_FICHIER_FEATURES_X, PATH_FICHIER_FEATURES_Y, PATH_FICHIER_FEATURES_META)):
+        return False
+    with open(PATH_FICHIER_FEATURES_META, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta["source"] == empreinte_source(chemin) and meta["colonnes"] == list(colonnes)
+
+
+def ouvrir_feature_store(chemin=PATH_FICHIER_DF_FINAL_PROPRE, reconstruire=True):
+    # Renvoie {"X": memmap, "y": memmap, "colonnes": [...], "cible": ..., "partitions": {dep: (debut, fin)}}
+    # (re)construit le store si le dataset final a change, sauf si reconstruire=False
+    if reconstruire and not feature_store_a_jour(chemin):
+        construire_feature_store(chemin)
+
+    with open(PATH_FICHIER_FEATURES_META, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return {"X": np.load(PATH_FICHIER_FEATURES_X, mmap_mode="r"),
+            "y": np.load(PATH_FICHIER_FEATURES_Y, mmap_mode="r"),
+            "colonnes": meta["colonnes"],
+            "cible": meta["cible"],
+            "partitions": {dep: tuple(plage) for dep, plage in meta["partitions"].items()}}
+
+
+def partition(store, code_departement):
+    # Lignes d'un departement : tranche contigue, sans copie
+    debut, fin = store["partitions"][code_departement]
+    return store["X"][debut:fin], store["y"][debut:fin]
+
+
+def iterer_batches(store, taille_batch=TAILLE_BATCH_FEATURES, debut=0, fin=None, partitions=None):
+    # Genere (X, y) par batchs de taille_batch lignes : vues sur le fichier mappe (zero copie)
+    # Soit une plage de lignes [debut, fin), soit une liste de departements (partitions)
+    if partitions is not None:
+        plages = [store["partitions"][dep] for dep in partitions]
+    else:
+        plages = [(debut, store["X"].shape[0] if fin is None else fin)]
+
+    for debut_plage, fin_plage in plages:
+        for i in range(debut_plage, fin_plage, taille_batch):
+            j = min(i + taille_batch, fin_plage)
+            yield store["X"][i:j], store["y"][i:j]
+
+
+if __name__ == "__main__":
+    construire_feature_store()
+    store = ouvrir_feature_store(reconstruire=False)
+    print(f"Feature store : {store['X'].shape[0]} lignes x {store['X'].shape[1]} features -> {PATH_DIR_FEATURE_STORE}")
@@ -0,0 +1,84 @@
+import numpy as np
+import polars as pl
+from scipy.spatial import cKDTree # Structure de donnees qui permet une recherche rapide pour les recherches spatiales (regarder les point proches)
+
+from config import POINT_INTERET, POINT_INTERET_FICHIER, DISTANCE_POINT_INTERET, TAILLE_CHUNK_FEATURES
+
+
+# Definition UNIQUE des features geographiques nb_<poi> / distance_min_<poi>
+#
+# Utilise par :
+#   - le batch (traitement_open_street_map.py -> data_vf_oms.parquet)
+#   - l'API d'enrichissement a la volee (api_enrichissement.py)
+# Comme tout passe par calculer_features_spatiales(), les deux chemins donnent exactement les memes valeurs.
+#
+#   nb_<poi>           : nombre de POI a une distance <= DISTANCE_POINT_INTERET[poi] (en metres, EPSG:2154)
+#   distance_min_<poi> : distance au POI le plus proche dans ce rayon, arrondie au cm, NaN si aucun POI dans le rayon
+
+
+def charger_coordonnees_poi(point_interet_fichier=POINT_INTERET_FICHIER):
+    # Lit uniquement les colonnes x_proj / y_proj des fichiers poi.parquet (pas besoin de GeoPandas ici)
+    # Renvoie {poi_name: matrice (n, 2)} ou None si le fichier est absent / vide
+    coords_dict = {}
+    for poi_name in POINT_INTERET:
+        chemin = point_interet_fichier[poi_name]
+        try:
+            df_poi = pl.read_parquet(chemin, columns=["x_proj", "y_proj"])
+        except (FileNotFoundError, pl.exceptions.ColumnNotFoundError):
+            coords_dict[poi_name] = None
+            continue
+
+        df_poi = df_poi.drop_nulls()
+        coords_dict[poi_name] = df_poi.to_numpy() if df_poi.height > 0 else None
+
+    return coords_dict
+
+
+def construire_kdtrees_depuis_coords(coords_dict):
+    # Un cKDTree par point d'interet (None si pas de POI)
+    return {poi_name: (cKDTree(coords) if coords is not None else None)
+            for poi_name, coords in coords_dict.items()}
+
+
+def calculer_features_spatiales(x, y, kdtree_dict, taille_chunk=TAILLE_CHUNK_FEATURES):
+    # Version vectorisee : calcule les features pour tous les points (x, y) en une fois, par blocs
+    #
+    # ==Input==
+    # x, y : tableaux des coordonnees projetees (EPSG:2154)
+    # kdtree_dict : {poi_name: cKDTree ou None}
+    #
+    # ==Output==
+    # dictionnaire {nom_colonne: tableau numpy}, dans l'ordre nb_<poi>, distance_min_<poi> pour chaque poi
+
+    points = np.column_stack((np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)))
+    valides = np.isfinite(points).all(axis=1)
+    nb_points = len(points)
+
+    features = {}
+    for poi_name, tree in kdtree_dict.items():
+        rayon = DISTANCE_POINT_INTERET[poi_name]
+        nb = np.zeros(nb_points, dtype=np.int64)
+        distance_min = np.full(nb_points, np.nan)
+
+        if tree is not None:
+            for debut in range(0, nb_points, taille_chunk):
+                fin = min(debut + taille_chunk, nb_points)
+                masque = valides[debut:fin]
+                bloc = points[debut:fin][masque]
+                if len(bloc) == 0:
+                    continue
+
+                # query_ball_point compte les POI a distance <= rayon
+                nb_bloc = tree.query_ball_point(bloc, r=rayon, return_length=True)
+
+                # query(k=1) borne strictement par distance_upper_bound : nextafter pour inclure distance == rayon
+                dist_bloc, _ = tree.query(bloc, k=1, distance_upper_bound=np.nextafter(rayon, np.inf))
+                dist_bloc = np.where(np.isfinite(dist_bloc), np.round(dist_bloc, 2), np.nan)
+
+                nb[debut:fin][masque] = nb_bloc
+                distance_min[debut:fin][masque] = dist_bloc
+
+        features["nb_" + str(poi_name)] = nb
+        features["distance_min_" + str(poi_name)] = distance_min #NaN et pas None, polars infere mal sinon
+
+    return features
@@ -0,0 +1,108 @@
+import math
+
+import polars as pl
+
+from config import PRECISION_RELATIVE_SKETCH, MIN_VENTES_SEGMENT
+
+
+# Filtre des valeurs foncieres aberrantes par segment (departement x type_local x annee)
+#
+# Avant (nettoyer_valeur_fonciere) : to_numpy() sur toute la colonne valeur_fonciere puis deux np.quantile globaux :
+# tout le dataset en memoire, et les memes seuils pour un appartement parisien et une maison rurale.
+#
+# Ici les quantiles sont calcules par segment avec un sketch fusionnable (type DDSketch) :
+#   - chaque valeur tombe dans un seau logarithmique : seau = ceil(log(v) / log(gamma)), gamma = (1 + a) / (1 - a)
+#   - le sketch d'un segment = nombre de valeurs par seau. Deux sketchs se fusionnent en additionnant les comptes
+#     (un fichier / une partition a la fois, puis fusionner_sketchs)
+#   - le quantile lu dans le sketch a une erreur relative <= a (PRECISION_RELATIVE_SKETCH)
+#   - le calcul est un group_by Polars en streaming (hors memoire) : seules 4 colonnes sont lues
+# Les seuils (petite table, une ligne par segment) sont ensuite joints au plan : le filtre se fait en une seule passe.
+# Les segments trop petits (< MIN_VENTES_SEGMENT ventes) et les ventes sans segment utilisent les seuils globaux.
+
+
+COLONNES_SEGMENT = ["code_departement", "type_local", "annee_segment"]
+
+
+def _gamma(precision=PRECISION_RELATIVE_SKETCH):
+    return (1 + precision) / (1 - precision)
+
+
+def colonnes_segment():
+    # Expressions des cles de segment (l'annee est deduite de date_mutation)
+    # Nom temporaire annee_segment : la colonne annee du dataset n'est ni ecrasee ni supprimee par le filtre
+    return [pl.col("code_departement"), pl.col("type_local"),
+            pl.col("date_mutation").cast(pl.Date).dt.year().alias("annee_segment")]
+
+
+def calculer_sketch(lf, colonne="valeur_fonciere", precision=PRECISION_RELATIVE_SKETCH):
+    # Sketch par segment : (code_departement, type_local, annee_segment, seau) -> nb
+    # lf : LazyFrame (scan_parquet d'un fichier, d'une liste de fichiers ou d'un motif), ou DataFrame
+    # Les valeurs < 1 sont comptees dans le seau de 1 (sans effet sur les seuils usuels), nulls / NaN ignores
+    valeur = pl.col(colonne).cast(pl.Float64)
+    seau = (valeur.clip(lower_bound=1.0).log() / math.log(_gamma(precision))).ceil().cast(pl.Int32)
+
+    sketch = (lf.lazy()
+                .filter(valeur.is_not_null() & valeur.is_not_nan())
+                .select(colonnes_segment() + [seau.alias("seau")])
+                .group_by(COLONNES_SEGMENT + ["seau"])
+                .agg(pl.len().cast(pl.Int64).alias("nb")))
+    return sketch.collect(engine="streaming")
+
+
+def fusionner_sketchs(sketchs):
+    # Fusion de sketchs calcules separement (partitions, fichiers annuels, ...) : on additionne les comptes par seau
+    return (pl.concat(sketchs, how="vertical")
+              .group_by(COLONNES_SEGMENT + ["seau"])
+              .agg(pl.col("nb").sum()))
+
+
+def _quantiles_sketch(sketch, cles, quantiles, precision):
+    # Quantiles lus dans le sketch (par groupe de cles) : premier seau ou le cumul depasse le rang q * (n - 1)
+    gamma = _gamma(precision)
+    par_groupe = (lambda expr: expr.over(cles)) if cles else (lambda expr: expr)
+    if not cles:
+        sketch = sketch.group_by("seau").agg(pl.col("nb").sum())
+
+    sketch = sketch.sort(cles + ["seau"]).with_columns([
+        par_groupe(pl.col("nb").cum_sum()).alias("cumul"),
+        par_groupe(pl.col("nb").sum()).alias("nb_segment"),
+    ])
+
+    agregations = [pl.col("nb_segment").first()]
+    for nom, q in quantiles.items():
+        # Valeur representative du seau i : 2 * gamma^i / (gamma + 1) (erreur relative <= precision)
+        seau_q = pl.col("seau").filter(pl.col("cumul") > q * (pl.col("nb_segment") - 1)).min()
+        agregations.append((2 * pl.lit(gamma).pow(seau_q) / (gamma + 1)).alias(nom))
+
+    if cles:
+        return sketch.group_by(cles).agg(agregations)
+    return sketch.select(agregations)
+
+
+def seuils_depuis_sketch(sketch, seuil_min_quantile=0.001, seuil_max_quantile=0.999,
+                         precision=PRECISION_RELATIVE_SKETCH, min_ventes_segment=MIN_VENTES_SEGMENT):
+    # Renvoie (table des seuils par segment, seuils globaux {"seuil_min": ..., "seuil_max": ...})
+    quantiles = {"seuil_min": seuil_min_quantile, "seuil_max": seuil_max_quantile}
+
+    seuils_globaux = _quantiles_sketch(sketch, [], quantiles, precision).row(0, named=True)
+    seuils_segments = (_quantiles_sketch(sketch, COLONNES_SEGMENT, quantiles, precision)
+                       .filter(pl.col("nb_segment") >= min_ventes_segment)
+                       .drop("nb_segment"))
+    return seuils_segments, seuils_globaux
+
+
+def filtrer_aberrants(df, seuils_segments, seuils_globaux, seuil_min=None, colonne="valeur_fonciere"):
+    # Filtre en une passe (DataFrame ou LazyFrame) : jointure de la petite table des seuils, puis comparaison
+    # seuil_min : seuil bas fixe (ex : 1000 euros) qui remplace le quantile bas
+    seuils_segments = seuils_segments.rename({"seuil_min": "seuil_min_segment", "seuil_max": "seuil_max_segment"})
+    if isinstance(df, pl.LazyFrame):
+        seuils_segments = seuils_segments.lazy()
+
+    seuil_bas = pl.lit(seuil_min) if seuil_min is not None \
+        else pl.coalesce(pl.col("seuil_min_segment"), pl.lit(seuils_globaux["seuil_min"]))
+    seuil_haut = pl.coalesce(pl.col("seuil_max_segment"), pl.lit(seuils_globaux["seuil_max"]))
+
+    return (df.with_columns(colonnes_segment()[2])
+              .join(seuils_segments, on=COLONNES_SEGMENT, how="left", maintain_order="left")
+              .filter((pl.col(colonne) >= seuil_bas) & (pl.col(colonne) <= seuil_haut))
+              .drop(["annee_segment", "seuil_min_segment", "seuil_max_segment"]))
@@ -3,20 +3,21 @@ import os
 CURRENT_FILE_PATH = Path(__file__).parent.resolve()
 os.chdir(CURRENT_FILE_PATH)
 
-from config import PATH_DIR_DF_FINAL,DISTANCE_POINT_INTERET,PATH_FICHIER_DF_VF_OSM_ECO_INSEE
+from config import DISTANCE_POINT_INTERET,PATH_FICHIER_DF_VF_OSM_ECO_INSEE
+from config import PATH_FICHIER_DF_FINAL_PROPRE, TYPES_LOCAL, TRI_SPATIAL
 import polars as pl
 import matplotlib.pyplot as plt
 import numpy as np
 
-from pyproj import Transformer
+from projection import ajouter_projection
+from referentiel_insee import charger_referentiel_commune
+from filtre_aberrants import calculer_sketch, seuils_depuis_sketch, filtrer_aberrants
+from echantillonnage import ecrire_echantillons
+from tri_spatial import trier_spatialement, ecrire_parquet_spatial
+from imputation import appliquer_imputation, regle_constante, regle_moyenne_groupe, regle_correspondance
 
 
 
-
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-
-
 COLUMN_DISTANCE = ['distance_min_gares','distance_min_commerces',
                    'distance_min_education','distance_min_espaces_verts',
                    'distance_min_sante','distance_min_pharmacies',
@@ -29,135 +30,77 @@ def nombre_valeur_null_par_colonne(df):
     for col in df.columns:
         print(col,':',df[col].null_count())
     
-def reglage_null_colonne_distance(df):
-    for col in COLUMN_DISTANCE:
-        df = df.with_columns([
-        # Indicateur binaire : 1 si null
-        pl.col(col).is_null().cast(pl.Int8).alias(col + "_manquante"),
-    
-        # Remplacement des nulls
-        pl.when(pl.col(col).is_null())
-        .then(DISTANCE_POINT_INTERET[col[len("distances_min"):]])
-        .otherwise(pl.col(col))
-        .alias(col)])
-        
-    return df
-
-
-def reglage_null_revenu_median_commune(df):
-    
-    # Extraire le code département correctement (2 ou 3 chiffres)
-    df = df.with_columns([
-        pl.when(pl.col("code_commune").str.slice(0,2).is_in(["97", "98"]))
-        .then(pl.col("code_commune").str.slice(0,3))
-        .otherwise(pl.col("code_commune").str.slice(0,2))
-        .alias("code_departement_temporaire")
-    ])
+def code_departement_commune():
+    # Code departement deduit du code commune (2 ou 3 chiffres pour l'outre-mer)
+    return (pl.when(pl.col("code_commune").str.slice(0,2).is_in(["97", "98"]))
+            .then(pl.col("code_commune").str.slice(0,3))
+            .otherwise(pl.col("code_commune").str.slice(0,2)))
+
+
+def moyennes_revenu_departement(chemin=PATH_FICHIER_DF_FINAL_PROPRE):
+    # Revenu median moyen par departement sur le dataset d'entrainement (ventes DVF) : {code_departement: moyenne}
+    # Meme moyenne que la regle de nettoyage, mais figee : pour imputer des annonces sans dependre du batch
+    df = (pl.scan_parquet(chemin)
+            .select([code_departement_commune().alias("code_departement"), pl.col("revenu_median_2021_commune")])
+            .group_by("code_departement")
+            .agg(pl.col("revenu_median_2021_commune").mean())
+            .drop_nulls()
+            .collect(engine="streaming"))
+    return dict(zip(df["code_departement"], df["revenu_median_2021_commune"]))
+
+
+def regles_imputation(moyennes_revenu=None):
+    # Toutes les regles de valeurs manquantes, compilees en une seule passe par appliquer_imputation (voir imputation.py)
+    # moyennes_revenu : {code_departement: revenu moyen} fige (scoring, voir moyennes_revenu_departement),
+    # sinon moyenne calculee sur les donnees imputees elles-memes (nettoyage du dataset)
+
+    # Distances : distance de recherche du POI (rien trouve dans le rayon) + indicateur binaire <col>_manquante
+    regles = [regle_constante(col, DISTANCE_POINT_INTERET[col[len("distance_min_"):]], drapeau=True)
+              for col in COLUMN_DISTANCE]
+
+    # Revenu median : moyenne du departement (fenetre, sans table temporaire ni jointure)
+    if moyennes_revenu is None:
+        regles.append(regle_moyenne_groupe("revenu_median_2021_commune", code_departement_commune()))
+    else:
+        regles.append(regle_correspondance("revenu_median_2021_commune", code_departement_commune(), moyennes_revenu))
+
+    # Nombre de menages : données extraites manuellement sur internet (donnée manquante : ville : nbr menage)
+    # Elles sont compilees une fois dans le referentiel INSEE (colonne nb_menages_estime), voir referentiel_insee.py
+    df_donnee_manquante = charger_referentiel_commune().filter(pl.col("nb_menages_estime").is_not_null())
+    regles.append(regle_correspondance("nb_menages_2021_commune", "code_commune",
+                                       dict(zip(df_donnee_manquante["code_commune"], df_donnee_manquante["nb_menages_estime"]))))
+    return regles
 
-    # Calculer la moyenne du revenu_median_2021_commune par département
-    revenu_moyen_dep = (
-        df.group_by("code_departement_temporaire")
-        .agg(pl.col("revenu_median_2021_commune").mean().alias("revenu_median_dep"))
-    )
-
-    # Joindre la moyenne au DataFrame principal
-    df = df.join(revenu_moyen_dep, on="code_departement_temporaire", how="left")
-
-    # Remplacer les nulls dans revenu_median_2021_commune
-    df = df.with_columns([
-        pl.when(pl.col("revenu_median_2021_commune").is_null())
-        .then(pl.col("revenu_median_dep"))
-        .otherwise(pl.col("revenu_median_2021_commune"))
-        .alias("revenu_median_2021_commune")
-    ])
-
-    # Nettoyer : supprimer les colonnes temporaires
-    df = df.drop(["code_departement_temporaire", "revenu_median_dep"])
-    return df
-
-
-def reglage_null_nombre_menage_commune(df):
-    # Données extraites manuellement sur internet (donnée manquante : ville : nbr menage). On a ici le nombre d h'abitant, on divisera par 2.2 (source insee...)
-    data = [
-        ("13215", 14497), ("75115", 227746), ("13207", 12888), ("75120", 189805),
-        ("64541", 310), ("13210", 9619), ("13204", 20094), ("85041", 302),
-        ("75105", 56841), ("75116", 162061), ("75108", 35123), ("13211", 57924),
-        ("13206", 39647), ("85271", 85000), ("75107", 47947), ("75101", 15919),
-        ("75106", 48905), ("13208", 82609), ("49321", 390), ("75103", 32793),
-        ("75114", 136368), ("75104", 28324), ("13202", 23627), ("69382", 30485),
-        ("69384", 35603), ("69381", 29016), ("75119", 181616), ("13213", 92261),
-        ("69385", 48711), ("69152", 10515), ("13205", 45449), ("75111", 142583),
-        ("75117", 164413), ("13209", 77106), ("13212", 20829), ("75118", 188446),
-        ("13203", 53115), ("75112", 140954), ("13216", 15487), ("75110", 95394),
-        ("69386", 52007), ("69383", 101302), ("75102", 21119), ("75109", 58951),
-        ("13214", 59948), ("69387", 85897), ("86231", 478), ("69388", 86326),
-        ("13201", 39436), ("75113", 178350), ("69389", 52903)
-    ]
-
-    df_donnee_manquante = pl.DataFrame({"code_commune": [code for code, _ in data],"population": [pop for _, pop in data]})
-    df_donnee_manquante = df_donnee_manquante.with_columns([(pl.col("population") / 2.2).round(0).cast(pl.Int32).alias("nb_menages_estime")])
-    
-    df = df.join(df_donnee_manquante.select(["code_commune", "nb_menages_estime"]),on="code_commune",how="left")
-    
-    df = df.with_columns([
-        pl.when(pl.col("nb_menages_2021_commune").is_null())
-        .then(pl.col("nb_menages_estime"))
-        .otherwise(pl.col("nb_menages_2021_commune"))
-        .alias("nb_menages_2021_commune")
-    ])
-    
-    df = df.drop("nb_menages_estime")
-    
-    return df
-    
 
 def reglage_null(df):
-    
+    # Fonctionne sur un DataFrame ou sur un LazyFrame (plan unique, voir pipeline_final.py)
+    # Plus d'ecriture ici : le fichier final est ecrit une seule fois a la fin du nettoyage
 
     df = df.filter(pl.col('nature_mutation') == 'Vente')
-    df = reglage_null_colonne_distance(df)
-    df = reglage_null_revenu_median_commune(df)
-    df = reglage_null_nombre_menage_commune(df)
-    df.write_parquet(PATH_DIR_DF_FINAL / "df_final_propre.parquet")
+    df = appliquer_imputation(df, regles_imputation())
     return df
     
 
-def nettoyer_valeur_fonciere(df, seuil_min=None, seuil_max_quantile=0.999, seuil_min_quantile=0.001):
-
-    # Extraire les valeurs
-    valeurs = df.select("valeur_fonciere").to_numpy().flatten()
-    valeurs = valeurs[~np.isnan(valeurs)]
-
-    # Calcul des seuils
-    seuil_max = np.quantile(valeurs, seuil_max_quantile)
-    seuil_min_auto = np.quantile(valeurs, seuil_min_quantile)
-
-    # Utiliser un seuil_min personnalisé si fourni, sinon on prend celui du quantile
-    seuil_min = seuil_min if seuil_min is not None else seuil_min_auto
-
-    print("Seuil 0.001 : ",seuil_min_auto)
-    print("Seuil 0.999 : ",seuil_max)
-
-    # Filtrage dans le DataFrame Polars
-    df = df.filter(
-        (pl.col("valeur_fonciere") >= seuil_min) &
-        (pl.col("valeur_fonciere") <= seuil_max)
-    )
+def nettoyer_valeur_fonciere(df, seuil_min=None, seuil_max_quantile=0.999, seuil_min_quantile=0.001, sketch=None):
+    # Fonctionne sur un DataFrame ou sur un LazyFrame. Renvoie le DataFrame / LazyFrame nettoye, l'ecriture est faite par l'appelant
+    # Seuils par segment departement x type_local x annee, lus dans un sketch de quantiles (voir filtre_aberrants.py)
+    # sketch : sketch deja calcule (ex : sur le fichier d'entree, voir pipeline_final.py), sinon calcule sur df
 
+    if sketch is None:
+        sketch = calculer_sketch(df)
+    seuils_segments, seuils_globaux = seuils_depuis_sketch(sketch, seuil_min_quantile, seuil_max_quantile)
 
+    if isinstance(df, pl.DataFrame):
+        print("Seuil global",seuil_min_quantile,": ",seuils_globaux["seuil_min"])
+        print("Seuil global",seuil_max_quantile,": ",seuils_globaux["seuil_max"])
+        print("Segments avec seuils propres :",seuils_segments.height)
 
+    # Filtrage en une passe (seuil_min personnalise s'il est fourni, sinon le quantile du segment)
+    df = filtrer_aberrants(df, seuils_segments, seuils_globaux, seuil_min=seuil_min)
 
     # Projection des Latitudes/Longitudes Pour pourvoir parler de metres.
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
-    lon = df.select("longitude").cast(pl.Float64).to_numpy().flatten()
-    lat = df.select("latitude").cast(pl.Float64).to_numpy().flatten()
-    x_proj, y_proj = transformer.transform(lon, lat)
-     
-    # On projete
-    df = df.with_columns([
-        pl.Series("x_proj", x_proj),
-        pl.Series("y_proj", y_proj)
-    ])
+    # Deja faite au premier nettoyage : x_proj / y_proj sont transportees, on ne reprojette que si absentes
+    df = ajouter_projection(df)
      
     # On log les valeurs foncieres, parfois bcp trop grand. Peut aider ds des modeles
     df = df.with_columns([
@@ -166,25 +109,27 @@ def nettoyer_valeur_fonciere(df, seuil_min=None, seuil_max_quantile=0.999, seuil
 
 
     # One-Hot Encoding de `type_local` :  Aussi autre : ds decision tree implementer ds sckit learn, pas si performant que sa, considere tt comme des variables continues... donc chaud un peu quand on a des classes
-    type_uniques = df.select("type_local").unique().to_series().to_list()
-    for val in type_uniques:
-        df = df.with_columns([
-            (pl.col("type_local") == val).cast(pl.Int8).alias("type_local__" + str(val))
-        ])
-    
+    # Les categories sont fixes (TYPES_LOCAL, filtre du premier nettoyage) : schema connu a l'avance, meme en LazyFrame
+    df = df.with_columns([
+        (pl.col("type_local") == val).cast(pl.Int8).alias("type_local__" + str(val))
+        for val in TYPES_LOCAL
+    ])
 
-    df.write_parquet(PATH_DIR_DF_FINAL  / "df_final_propre.parquet") # Pouvoir verifier si on a bien gerer les valeurs aberante. On ne supprime pas l'ancien fichier
+    return df
 
 def nettoyage_final():
+    # Version etape par etape (relit df_vf_oms_eco_insee.parquet). Voir pipeline_final.py pour le plan unique sans fichier intermediaire
     df = pl.read_parquet(PATH_FICHIER_DF_VF_OSM_ECO_INSEE)
     df = reglage_null(df)
-    nettoyer_valeur_fonciere(df,seuil_min = 1000)
+    df = nettoyer_valeur_fonciere(df,seuil_min = 1000)
+    if TRI_SPATIAL:
+        df = trier_spatialement(df) # Lectures par zone rapides (voir tri_spatial.py)
+    ecrire_parquet_spatial(df, PATH_FICHIER_DF_FINAL_PROPRE) # Pouvoir verifier si on a bien gerer les valeurs aberante.
     
 
 if __name__ == "__main__":
     nettoyage_final()  
 
     # Pour des raisons d'envoi, nous allons reduire le nombre de ligne du df final propre a 10 000
-    df = pl.read_parquet(PATH_DIR_DF_FINAL  / "df_final_propre.parquet")
-    df_reduit = df.sample(n=10000, with_replacement=False, seed=42)
-    df_reduit.write_parquet(PATH_DIR_DF_FINAL  / "df_final_propre_reduit.parquet")
+    # Echantillon en streaming (sans relire tout le fichier en memoire), deterministe : voir echantillonnage.py
+    ecrire_echantillons()
@@ -13,8 +13,8 @@ os.chdir(CURRENT_FILE_PATH)
 #-----------------------------------------------------------#
 #                      IMPORT  CONSTANTE                    #
 #-----------------------------------------------------------#
-from config import PATH_FICHIER_ECO, PATH_DIR_ECO#Fichier ECO
-from config import PATH_FICHIER_INSEE_DONNEE_COMMUNE,PATH_FICHIER_INSEE_DONNEE_DEPARTEMENT,PATH_DIR_DF_VF_OSM_ECO_INSEE # Fichier INSEE
+from config import PATH_DIR_ECO#Fichier ECO
+from config import PATH_DIR_DF_VF_OSM_ECO_INSEE # Dossier de sortie
 
 from config import PATH_FICHIER_DF_VF_OSM #le fichier df_vf_osm.parquet
 from config import PATH_FICHIER_DF_VF_OSM_ECO_INSEE # fichier de sortie fusion avec donnee eco et insee
@@ -25,71 +25,52 @@ from config import PATH_FICHIER_DF_VF_OSM_ECO_INSEE # fichier de sortie fusion a
 #-----------------------------------------------------------#
 import polars as pl 
 
+from jointure_temporelle import convertir_series_numeriques, jointure_series_mensuelles
+from traitement_economie_global import charger_donnees_eco
+from referentiel_insee import charger_referentiel_commune, charger_referentiel_departement # INSEE precompile (memory-map)
+from referentiel_insee import encoder_code_commune, encoder_code_departement
 
-def fusion_eco():
-    os.makedirs(PATH_DIR_ECO, exist_ok=True)
 
-    df_eco = pl.read_csv(PATH_FICHIER_ECO, separator=";")
-    df_vf = pl.read_parquet(PATH_FICHIER_DF_VF_OSM)
+def aligner_sur(df_petit, df):
+    # Les petites tables (eco, INSEE, ...) sont lues en DataFrame.
+    # Si on construit un plan paresseux (LazyFrame), il faut les passer en LazyFrame pour pouvoir les joindre.
+    return df_petit.lazy() if isinstance(df, pl.LazyFrame) else df_petit
+
 
+def fusion_eco(df_vf=None):
+    # df_vf : DataFrame (ou LazyFrame) a enrichir (doit avoir date_mutation). Par defaut on lit df_vf_oms.parquet
+    # Permet de reutiliser la meme jointure pour d'autres sources (ex : annonces Deferla) ou dans un plan paresseux
+    os.makedirs(PATH_DIR_ECO, exist_ok=True)
 
+    df_eco = charger_donnees_eco() # df_eco.parquet type, reconstruit seulement si les CSV sources ont change
+    if df_vf is None:
+        df_vf = pl.read_parquet(PATH_FICHIER_DF_VF_OSM)
 
-    #Convertir str en float64
 
-    df_eco = df_eco.with_columns([pl.col("Crédits à l'habitat hors renégociations").str.replace(',','.').cast(pl.Float64),
-                                  pl.col('Taux hors renégociations').str.replace(',','.').cast(pl.Float64),
-                                  pl.col("Variations d'encours mensuelles cvs").str.replace(',','.').cast(pl.Float64),
-                                  pl.col("Date").str.strptime(pl.Date, "%Y-%m-%d"),
-                                  pl.col("Date").str.strptime(pl.Date, "%Y-%m-%d").dt.strftime("%Y-%m").alias("year_month")
-                                  ])
 
-    df_vf = df_vf.with_columns([
-        pl.col("date_mutation").dt.strftime("%Y-%m").alias("year_month")
-    ])
+    #Toutes les series en float64 (ajouter une serie mensuelle ne demande pas de changer le code)
+    df_eco = convertir_series_numeriques(df_eco, "Date")
 
-    df_joined = df_vf.join(df_eco, on="year_month", how="left")
-    df_joined = df_joined.drop(["year_month","Date"])
+    # Jointure sur une cle de mois entiere, avec lag et forward-fill (voir jointure_temporelle.py)
+    # Les ventes plus recentes que la derniere publication recuperent la derniere valeur connue (eco_anciennete_mois > 0)
+    df_joined = jointure_series_mensuelles(df_vf, df_eco, colonne_date_df="date_mutation", colonne_date_series="Date")
     
     return df_joined
 
 
 def fusion_insee(df_vf_eco):
-    df_commune = pl.read_csv(PATH_FICHIER_INSEE_DONNEE_COMMUNE, separator=";",
-                             skip_rows=2,schema_overrides={"Code": pl.Utf8},
-                             null_values=["N/A - résultat non disponible"])
-
-    df_commune = df_commune.rename({"Code": "code_commune", 
-                                    "Libellé": "nom_commune", 
-                                    "Nb de ménages 2021": "nb_menages_2021_commune", 
-                                    "Médiane du niveau de vie 2021": "revenu_median_2021_commune"})
-    df_commune = df_commune.with_columns([pl.col("nb_menages_2021_commune").cast(pl.Float64()),
-                                          pl.col("revenu_median_2021_commune").cast(pl.Float64)])
-
-
-
-    df_departement =  pl.read_csv(PATH_FICHIER_INSEE_DONNEE_DEPARTEMENT, separator=";",
-                             skip_rows=2,schema_overrides={"Code": pl.Utf8},
-                             null_values=["N/A - résultat non disponible"])
-
-    df_departement = df_departement.rename({"Code": "code_departement", 
-                                    "Libellé": "nom_departement", 
-                                    "Nb de ménages 2021": "nb_menages_2021_departement", 
-                                    "Médiane du niveau de vie 2021": "revenu_median_2021_departement",
-                                    "Salaire net horaire moyen 2022" : "salaire_net_horaire_moyen_2022_departement",
-                                    "Taux de chômage annuel moyen 2023" : "taux_chomage_2023_departement"})
-    df_departement = df_departement.with_columns([pl.col("nb_menages_2021_departement").cast(pl.Float64()),
-                                          pl.col("revenu_median_2021_departement").cast(pl.Float64),
-                                          pl.col("salaire_net_horaire_moyen_2022_departement").cast(pl.Float64),
-                                          pl.col("taux_chomage_2023_departement").cast(pl.Float64)])
-
-
+    # Les tables INSEE sont lues depuis le referentiel precompile (Arrow IPC en memory-map, pas de parsing CSV)
+    # Jointures sur des cles entieres compactes (cle_commune / cle_departement) plutot que sur des chaines
+    df_commune = charger_referentiel_commune().select(["cle_commune", "nb_menages_2021_commune", "revenu_median_2021_commune"])
+    df_departement = charger_referentiel_departement().drop("code_departement")
 
-    df_vf_eco = df_vf_eco.join(df_commune, on="code_commune", how="left")
-    df_vf_eco = df_vf_eco.join(df_departement, on="code_departement", how = "left")
+    df_vf_eco = df_vf_eco.with_columns([encoder_code_commune(pl.col("code_commune")).alias("cle_commune"),
+                                        encoder_code_departement(pl.col("code_departement")).alias("cle_departement")])
 
+    df_vf_eco = df_vf_eco.join(aligner_sur(df_commune, df_vf_eco), on="cle_commune", how="left")
+    df_vf_eco = df_vf_eco.join(aligner_sur(df_departement, df_vf_eco), on="cle_departement", how = "left")
 
-    df_vf_eco = df_vf_eco.drop('nom_commune_right')
-    return df_vf_eco
+    return df_vf_eco.drop(["cle_commune", "cle_departement"])
 
 
 def fusion_total():
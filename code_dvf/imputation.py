@@ -0,0 +1,81 @@
+import polars as pl
+
+
+# Moteur d'imputation des valeurs manquantes : les regles sont declarees, puis compilees en UN SEUL with_columns
+#
+# Avant (fin_nettoyage.py) : un with_columns par colonne de distance, une colonne departement temporaire + group_by + join
+# pour le revenu median, un autre join pour le nombre de menages : chaque etape recopiait tout le dataset.
+# Ici :
+#   - chaque regle est une expression Polars (remplissage constant, moyenne par groupe en fenetre .over(), table de correspondance)
+#   - toutes les expressions sont evaluees dans une seule passe (elles ne lisent que les colonnes d'origine)
+#   - fonctionne sur un DataFrame ou sur un LazyFrame (plan unique, voir pipeline_final.py)
+#
+# Une valeur est "manquante" si elle est nulle, ou NaN pour une colonne flottante
+# (les features spatiales valent NaN quand aucun POI n'est dans le rayon, voir features_spatiales.py).
+#
+# Exemple :
+#   >>> regles = [regle_constante("distance_min_gares", 1500, drapeau=True),
+#   ...           regle_moyenne_groupe("revenu_median_2021_commune", pl.col("code_commune").str.slice(0, 2)),
+#   ...           regle_correspondance("nb_menages_2021_commune", "code_commune", {"75115": 103521})]
+#   >>> df = appliquer_imputation(df, regles)
+
+
+SUFFIXE_DRAPEAU = "_manquante"
+
+
+def regle_constante(colonne, valeur, drapeau=False):
+    # Remplace les manquants par une constante
+    return {"colonne": colonne, "remplacement": lambda manquant: pl.lit(valeur), "drapeau": drapeau}
+
+
+def regle_moyenne_groupe(colonne, groupe, drapeau=False):
+    # Remplace les manquants par la moyenne de la colonne dans le groupe (groupe : nom de colonne ou expression)
+    # Fenetre .over() : pas de table intermediaire ni de jointure
+    return {"colonne": colonne,
+            "remplacement": lambda manquant: pl.col(colonne).filter(~manquant).mean().over(groupe),
+            "drapeau": drapeau}
+
+
+def regle_correspondance(colonne, colonne_cle, correspondance, drapeau=False):
+    # Remplace les manquants par la valeur associee a colonne_cle dans le dictionnaire correspondance
+    # (colonne_cle : nom de colonne ou expression ; cle absente du dictionnaire -> reste manquant)
+    cle = pl.col(colonne_cle) if isinstance(colonne_cle, str) else colonne_cle
+    return {"colonne": colonne,
+            "remplacement": lambda manquant: cle.replace_strict(correspondance, default=None, return_dtype=pl.Float64),
+            "drapeau": drapeau}
+
+
+def _expression_manquant(colonne, dtype):
+    manquant = pl.col(colonne).is_null()
+    if dtype.is_float():
+        manquant = manquant | pl.col(colonne).is_nan()
+    return manquant
+
+
+def compiler_regles(regles, schema):
+    # Regles -> liste d'expressions (colonnes imputees puis drapeaux), a passer a un seul with_columns
+    # Plusieurs regles sur la meme colonne sont enchainees dans l'ordre (la premiere qui trouve une valeur gagne)
+    remplacements, drapeaux = {}, {}
+    for regle in regles:
+        colonne = regle["colonne"]
+        manquant = _expression_manquant(colonne, schema[colonne])
+        remplacements.setdefault(colonne, []).append(regle["remplacement"](manquant))
+
+        if regle["drapeau"]:
+            # Indicateur binaire : 1 si la valeur d'origine etait manquante
+            drapeaux[colonne + SUFFIXE_DRAPEAU] = manquant.cast(pl.Int8)
+
+    expressions = [
+        pl.when(_expression_manquant(colonne, schema[colonne]))
+        .then(pl.coalesce(liste) if len(liste) > 1 else liste[0])
+        .otherwise(pl.col(colonne))
+        .cast(schema[colonne])
+        .alias(colonne)
+        for colonne, liste in remplacements.items()
+    ]
+    return expressions + [expr.alias(nom) for nom, expr in drapeaux.items()]
+
+
+def appliquer_imputation(df, regles):
+    # Une seule passe sur les donnees, quel que soit le nombre de regles
+    return df.with_columns(compiler_regles(regles, df.collect_schema()))
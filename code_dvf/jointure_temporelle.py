@@ -0,0 +1,91 @@
+import datetime
+
+import polars as pl
+
+from config import LAG_MOIS_ECO, FFILL_MAX_MOIS_ECO
+
+
+# Jointure temporelle "as-of" des series mensuelles (indicateurs macro-economiques) sur les ventes
+#
+# Avant : jointure sur une chaine "YYYY-MM" (strftime sur des millions de lignes, des deux cotes)
+# et les ventes plus recentes que la derniere publication Banque de France recuperaient des nulls sans prevenir.
+#
+# Ici :
+#   - cle de jointure entiere : cle_mois = annee * 12 + (mois - 1)  (Int32, pas de formatage de chaine)
+#   - la petite table des series est etendue en calendrier mensuel complet, decalee de lag_mois
+#     (valeur connue au moment de la vente) puis completee vers l'avant (forward-fill, limite ffill_max_mois).
+#     La jointure devient une simple jointure d'egalite sur un entier, avec une table de quelques centaines de lignes
+#     (diffusee a chaque morceau du gros dataset, pas de tri du gros dataset comme un join_asof)
+#   - toutes les colonnes de la table des series sont jointes : ajouter une serie mensuelle = ajouter une colonne
+#   - colonne eco_anciennete_mois : age (en mois) de la plus ancienne observation utilisee, pour reperer les valeurs
+#     prolongees (en fin de serie comme dans un trou au milieu d'une serie)
+
+
+COLONNE_CLE_MOIS = "cle_mois"
+
+
+def cle_mois(expr_date):
+    # Expression Polars : date -> entier (annee * 12 + mois - 1)
+    return (expr_date.dt.year().cast(pl.Int32) * 12 + expr_date.dt.month().cast(pl.Int32) - 1).alias(COLONNE_CLE_MOIS)
+
+
+def convertir_series_numeriques(df_series, colonne_date="Date"):
+    # Toutes les colonnes autres que la date sont des series numeriques.
+    # Les CSV Banque de France ont des virgules decimales : on les convertit si la colonne est en texte
+    return df_series.with_columns([
+        pl.col(col).str.replace(",", ".").cast(pl.Float64) if dtype == pl.Utf8 else pl.col(col).cast(pl.Float64)
+        for col, dtype in df_series.schema.items() if col != colonne_date
+    ])
+
+
+def preparer_calendrier_series(df_series, colonne_date="Date", lag_mois=LAG_MOIS_ECO,
+                               ffill_max_mois=FFILL_MAX_MOIS_ECO, date_max=None):
+    # Construit la table de jointure : une ligne par mois (cle_mois), de la premiere observation (+ lag) jusqu'a date_max
+    # (par defaut le mois courant : aucune vente ne peut etre plus recente)
+    date_max = date_max or datetime.date.today()
+    colonnes_series = [col for col in df_series.columns if col != colonne_date]
+
+    df_series = df_series.with_columns(pl.col(colonne_date).cast(pl.Date))
+    # Mois de publication de chaque valeur, par serie (null si la serie n'a pas de valeur ce mois-la) :
+    # apres le forward-fill, donne le mois de la valeur reellement utilisee, y compris pour un trou au milieu d'une serie
+    sources = {col: f"cle_mois_source_{i}" for i, col in enumerate(colonnes_series)}
+    df_series = (df_series
+                 .with_columns((cle_mois(pl.col(colonne_date)) + lag_mois).alias(COLONNE_CLE_MOIS))
+                 .with_columns([pl.when(pl.col(col).is_not_null()).then(pl.col(COLONNE_CLE_MOIS)).alias(source)
+                                for col, source in sources.items()])
+                 .drop(colonne_date)
+                 .unique(subset=[COLONNE_CLE_MOIS], keep="last")
+                 .sort(COLONNE_CLE_MOIS))
+
+    premiere_cle = df_series[COLONNE_CLE_MOIS].min()
+    derniere_cle = max(date_max.year * 12 + date_max.month - 1, df_series[COLONNE_CLE_MOIS].max())
+    calendrier = pl.DataFrame({COLONNE_CLE_MOIS: pl.int_range(premiere_cle, derniere_cle + 1, dtype=pl.Int32, eager=True)})
+
+    calendrier = calendrier.join(df_series, on=COLONNE_CLE_MOIS, how="left").sort(COLONNE_CLE_MOIS)
+    calendrier = calendrier.with_columns([
+        pl.col(col).forward_fill(limit=ffill_max_mois) for col in colonnes_series + list(sources.values())
+    ])
+
+    # Anciennete de l'observation la plus ancienne utilisee, toutes series confondues (0 = publiee pour ce mois,
+    # avec le lag ; null si aucune serie n'a de valeur)
+    return calendrier.with_columns(
+        pl.max_horizontal([pl.col(COLONNE_CLE_MOIS) - pl.col(source) for source in sources.values()])
+        .alias("eco_anciennete_mois")
+    ).drop(list(sources.values()))
+
+
+def jointure_series_mensuelles(df, df_series, colonne_date_df="date_mutation", colonne_date_series="Date",
+                               lag_mois=LAG_MOIS_ECO, ffill_max_mois=FFILL_MAX_MOIS_ECO):
+    # Joint les series mensuelles sur df (DataFrame ou LazyFrame) par cle de mois entiere
+    calendrier = preparer_calendrier_series(df_series, colonne_date_series, lag_mois, ffill_max_mois)
+    return joindre_calendrier(df, calendrier, colonne_date_df)
+
+
+def joindre_calendrier(df, calendrier, colonne_date_df="date_mutation"):
+    # Jointure d'un calendrier deja prepare (preparer_calendrier_series) : utile pour un service qui le garde en memoire
+    if isinstance(df, pl.LazyFrame):
+        calendrier = calendrier.lazy()
+
+    return (df.with_columns(cle_mois(pl.col(colonne_date_df)))
+              .join(calendrier, on=COLONNE_CLE_MOIS, how="left")
+              .drop(COLONNE_CLE_MOIS))
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_FICHIER_DF_VF_OSM, PATH_FICHIER_DF_VF_OSM_ECO_INSEE, PATH_DIR_DF_VF_OSM_ECO_INSEE
+from config import PATH_FICHIER_DF_FINAL_PROPRE, PATH_DIR_DF_FINAL, TRI_SPATIAL, VENTES_COMPARABLES_PIPELINE
+
+import polars as pl
+
+from fusion_vf_eco_insee import fusion_eco, fusion_insee
+from fin_nettoyage import reglage_null, nettoyer_valeur_fonciere
+from filtre_aberrants import calculer_sketch
+from tri_spatial import trier_spatialement, ecrire_parquet_spatial
+from ventes_comparables import rajout_ventes_comparables, ventes_comparables_a_calculer
+
+
+# Pipeline "plan unique" : de df_vf_oms.parquet jusqu'a df_final_propre.parquet
+#
+# Avant (fusion_vf_eco_insee.py puis fin_nettoyage.py) le dataset national etait reecrit plusieurs fois :
+#   data_vf_oms.parquet -> df_vf_oms_eco_insee.parquet -> df_final_propre.parquet (ecrit 2 fois)
+#
+# Ici on construit UN SEUL plan Polars paresseux (LazyFrame) :
+#   (ventes comparables si absentes) -> scan_parquet -> fusion_eco -> fusion_insee -> reglage_null -> nettoyer_valeur_fonciere -> sink_parquet
+# Polars optimise le tout (projection / predicate pushdown, ex : le filtre 'Vente' est fait des la lecture)
+# et le fichier final est ecrit une seule fois.
+#
+# Les fichiers intermediaires ne sont ecrits que sur demande (ecrire_intermediaires=True), pour debugger.
+
+
+def construire_plan_final(chemin_entree=PATH_FICHIER_DF_VF_OSM):
+    # Renvoie (plan fusionne, plan final). Seul le sketch des quantiles est calcule ici (petite table)
+    lf = pl.scan_parquet(chemin_entree)
+    lf_fusion = fusion_insee(fusion_eco(lf))
+
+    # Sketch des quantiles par segment calcule directement sur le fichier d'entree (4 colonnes, group_by en streaming) :
+    # les jointures eco / INSEE ne changent pas les lignes, seul le filtre 'Vente' de reglage_null est a reproduire
+    sketch = calculer_sketch(lf.filter(pl.col('nature_mutation') == 'Vente'))
+    lf_final = nettoyer_valeur_fonciere(reglage_null(lf_fusion), seuil_min=1000, sketch=sketch)
+
+    # Les jointures ne garantissent pas l'ordre des lignes : on retrie le dataset final par cle de Hilbert
+    if TRI_SPATIAL:
+        lf_final = trier_spatialement(lf_final)
+    return lf_fusion, lf_final
+
+
+def executer_pipeline_final(chemin_entree=PATH_FICHIER_DF_VF_OSM, chemin_sortie=PATH_FICHIER_DF_FINAL_PROPRE,
+                            ecrire_intermediaires=False):
+    # Les ventes comparables font partie des features : ajoutees au fichier d'entree si ventes_comparables.py n'a pas tourne
+    # (calcul par departement, hors du plan paresseux : il lit les ventes voisines de chaque vente)
+    if VENTES_COMPARABLES_PIPELINE and ventes_comparables_a_calculer(chemin_entree):
+        rajout_ventes_comparables(chemin_entree)
+
+    lf_fusion, lf_final = construire_plan_final(chemin_entree)
+
+    if ecrire_intermediaires:
+        # Debug uniquement : on materialise l'etape fusion (comme fusion_vf_eco_insee.py)
+        os.makedirs(PATH_DIR_DF_VF_OSM_ECO_INSEE, exist_ok=True)
+        lf_fusion.sink_parquet(PATH_FICHIER_DF_VF_OSM_ECO_INSEE)
+
+    os.makedirs(PATH_DIR_DF_FINAL, exist_ok=True)
+    ecrire_parquet_spatial(lf_final, chemin_sortie)
+
+
+if __name__ == "__main__":
+    print("Pipeline final (fusion ECO + INSEE + nettoyage) en plan unique...")
+    executer_pipeline_final()
+    print("==== FIN ---")
@@ -0,0 +1,89 @@
+from functools import lru_cache
+
+import numpy as np
+import polars as pl
+from pyproj import Transformer # Pour projeter des coordonnees geographiques (lat/lon devient  x/y en metres)
+
+from config import PROJECTION_EPSG_INITIAL, PROJECTION_EPSG_FINAL, TAILLE_CHUNK_PROJECTION
+
+
+# Module unique de projection EPSG:4326 (lat/lon en degres) -> EPSG:2154 (Lambert-93 en metres)
+#
+# Avant : chaque etape (enrichissement OSM, extraction des POI, nettoyage final) recreait son propre Transformer
+# et reprojetait les memes millions de points. Ici :
+#   - le Transformer est construit une seule fois par couple de projection (cache)
+#   - la projection est vectorisee et faite par blocs (chunk) pour garder une memoire bornee
+#   - les colonnes x_proj / y_proj sont calculees une seule fois au premier nettoyage puis transportees
+#     dans le pipeline : ajouter_projection() ne reprojette pas si elles existent deja.
+
+
+@lru_cache(maxsize=None)
+def obtenir_transformer(epsg_source=PROJECTION_EPSG_INITIAL, epsg_cible=PROJECTION_EPSG_FINAL):
+    # Construire un Transformer est couteux (lecture de la base proj), on le garde en cache
+    # always_xy=True : on donne toujours (lon, lat) et on recupere (x, y)
+    return Transformer.from_crs(epsg_source, epsg_cible, always_xy=True)
+
+
+def projeter_lon_lat(lon, lat, taille_chunk=TAILLE_CHUNK_PROJECTION):
+    # Projette deux tableaux lon/lat (degres) en x/y (metres), par blocs de taille_chunk
+    # Renvoie deux tableaux numpy float64 (NaN si la coordonnee d'entree est manquante)
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    transformer = obtenir_transformer()
+    x_proj = np.empty_like(lon)
+    y_proj = np.empty_like(lat)
+
+    for debut in range(0, len(lon), taille_chunk):
+        fin = debut + taille_chunk
+        x_proj[debut:fin], y_proj[debut:fin] = transformer.transform(lon[debut:fin], lat[debut:fin])
+
+    # pyproj renvoie inf pour les entrees invalides, on harmonise en NaN
+    x_proj[~np.isfinite(x_proj)] = np.nan
+    y_proj[~np.isfinite(y_proj)] = np.nan
+    return x_proj, y_proj
+
+
+def projeter_coordonnees_shapely(geometries):
+    # Projette un tableau de geometries shapely (Point / LineString / Polygon) avec le Transformer en cache
+    # Remplace le GeoDataFrame.to_crs() qui reconstruisait un Transformer a chaque appel
+    import shapely
+
+    def _transformer_coords(coords):
+        x_proj, y_proj = projeter_lon_lat(coords[:, 0], coords[:, 1])
+        return np.column_stack((x_proj, y_proj))
+
+    return shapely.transform(np.asarray(geometries), _transformer_coords)
+
+
+def _projeter_struct(struct_lon_lat):
+    # Utilise dans un plan Polars paresseux (LazyFrame) : Series struct(longitude, latitude) -> struct(x_proj, y_proj)
+    x_proj, y_proj = projeter_lon_lat(struct_lon_lat.struct.field("longitude").cast(pl.Float64).to_numpy(),
+                                      struct_lon_lat.struct.field("latitude").cast(pl.Float64).to_numpy())
+    return pl.DataFrame({"x_proj": x_proj, "y_proj": y_proj}).to_struct("proj")
+
+
+def ajouter_projection(df, forcer=False):
+    # Ajoute x_proj / y_proj a un DataFrame (ou LazyFrame) Polars (latitude / longitude)
+    # Si les colonnes existent deja (calculees au premier nettoyage), on ne reprojette pas
+    colonnes = df.collect_schema().names() if isinstance(df, pl.LazyFrame) else df.columns
+    if not forcer and "x_proj" in colonnes and "y_proj" in colonnes:
+        return df
+
+    if isinstance(df, pl.LazyFrame):
+        if "x_proj" in colonnes and "y_proj" in colonnes:
+            df = df.drop(["x_proj", "y_proj"])
+        return df.with_columns(
+            pl.struct(["longitude", "latitude"])
+            .map_batches(_projeter_struct, return_dtype=pl.Struct({"x_proj": pl.Float64, "y_proj": pl.Float64}))
+            .alias("proj")
+        ).unnest("proj")
+
+    lon = df["longitude"].cast(pl.Float64).to_numpy()
+    lat = df["latitude"].cast(pl.Float64).to_numpy()
+    x_proj, y_proj = projeter_lon_lat(lon, lat)
+
+    return df.with_columns([
+        pl.Series("x_proj", x_proj),
+        pl.Series("y_proj", y_proj)
+    ])
@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_FICHIER_INSEE_DONNEE_COMMUNE, PATH_FICHIER_INSEE_DONNEE_DEPARTEMENT
+from config import PATH_DIR_REFERENTIEL, PATH_FICHIER_REFERENTIEL_COMMUNE, PATH_FICHIER_REFERENTIEL_DEPARTEMENT
+from config import PATH_FICHIER_REFERENTIEL_EMPREINTE
+
+import polars as pl
+import pyarrow as pa
+
+
+# Referentiel INSEE precompile (communes / departements) au format Arrow IPC non compresse
+#
+# Avant : chaque execution relisait et re-parsait les CSV INSEE (skip_rows, renommage, cast) et
+# reglage_null_nombre_menage_commune reconstruisait a la main le DataFrame des communes manquantes.
+# Ici :
+#   - les CSV et les corrections manuelles sont compiles UNE fois en tables typees (.arrow)
+#   - recompilation seulement si un CSV source (ou les corrections) change
+#   - les cles de jointure sont des entiers compacts (cle_commune UInt32, cle_departement UInt16) :
+#     jointures entieres au lieu de jointures sur des chaines
+#   - lecture en memory-map (pyarrow.memory_map) : pas de parsing ni de copie, pages partagees entre processus
+#
+# Utilise par fusion_vf_eco_insee.py, fin_nettoyage.py (menages manquants), l'API d'enrichissement
+# et le chargement de la base de donnees : code_db/dvf_database.py lit les fichiers compiles avec lire_ipc_memory_map pour
+# remplir les tables departements / communes (il ne recompile pas : lancer ce script apres un changement des CSV).
+
+
+# Donnees extraites manuellement sur internet (donnee manquante : ville : nbr menage).
+# On a ici le nombre d'habitants, on divisera par 2.2 (source insee...)
+POPULATION_COMMUNES_MANQUANTES = [
+    ("13215", 14497), ("75115", 227746), ("13207", 12888), ("75120", 189805),
+    ("64541", 310), ("13210", 9619), ("13204", 20094), ("85041", 302),
+    ("75105", 56841), ("75116", 162061), ("75108", 35123), ("13211", 57924),
+    ("13206", 39647), ("85271", 85000), ("75107", 47947), ("75101", 15919),
+    ("75106", 48905), ("13208", 82609), ("49321", 390), ("75103", 32793),
+    ("75114", 136368), ("75104", 28324), ("13202", 23627), ("69382", 30485),
+    ("69384", 35603), ("69381", 29016), ("75119", 181616), ("13213", 92261),
+    ("69385", 48711), ("69152", 10515), ("13205", 45449), ("75111", 142583),
+    ("75117", 164413), ("13209", 77106), ("13212", 20829), ("75118", 188446),
+    ("13203", 53115), ("75112", 140954), ("13216", 15487), ("75110", 95394),
+    ("69386", 52007), ("69383", 101302), ("75102", 21119), ("75109", 58951),
+    ("13214", 59948), ("69387", 85897), ("86231", 478), ("69388", 86326),
+    ("13201", 39436), ("75113", 178350), ("69389", 52903)
+]
+NB_PERSONNES_PAR_MENAGE = 2.2
+
+
+def encoder_code_commune(expr):
+    # Code commune INSEE (texte, ex : "75115", "2A004", "97101") -> entier UInt32
+    # Corse : "2A..." -> 100000 + 20..., "2B..." -> 200000 + 20... (le departement 20 n'existe plus, pas de collision)
+    decalage = (pl.when(expr.str.starts_with("2A")).then(100000)
+                .when(expr.str.starts_with("2B")).then(200000)
+                .otherwise(0))
+    numero = expr.str.replace(r"^2[AB]", "20").cast(pl.UInt32, strict=False)
+    return (numero + decalage).cast(pl.UInt32)
+
+
+def encoder_code_departement(expr):
+    # Code departement ("01", "2A", "971") -> entier UInt16 ("2A" -> 1020, "2B" -> 2020)
+    decalage = (pl.when(expr == "2A").then(1000)
+                .when(expr == "2B").then(2000)
+                .otherwise(0))
+    numero = expr.str.replace(r"^2[AB]$", "20").cast(pl.UInt16, strict=False)
+    return (numero + decalage).cast(pl.UInt16)
+
+
+def _lire_csv_insee(chemin):
+    return pl.read_csv(chemin, separator=";", skip_rows=2, schema_overrides={"Code": pl.Utf8},
+                       null_values=["N/A - résultat non disponible"])
+
+
+def compiler_commune():
+    df_commune = _lire_csv_insee(PATH_FICHIER_INSEE_DONNEE_COMMUNE)
+    df_commune = df_commune.rename({"Code": "code_commune",
+                                    "Libellé": "nom_commune",
+                                    "Nb de ménages 2021": "nb_menages_2021_commune",
+                                    "Médiane du niveau de vie 2021": "revenu_median_2021_commune"})
+    df_commune = df_commune.with_columns([pl.col("nb_menages_2021_commune").cast(pl.Float64),
+                                          pl.col("revenu_median_2021_commune").cast(pl.Float64)])
+
+    # Corrections manuelles : nombre de menages estime (arrondissements de Paris / Lyon / Marseille, ...)
+    df_corrections = pl.DataFrame({"code_commune": [code for code, _ in POPULATION_COMMUNES_MANQUANTES],
+                                   "population": [pop for _, pop in POPULATION_COMMUNES_MANQUANTES]})
+    df_corrections = df_corrections.select([
+        "code_commune",
+        (pl.col("population") / NB_PERSONNES_PAR_MENAGE).round(0).cast(pl.Int32).alias("nb_menages_estime")
+    ])
+
+    df_commune = df_commune.join(df_corrections, on="code_commune", how="full", coalesce=True)
+    return df_commune.with_columns(encoder_code_commune(pl.col("code_commune")).alias("cle_commune")).sort("cle_commune")
+
+
+def compiler_departement():
+    df_departement = _lire_csv_insee(PATH_FICHIER_INSEE_DONNEE_DEPARTEMENT)
+    df_departement = df_departement.rename({"Code": "code_departement",
+                                            "Libellé": "nom_departement",
+                                            "Nb de ménages 2021": "nb_menages_2021_departement",
+                                            "Médiane du niveau de vie 2021": "revenu_median_2021_departement",
+                                            "Salaire net horaire moyen 2022": "salaire_net_horaire_moyen_2022_departement",
+                                            "Taux de chômage annuel moyen 2023": "taux_chomage_2023_departement"})
+    df_departement = df_departement.with_columns([pl.col("nb_menages_2021_departement").cast(pl.Float64),
+                                                  pl.col("revenu_median_2021_departement").cast(pl.Float64),
+                                                  pl.col("salaire_net_horaire_moyen_2022_departement").cast(pl.Float64),
+                                                  pl.col("taux_chomage_2023_departement").cast(pl.Float64)])
+    return df_departement.with_columns(encoder_code_departement(pl.col("code_departement")).alias("cle_departement")).sort("cle_departement")
+
+
+def empreinte_sources():
+    # sha256 des CSV + des corrections manuelles : si rien ne change, on ne recompile pas
+    empreintes = {"corrections": hashlib.sha256(repr((POPULATION_COMMUNES_MANQUANTES, NB_PERSONNES_PAR_MENAGE)).encode()).hexdigest()}
+    for chemin in (PATH_FICHIER_INSEE_DONNEE_COMMUNE, PATH_FICHIER_INSEE_DONNEE_DEPARTEMENT):
+        with open(chemin, "rb") as f:
+            empreintes[Path(chemin).name] = hashlib.sha256(f.read()).hexdigest()
+    return empreintes
+
+
+def compiler_referentiel(forcer=False):
+    # Compile les tables en Arrow IPC non compresse (memory-mappable). Renvoie True si recompile.
+    empreintes = empreinte_sources()
+    fichiers = (PATH_FICHIER_REFERENTIEL_COMMUNE, PATH_FICHIER_REFERENTIEL_DEPARTEMENT, PATH_FICHIER_REFERENTIEL_EMPREINTE)
+
+    if not forcer and all(Path(f).exists() for f in fichiers):
+        with open(PATH_FICHIER_REFERENTIEL_EMPREINTE, "r", encoding="utf-8") as f:
+            if json.load(f) == empreintes:
+                return False
+
+    os.makedirs(PATH_DIR_REFERENTIEL, exist_ok=True)
+    compiler_commune().write_ipc(PATH_FICHIER_REFERENTIEL_COMMUNE, compression="uncompressed")
+    compiler_departement().write_ipc(PATH_FICHIER_REFERENTIEL_DEPARTEMENT, compression="uncompressed")
+    with open(PATH_FICHIER_REFERENTIEL_EMPREINTE, "w", encoding="utf-8") as f:
+        json.dump(empreintes, f, indent=2)
+    return True
+
+
+def lire_ipc_memory_map(chemin):
+    # Lecture zero-copie d'un fichier Arrow IPC non compresse : les buffers pointent directement dans le fichier mappe
+    with pa.memory_map(str(chemin), "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return pl.from_arrow(table, rechunk=False)
+
+
+def charger_referentiel_commune():
+    # Table des communes (memory-map, pas de parsing) : cle_commune, code_commune, nom_commune,
+    # nb_menages_2021_commune, revenu_median_2021_commune, nb_menages_estime
+    compiler_referentiel()
+    return lire_ipc_memory_map(PATH_FICHIER_REFERENTIEL_COMMUNE)
+
+
+def charger_referentiel_departement():
+    # Table des departements (memory-map) : cle_departement, code_departement, nom_departement, indicateurs INSEE
+    compiler_referentiel()
+    return lire_ipc_memory_map(PATH_FICHIER_REFERENTIEL_DEPARTEMENT)
+
+
+if __name__ == "__main__":
+    if compiler_referentiel(forcer=True):
+        print(f"Referentiel INSEE compile dans {PATH_DIR_REFERENTIEL}")
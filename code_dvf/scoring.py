@@ -0,0 +1,148 @@
+import os
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_FICHIER_MODELE, PATH_DB_DEFERLA, TABLE_ANNONCES_SCOREES, TYPES_LOCAL
+from config import TAILLE_BATCH_SCORING, BUDGET_LATENCE_P99_MS, NB_LATENCES_SUIVIES
+
+import datetime
+import time
+from collections import deque
+
+import joblib
+import numpy as np
+import polars as pl
+
+from api_enrichissement import EnrichisseurSpatial
+from enrichissement_deferla import charger_annonces_json, charger_annonces_db, preparer_colonnes_dvf
+from enrichissement_deferla import construire_index_communes, rattacher_code_commune, ecrire_table_sqlite
+from traitement_economie_global import charger_donnees_eco
+from jointure_temporelle import convertir_series_numeriques, preparer_calendrier_series, joindre_calendrier
+from imputation import appliquer_imputation
+from fin_nettoyage import regles_imputation, moyennes_revenu_departement
+from entrainement import construire_matrice
+from clusters_geographiques import charger_clusters, ajouter_geo_cluster
+
+
+# Scoring du prix des annonces (Deferla, ou toute annonce avec latitude / longitude / surface / type)
+#
+# Le modele (entrainement.py) et tous les index sont charges UNE fois a la creation du service :
+#   - KD-Tree des POI + referentiel INSEE (EnrichisseurSpatial)
+#   - KD-Tree des ventes DVF pour retrouver le code commune, calendrier des series eco, regles d'imputation
+#     (moyennes par departement figees sur le dataset d'entrainement),
+#     centroides des clusters geographiques
+# Chaque appel ne fait ensuite que des operations vectorisees (projection, requetes KD-Tree, jointures sur de petites
+# tables, une multiplication de matrices) sur tout le batch d'annonces.
+#
+# Deux modes :
+#   - catalogue (scorer_catalogue) : toutes les annonces par batchs de TAILLE_BATCH_SCORING, debit en annonces / s
+#   - unitaire (scorer_annonce) : une annonce, latence suivie (p50 / p99) et comparee a BUDGET_LATENCE_P99_MS
+#
+# Exemple :
+#   >>> service = ServiceScoring()
+#   >>> service.scorer_annonce({"latitude": 48.85, "longitude": 2.35, "surface": 45, "type": "Appartement",
+#   ...                         "code_postal": "75011"})
+#   >>> service.metriques()
+
+
+class ServiceScoring:
+
+    def __init__(self, chemin_modele=PATH_FICHIER_MODELE, enrichisseur=None):
+        debut = time.perf_counter()
+        modele = joblib.load(chemin_modele)
+        self.scaler, self.nb_clusters, self.modele = modele["scaler"], modele["nb_clusters"], modele["modele"]
+        self.colonnes = modele["colonnes"]
+
+        self.enrichisseur = enrichisseur or EnrichisseurSpatial()
+        self.index_communes = construire_index_communes()
+        self.calendrier_eco = preparer_calendrier_series(convertir_series_numeriques(charger_donnees_eco()))
+        # Moyennes de revenu par departement figees au demarrage (dataset d'entrainement) : la prediction d'une
+        # annonce ne depend pas des autres annonces du batch, unitaire et catalogue donnent le meme resultat
+        self.regles = regles_imputation(moyennes_revenu_departement())
+        self.centroides = charger_clusters()
+
+        self.latences_ms = deque(maxlen=NB_LATENCES_SUIVIES)
+        self.duree_chargement = time.perf_counter() - debut
+
+        # Appel a vide : caches (pyproj, Polars) chauds avant la premiere vraie requete
+        self.scorer(pl.DataFrame({"latitude": [48.8566], "longitude": [2.3522], "surface": [50.0],
+                                  "type": ["Appartement"], "code_postal": ["75001"]}))
+
+    def construire_features(self, df_annonces):
+        # Annonces -> (DataFrame enrichi, matrice float32 dans l'ordre des colonnes du modele)
+        df = df_annonces.filter(pl.col("latitude").is_not_null() & pl.col("longitude").is_not_null())
+        for col, dtype in {"id": pl.Utf8, "date_publication": pl.Utf8, "prix": pl.Float64, "ville": pl.Utf8}.items():
+            if col not in df.columns:
+                df = df.with_columns(pl.lit(None, dtype=dtype).alias(col))
+
+        df = preparer_colonnes_dvf(df).with_columns([
+            pl.col("date_mutation").fill_null(datetime.date.today()), # annonce sans date : conditions eco du jour
+            pl.lit(None, dtype=pl.Float64).alias("surface_terrain"),
+            pl.lit(1, dtype=pl.Int32).alias("nombre_locaux"),
+        ])
+        df = self.enrichisseur.enrichir_dataframe(df)
+        df = rattacher_code_commune(df, index_communes=self.index_communes)
+        df = joindre_calendrier(df, self.calendrier_eco)
+        df = self.enrichisseur.ajouter_insee(df)
+        df = appliquer_imputation(df, self.regles)
+        df = df.with_columns([(pl.col("type_local") == val).cast(pl.Int8).alias("type_local__" + val) for val in TYPES_LOCAL])
+        df = ajouter_geo_cluster(df, self.centroides)
+
+        X = df.select([(pl.col(col) if col in df.columns else pl.lit(None)).cast(pl.Float32).alias(col)
+                       for col in self.colonnes]).to_numpy()
+        return df, X
+
+    def predire(self, X):
+        # Prix predit (euros) : le modele predit le log de la valeur fonciere
+        return np.exp(self.modele.predict(construire_matrice(X, self.scaler, self.nb_clusters, self.colonnes)))
+
+    def scorer(self, df_annonces):
+        # Score un batch d'annonces : id, prix annonce, prix predit, ecart relatif
+        df, X = self.construire_features(df_annonces)
+        prix_predit = self.predire(X) if len(X) else np.array([], dtype=np.float64)
+        return df.select(["id", "type_local", "valeur_fonciere", "surface_reelle_bati", "code_commune"]).with_columns([
+            pl.Series("prix_predit", prix_predit),
+            ((pl.col("valeur_fonciere") - pl.Series(prix_predit)) / pl.Series(prix_predit)).alias("ecart_relatif_prix"),
+        ])
+
+    def scorer_annonce(self, annonce):
+        # Mode unitaire : une annonce (dictionnaire), latence enregistree
+        debut = time.perf_counter()
+        resultat = self.scorer(pl.DataFrame([annonce]))
+        self.latences_ms.append((time.perf_counter() - debut) * 1000)
+        return resultat.row(0, named=True) if resultat.height else None
+
+    def metriques(self):
+        # Latences du mode unitaire sur la fenetre glissante
+        if not self.latences_ms:
+            return {"n": 0}
+        latences = np.fromiter(self.latences_ms, dtype=np.float64)
+        p99 = float(np.percentile(latences, 99))
+        return {"n": len(latences), "p50_ms": float(np.percentile(latences, 50)), "p99_ms": p99,
+                "budget_p99_ms": BUDGET_LATENCE_P99_MS, "budget_respecte": p99 <= BUDGET_LATENCE_P99_MS}
+
+    def scorer_catalogue(self, df_annonces, taille_batch=TAILLE_BATCH_SCORING):
+        # Mode catalogue : toutes les annonces par batchs, renvoie (resultats, metriques de debit)
+        debut = time.perf_counter()
+        resultats = [self.scorer(df_annonces.slice(i, taille_batch)) for i in range(0, df_annonces.height, taille_batch)]
+        duree = time.perf_counter() - debut
+        df = pl.concat(resultats) if resultats else pl.DataFrame()
+        return df, {"n_annonces": df_annonces.height, "n_scorees": df.height, "duree_s": duree,
+                    "debit_annonces_par_s": df_annonces.height / duree if duree > 0 else float("nan")}
+
+
+def scoring_deferla(source="db"):
+    # Score tout le catalogue Deferla et ecrit la table annonces_scorees dans final_deferla.db
+    service = ServiceScoring()
+    df_annonces = charger_annonces_json() if source == "json" else charger_annonces_db()
+    df_scores, metriques = service.scorer_catalogue(df_annonces)
+    ecrire_table_sqlite(df_scores, PATH_DB_DEFERLA, TABLE_ANNONCES_SCOREES)
+    print(f"✓ {metriques['n_scorees']} annonces scorees en {metriques['duree_s']:.2f} s "
+          f"({metriques['debit_annonces_par_s']:.0f} annonces / s) -> table {TABLE_ANNONCES_SCOREES}")
+    return df_scores, metriques
+
+
+if __name__ == "__main__":
+    scoring_deferla(source="db")
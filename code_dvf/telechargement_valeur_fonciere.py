@@ -11,7 +11,10 @@ os.chdir(CURRENT_FILE_PATH)
 
 from config import PATH_FICHIER_DEP_FR,PATH_FICHIER_DF_VF  # FICHIER
 from config import PATH_DIR_VAL_FONCIERE_DEP, PATH_DIR_DEP_FR,PATH_DIR_DF_VF # Directory/Dossier
-from config import URL_VAL_FONCIERE, TYPE_COLUMN_CSV_SALE, COLUMN_FINAL, TYPE_COLUMN_CSV_PROPRE # Constante Utile
+from config import URL_VAL_FONCIERE, TYPE_COLUMN_CSV_SALE, COLUMN_FINAL, TYPE_COLUMN_CSV_PROPRE, TYPES_LOCAL # Constante Utile
+
+from agregation_mutations import agreger_mutations # Une ligne par mutation (vente)
+from projection import ajouter_projection # Projection Lambert-93 faite une seule fois ici, puis transportee dans tout le pipeline
 
 
 
@@ -63,7 +66,7 @@ def premier_nettoyage_donnee():
                                                         "Vente terrain à bâtir"]))
         
         # On s'interesse au maison et au appart
-        df= df.filter(pl.col("type_local").fill_null("").is_in(["Appartement","Maison"]))
+        df= df.filter(pl.col("type_local").fill_null("").is_in(TYPES_LOCAL))
         
         #Supprime les valeurs nulles (Beaucoup de donnee donc ca va)
         df = df.filter(pl.col("valeur_fonciere").is_not_null()) 
@@ -90,6 +93,10 @@ def premier_nettoyage_donnee():
 
         
         
+        # Une ligne par vente : DVF repete la mutation pour chaque local / parcelle / culture avec la meme valeur_fonciere
+        # On somme les surfaces des locaux de la vente (prix au m2 juste) et on garde le nombre de locaux
+        df = agreger_mutations(df)
+
         #Rajout d'une colonne annee_mois,  Format YYYY-MM (année-mois) utile pour les plots
         df = df.with_columns([pl.col("date_mutation").dt.strftime("%Y-%m").alias("annee_mois"),
                             pl.col("date_mutation").dt.year().alias("annee")]) # Ajoute la colonne année
@@ -101,6 +108,11 @@ def premier_nettoyage_donnee():
     
         #Supprime les doublons si existant
         df = df.unique(subset=['date_mutation','longitude', 'latitude', 'valeur_fonciere', 'surface_terrain'])
+
+        # Projection EPSG:4326 -> EPSG:2154 (x_proj / y_proj en metres), calculee une seule fois pour tout le pipeline
+        # Les etapes suivantes (OSM, nettoyage final, base de donnees) reutilisent ces colonnes sans reprojeter
+        df = ajouter_projection(df.with_columns([pl.col("longitude").cast(pl.Float64),
+                                                 pl.col("latitude").cast(pl.Float64)]))
         
         liste_data_frame.append(df.clone())
         
@@ -1,76 +1,109 @@
-import pandas as pd
-from config import PATH_DIR_ECO
-
-def convert_french_date(date_str):
-    """
-    Convertit une chaîne de caractère au format "abréviation_mois année" en datetime.
-    Exemple : "janv. 2009" -> 2009-01-01
-    """
-    mapping = {
-        "janv.": "01", "févr.": "02", "mars": "03", "avr.": "04",
-        "mai": "05", "juin": "06", "juil.": "07", "août": "08",
-        "sept.": "09", "oct.": "10", "nov.": "11", "déc.": "12"
-    }
-    
-    # Sépare la chaîne en deux parties : le mois et l'année
-    parts = date_str.split()
-    if len(parts) != 2:
-        raise ValueError(f"Format de date non reconnu : {date_str}")
-    
-    month_str, year_str = parts
-    month_num = mapping.get(month_str)
-    if not month_num:
-        raise ValueError(f"Mois non reconnu : {month_str}")
-    
-    # Construit une date avec le premier jour du mois
-    date_formatted = f"{year_str}-{month_num}-01"
-    return pd.to_datetime(date_formatted, format="%Y-%m-%d")
-
-def convert_dates_dataframe(df, column_name):
-    """
-    Applique la conversion de date à une colonne d'un DataFrame.
-    La colonne doit contenir des dates sous forme de chaînes au format "abréviation_mois année".
-    """
-    df[column_name] = df[column_name].apply(convert_french_date)
-    return df
-
-
-df_production = pd.read_csv(PATH_DIR_ECO / 'production_credit_habitat.csv', sep=';')
-df_taux_credit = pd.read_csv(PATH_DIR_ECO / 'taux_des_credit.csv', sep=';')
-df_variation_encours = pd.read_csv(PATH_DIR_ECO / 'variation_encours_credit.csv' ,   sep=';')
-
-print(df_production.head())
-# Exemple d'utilisation sur votre DataFrame df_production :
-df_production = convert_dates_dataframe(df_production, 'Category')
-print(df_production.head())
-
-
-df_production = df_production[df_production['Category']>= '2015-01-01']
-print(df_production.head())
-df_taux_credit = convert_dates_dataframe(df_taux_credit, 'Category')
-df_taux_credit = df_taux_credit[df_taux_credit['Category']>= '2015-01-01']
-print(df_taux_credit.head())
-
-df_variation_encours = convert_dates_dataframe(df_variation_encours, 'Category')
-df_variation_encours = df_variation_encours[df_variation_encours['Category']>= '2015-01-01']
-print(df_variation_encours.head())
-
-
-
-
-
-
-
-df_final = pd.merge(df_production, df_taux_credit, on='Category', how='inner')
-df_final = pd.merge(df_final, df_variation_encours, on='Category', how='inner')
-df_final = df_final.rename(columns={'Category': 'Date'})
-df_final = df_final.drop(columns=["Crédit à l'habitat total","Crédits à l'habitat renégociés"])
-
-df_inflation = pd.read_csv(PATH_DIR_ECO / 'inflation.csv')
-df_inflation['Date'] = pd.to_datetime(df_inflation['Date'], format='%Y-%m')
-df_inflation = df_inflation[df_inflation['Date'] >= '2015-01-01']
-
-print(df_inflation.head())
-df_final = pd.merge(df_final, df_inflation, on='Date', how='inner')
-df_final.to_csv(PATH_DIR_ECO / 'df_eco.csv', sep=';', index=False)
-print(df_final.head())
\ No newline at end of file
+import os
+import json
+import hashlib
+from functools import reduce
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_DIR_ECO, PATH_FICHIER_ECO, PATH_FICHIER_ECO_EMPREINTE, DATE_DEBUT_ECO
+
+import polars as pl
+
+
+# Ingestion des series macro-economiques (Banque de France / INSEE) en un artefact mensuel type (df_eco.parquet)
+#
+# Avant : script a plat, conversion des dates ligne par ligne (pandas .apply), trois pd.merge successifs, prints.
+# Ici :
+#   - fonctions importables (utilisees par fusion_vf_eco_insee.py)
+#   - mois francais ("janv. 2009") convertis par un dictionnaire applique a toute la colonne (vectorise)
+#   - les quatre series sont jointes dans un seul plan Polars (jointure complete : aucun mois n'est perdu)
+#   - sortie Parquet typee (Date + Float64), reconstruite uniquement si un CSV source a change (empreinte sha256)
+
+
+MOIS_FRANCAIS = {
+    "janv.": 1, "févr.": 2, "mars": 3, "avr.": 4,
+    "mai": 5, "juin": 6, "juil.": 7, "août": 8,
+    "sept.": 9, "oct.": 10, "nov.": 11, "déc.": 12
+}
+
+# Fichier source -> (colonne date, format de date, colonnes gardees)
+SOURCES_ECO = {
+    "production_credit_habitat.csv": ("Category", "francais", ["Crédits à l'habitat hors renégociations"]),
+    "taux_des_credit.csv": ("Category", "francais", ["Taux hors renégociations"]),
+    "variation_encours_credit.csv": ("Category", "francais", ["Variations d'encours mensuelles cvs"]),
+    "inflation.csv": ("Date", "%Y-%m", ["IPC"]),
+}
+
+
+def convertir_dates_francaises(expr):
+    # "janv. 2009" -> 2009-01-01, sur toute la colonne d'un coup
+    # Une valeur non reconnue leve une erreur (comme l'ancienne fonction convert_french_date)
+    mois = expr.str.extract(r"^(\S+)\s+\d{4}$", 1).replace_strict(MOIS_FRANCAIS, return_dtype=pl.Int8)
+    annee = expr.str.extract(r"(\d{4})$", 1).cast(pl.Int32)
+    return pl.date(annee, mois, 1)
+
+
+def lire_serie(nom_fichier, colonne_date, format_date, colonnes):
+    # Lecture d'un CSV source (separateur ';' et virgule decimale pour la Banque de France, ',' pour l'inflation)
+    separateur = ";" if format_date == "francais" else ","
+    lf = pl.scan_csv(PATH_DIR_ECO / nom_fichier, separator=separateur, infer_schema=False)
+
+    date = convertir_dates_francaises(pl.col(colonne_date)) if format_date == "francais" \
+        else pl.col(colonne_date).str.strptime(pl.Date, format_date)
+
+    return lf.select([date.alias("Date")] + [
+        pl.col(col).str.replace(",", ".").cast(pl.Float64) for col in colonnes
+    ])
+
+
+def construire_donnees_eco(date_debut=DATE_DEBUT_ECO):
+    # Une jointure complete de toutes les series sur le mois, dans un seul plan : le dernier mois d'une serie en avance
+    # sur les autres est garde (les series en retard y sont nulles, prolongees ensuite par jointure_temporelle.py)
+    series = [lire_serie(nom, *params) for nom, params in SOURCES_ECO.items()]
+    lf = reduce(lambda gauche, droite: gauche.join(droite, on="Date", how="full", coalesce=True), series)
+    return lf.filter(pl.col("Date") >= date_debut).sort("Date").collect()
+
+
+# Version de la construction : l'artefact est reconstruit si elle change, meme avec les memes CSV
+VERSION_CONSTRUCTION_ECO = 2  # 2 : jointure complete des series
+
+
+def empreinte_sources():
+    # Empreinte sha256 de chaque CSV source (et version de la construction)
+    empreintes = {"version": VERSION_CONSTRUCTION_ECO}
+    for nom in SOURCES_ECO:
+        with open(PATH_DIR_ECO / nom, "rb") as f:
+            empreintes[nom] = hashlib.sha256(f.read()).hexdigest()
+    return empreintes
+
+
+def ingestion_eco(forcer=False):
+    # Reconstruit df_eco.parquet seulement si les CSV sources ont change (ou si forcer=True)
+    empreintes = empreinte_sources()
+
+    if not forcer and PATH_FICHIER_ECO.exists() and PATH_FICHIER_ECO_EMPREINTE.exists():
+        with open(PATH_FICHIER_ECO_EMPREINTE, "r", encoding="utf-8") as f:
+            if json.load(f) == empreintes:
+                return False
+
+    df_eco = construire_donnees_eco()
+    df_eco.write_parquet(PATH_FICHIER_ECO)
+    with open(PATH_FICHIER_ECO_EMPREINTE, "w", encoding="utf-8") as f:
+        json.dump(empreintes, f, indent=2)
+    return True
+
+
+def charger_donnees_eco():
+    # Point d'entree des autres etapes : artefact a jour, type (Date + Float64)
+    ingestion_eco()
+    return pl.read_parquet(PATH_FICHIER_ECO)
+
+
+if __name__ == "__main__":
+    if ingestion_eco():
+        print("df_eco.parquet reconstruit")
+    else:
+        print("Sources inchangees, df_eco.parquet deja a jour")
+    print(pl.read_parquet(PATH_FICHIER_ECO).tail())
@@ -10,7 +10,7 @@ from config import PATH_DIR_OSM_TRIEE, PATH_DIR_DF_VF_OSM
 from config import PATH_FICHIER_OSM, PATH_FICHIER_OSM_LIGHT,PATH_FICHIER_OSM_MEDIUM,PATH_FICHIER_DF_VF
 from config import POINT_INTERET, POINT_INTERET_FICHIER, DISTANCE_POINT_INTERET, TAGS_UTILISE
 from config import PROJECTION_EPSG_INITIAL, PROJECTION_EPSG_FINAL
-from config import PATH_FICHIER_DF_VF_OSM
+from config import PATH_FICHIER_DF_VF_OSM, TRI_SPATIAL
 
 from config import POINT_INTERET_LOURD #Point d'interet dont les fichiers sont trop lourd
 
@@ -22,7 +22,9 @@ import polars as pl
 
 # Traitement spatial
 import geopandas as gpd # Gerer les donnees spatiales (pas possible avec polars ou pandas)
-from pyproj import Transformer # Pour projeter des coordonnees geographiques (lat/lon devient  x/y en metres)
+from projection import ajouter_projection, projeter_coordonnees_shapely # Projection lat/lon -> x/y en metres avec un Transformer en cache
+from features_spatiales import calculer_features_spatiales # Definition unique des features nb_* / distance_min_* (batch et API)
+from tri_spatial import trier_spatialement, ecrire_parquet_spatial # Tri par courbe de Hilbert + row groups avec statistiques
 from scipy.spatial import cKDTree # Structure de donnees qui permet une recherche rapide pour les recherches spatiales (regarder les point proches)
 from shapely.geometry import Point, LineString, Polygon #Pour manipuler les objets du fichier OSM : Point / Way / Area
 
@@ -181,9 +183,10 @@ def extraire_tous_les_points_interet(fichier_pbf):
             continue
 
         df = gpd.GeoDataFrame(objets, geometry="location", crs="EPSG:" + str(PROJECTION_EPSG_INITIAL))
-        df_proj = df.to_crs(epsg=PROJECTION_EPSG_FINAL) # On fait la projection, sinon pas possible de travailler avec lat et lon
-        df["x_proj"] = df_proj.centroid.x # Si area ou way on prend le centre .... ok pour les nodes
-        df["y_proj"] = df_proj.centroid.y
+        # On fait la projection, sinon pas possible de travailler avec lat et lon (Transformer partage, pas de to_crs)
+        geometries_proj = gpd.GeoSeries(projeter_coordonnees_shapely(df.geometry.values), crs="EPSG:" + str(PROJECTION_EPSG_FINAL))
+        df["x_proj"] = geometries_proj.centroid.x.values # Si area ou way on prend le centre .... ok pour les nodes
+        df["y_proj"] = geometries_proj.centroid.y.values
         df.to_parquet(path) #Fichier qui possede encore les doublons. On traitera ca ensuite.
         # Doublon dans le sens ou certain poi sont a la fois des node / polygone etc... Ou certain apparaissent deux fois, mais a une dizaine de metre de difference...
         # Nettoyage en sortie
@@ -235,14 +238,9 @@ def supprimer_les_doublons(chemin_fichier, seuil=25):
 
 
 def projeter_biens(df_valeurs_fonciere):
-    transformer = Transformer.from_crs(PROJECTION_EPSG_INITIAL, PROJECTION_EPSG_FINAL, always_xy=True)
-    lon = df_valeurs_fonciere["longitude"].to_numpy()
-    lat = df_valeurs_fonciere["latitude"].to_numpy()
-    x_proj, y_proj = transformer.transform(lon, lat)
-
-    return df_valeurs_fonciere.select(["latitude", "longitude"]).with_columns([
-            pl.Series("x_proj", x_proj),
-            pl.Series("y_proj", y_proj)])
+    # x_proj / y_proj sont deja calcules au premier nettoyage (telechargement_valeur_fonciere.py)
+    # ajouter_projection ne reprojette que si les colonnes sont absentes (ancien fichier df_vf.parquet)
+    return ajouter_projection(df_valeurs_fonciere).select(["latitude", "longitude", "x_proj", "y_proj"])
 
 
 
@@ -276,74 +274,44 @@ def construire_kdtrees(point_interet_dict_bdd):
 
 def rajout_features_un_element(lat,lon,x,y,kdtree_dict,coords_dict):
     # Pour un bien donné (lat/lon), calcule le nombre et la distance minimale aux POIs proches pour chaque catégorie
-    
+    # Meme definition que le batch : on passe par calculer_features_spatiales() avec un seul point
+    # coords_dict est garde pour compatibilite, les distances sont donnees directement par le KD-Tree
     
     result = {"latitude": lat, "longitude": lon}
-
-    for poi_name, tree in kdtree_dict.items():
-        rayon = DISTANCE_POINT_INTERET[poi_name]
-
-        if tree is None:
-            result["nb_"+str(poi_name)] = 0
-            result["distance_min_"+str(poi_name)] = np.nan #crash avec None, polars infere mal sinon
-            continue
-        
-        
-        
-        indices = tree.query_ball_point([x, y], r=rayon) # Donne tous les indices des pois dans un certains rayons
-        nb_proches = len(indices)
-        result["nb_"+str(poi_name)] = nb_proches
-    
-        if nb_proches > 0:
-            dists = np.linalg.norm(coords_dict[poi_name][indices] - np.array([x, y]), axis=1)
-            result["distance_min_"+str(poi_name)] = float(round(dists.min(), 2))
-        else:
-            result["distance_min_"+str(poi_name)] = np.nan #crash avec None
+    features = calculer_features_spatiales([x], [y], kdtree_dict)
+    for col, valeurs in features.items():
+        result[col] = valeurs[0].item()
 
     return result
 
 
 def rajout_features_base_entiere(chemin_df_parquet,kdtree_dict, coords_dic):
     # Applique l’enrichissement spatial à tous les biens : pour chaque bien du fichier, calcule le nb et la distance aux POIs
-    # A voir on va peut etre donner juste la distance min entre deux biens, car fichier poi.parquet parfois assez gros 
     
     
     # === Inputs ===
     # chemin_df_parquet : chemin vers le fichier .parquet contenant les biens (avec latitude / longitude)
     # kdtree_dict : dictionnaire {poi_name: cKDTree} pour les recherches spatiales
-    # coords_dic : dictionnaire {poi_name: coords numpy array}, pour calculer les distances
+    # coords_dic : dictionnaire {poi_name: coords numpy array} (garde pour compatibilite)
 
-    # On lit le gros fichier des valeurs foncieres (Celui avec des milions de lignes) une seule fois avant le multiprocessing (plus efficace)
-    # Et on fait une seul projection, des lat/long. Plus rapide que si on devait le faire a chaque fois pour chaque vente.
+    # On lit le gros fichier des valeurs foncieres (Celui avec des milions de lignes) une seule fois
+    # x_proj / y_proj sont deja presentes (premier nettoyage), projeter_biens ne reprojette pas
     df = pl.read_parquet(chemin_df_parquet)
+
+    # Tri spatial (courbe de Hilbert) : les requetes KD-Tree par blocs restent dans une meme zone (localite de cache)
+    # et le fichier ecrit permet les lectures par boite (voir tri_spatial.py)
+    if TRI_SPATIAL:
+        df = trier_spatialement(df)
     df_proj = projeter_biens(df)
     
+    # Requetes KD-Tree vectorisees sur tous les biens (par blocs) au lieu d'une boucle ligne par ligne
+    features = calculer_features_spatiales(df_proj["x_proj"].to_numpy(), df_proj["y_proj"].to_numpy(), kdtree_dict)
 
-
-    # Conversion en liste de dictionnaires (1 dict = 1 ligne du fichier de valeur fonciere)
-    list_dict_row_df = df_proj.to_dicts()
-
-
-
-    # Rajoute pour chaque bien les nouvelles features geographiques ( nb de poi PROCHE ET distance min pour chaque poi)
-    results = [
-    rajout_features_un_element(
-        row["latitude"], row["longitude"], row["x_proj"], row["y_proj"],
-        kdtree_dict, coords_dic
-    )
-    for row in tqdm(list_dict_row_df)
-]
-
-
-    # Résultats = liste de dictionnaires :  on les convertit en DataFrame Polars
-    df_enrichie = pl.DataFrame(results)
-
-    # Fusion avec le DataFrame initial des valeurs fonciere : on ajoute les colonnes calculées
-    # Ok car joblib conserve l'ordre des lignes traitees.....
-    new_df = df.with_columns([df_enrichie[col] for col in df_enrichie.columns])
+    # Fusion avec le DataFrame initial des valeurs fonciere : on ajoute les colonnes calculées (meme ordre de lignes)
+    new_df = df.with_columns([pl.Series(col, valeurs) for col, valeurs in features.items()])
 
     os.makedirs(PATH_DIR_DF_VF_OSM, exist_ok=True)
-    new_df.write_parquet(PATH_FICHIER_DF_VF_OSM) 
+    ecrire_parquet_spatial(new_df, PATH_FICHIER_DF_VF_OSM)
     
 if __name__ == "__main__":
     fichier_osm = PATH_FICHIER_OSM  #PATH_FICHIER_OSM_LIGHT  #PATH_FICHIER_OSM_MEDIUM   
@@ -0,0 +1,107 @@
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+from config import EMPRISE_LAMBERT93, ORDRE_HILBERT, TAILLE_ROW_GROUP_SPATIAL
+
+
+# Tri spatial des fichiers Parquet (courbe de Hilbert sur x_proj / y_proj)
+#
+# Avant : les lignes de data_vf_oms.parquet et du dataset final sont dans l'ordre de telechargement des departements.
+# Une lecture "dans une zone" touche tous les row groups, et les requetes KD-Tree par blocs sautent d'un bout a l'autre
+# de la France (mauvaise localite de cache).
+# Ici :
+#   - cle_hilbert : position du point sur une courbe de Hilbert (grille 2^ORDRE_HILBERT sur l'emprise Lambert-93).
+#     Deux points proches ont en general des cles proches
+#   - tri par cle puis ecriture en row groups de TAILLE_ROW_GROUP_SPATIAL lignes, avec statistiques min / max :
+#     chaque row group couvre une petite zone, une lecture par boite (lire_bbox) saute les autres row groups
+#
+# Exemple :
+#   >>> df = trier_spatialement(df)
+#   >>> ecrire_parquet_spatial(df, chemin)
+#   >>> lire_bbox(chemin, 640_000, 6_850_000, 670_000, 6_880_000)   # Paris
+
+
+COLONNE_CLE_HILBERT = "cle_hilbert"
+
+
+def cle_hilbert(x, y, emprise=EMPRISE_LAMBERT93, ordre=ORDRE_HILBERT):
+    # Coordonnees (metres, Lambert-93) -> cle de Hilbert (uint64), vectorise sur tout le tableau
+    # Points hors emprise ramenes sur le bord, points sans coordonnees (NaN) en fin de courbe
+    xmin, ymin, xmax, ymax = emprise
+    n = 1 << ordre
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    manquant = np.isnan(x) | np.isnan(y)
+
+    xi = np.clip((np.nan_to_num(x, nan=xmin) - xmin) / (xmax - xmin) * n, 0, n - 1).astype(np.uint64)
+    yi = np.clip((np.nan_to_num(y, nan=ymin) - ymin) / (ymax - ymin) * n, 0, n - 1).astype(np.uint64)
+
+    d = np.zeros(len(xi), dtype=np.uint64)
+    s = n >> 1
+    while s > 0:
+        rx = (xi & np.uint64(s)) > 0
+        ry = (yi & np.uint64(s)) > 0
+        d += np.uint64(s) * np.uint64(s) * ((3 * rx.astype(np.uint64)) ^ ry.astype(np.uint64))
+
+        # Rotation du quadrant
+        inverser = ~ry & rx
+        xi = np.where(inverser, np.uint64(n - 1) - xi, xi)
+        yi = np.where(inverser, np.uint64(n - 1) - yi, yi)
+        echanger = ~ry
+        xi, yi = np.where(echanger, yi, xi), np.where(echanger, xi, yi)
+        s >>= 1
+
+    d[manquant] = np.iinfo(np.uint64).max
+    return d
+
+
+def _cle_hilbert_struct(serie):
+    coords = serie.struct.unnest()
+    return pl.Series(COLONNE_CLE_HILBERT, cle_hilbert(coords["x_proj"].cast(pl.Float64).to_numpy(),
+                                                      coords["y_proj"].cast(pl.Float64).to_numpy()))
+
+
+def ajouter_cle_hilbert(df):
+    # Ajoute la colonne cle_hilbert (DataFrame ou LazyFrame, a partir de x_proj / y_proj)
+    return df.with_columns(
+        pl.struct(["x_proj", "y_proj"]).map_batches(_cle_hilbert_struct, return_dtype=pl.UInt64).alias(COLONNE_CLE_HILBERT)
+    )
+
+
+def trier_spatialement(df):
+    # Tri stable par cle de Hilbert (les lignes d'un meme point gardent leur ordre)
+    return ajouter_cle_hilbert(df).sort(COLONNE_CLE_HILBERT, maintain_order=True)
+
+
+def ecrire_parquet_spatial(df, chemin, taille_row_group=TAILLE_ROW_GROUP_SPATIAL):
+    # Ecriture avec statistiques min / max par row group (cle_hilbert, x_proj, y_proj, ...) : DataFrame ou LazyFrame
+    if isinstance(df, pl.LazyFrame):
+        df.sink_parquet(chemin, statistics=True, row_group_size=taille_row_group)
+    else:
+        df.write_parquet(chemin, statistics=True, row_group_size=taille_row_group)
+
+
+def lire_bbox(chemin, xmin, ymin, xmax, ymax, colonnes=None):
+    # Lecture des seules lignes dans la boite : les row groups dont le min / max x_proj, y_proj sont hors boite ne sont pas lus
+    lf = pl.scan_parquet(chemin)
+    if colonnes is not None:
+        lf = lf.select(colonnes)
+    return lf.filter(pl.col("x_proj").is_between(xmin, xmax) & pl.col("y_proj").is_between(ymin, ymax)).collect()
+
+
+def row_groups_bbox(chemin, xmin, ymin, xmax, ymax):
+    # Diagnostic : (row groups qui intersectent la boite, row groups au total), d'apres les statistiques du fichier
+    metadonnees = pq.ParquetFile(chemin).metadata
+    noms = metadonnees.schema.names
+    ix, iy = noms.index("x_proj"), noms.index("y_proj")
+
+    touches = 0
+    for i in range(metadonnees.num_row_groups):
+        stats_x = metadonnees.row_group(i).column(ix).statistics
+        stats_y = metadonnees.row_group(i).column(iy).statistics
+        if stats_x is None or stats_y is None or not stats_x.has_min_max or not stats_y.has_min_max:
+            touches += 1
+        elif stats_x.min <= xmax and stats_x.max >= xmin and stats_y.min <= ymax and stats_y.max >= ymin:
+            touches += 1
+    return touches, metadonnees.num_row_groups
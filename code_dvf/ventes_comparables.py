@@ -0,0 +1,197 @@
+import os
+import warnings
+from pathlib import Path
+
+CURRENT_FILE_PATH = Path(__file__).parent.resolve()
+os.chdir(CURRENT_FILE_PATH)
+
+from config import PATH_FICHIER_DF_VF_OSM
+from config import K_VENTES_COMPARABLES, RAYON_VENTES_COMPARABLES, FENETRE_JOURS_VENTES_COMPARABLES
+from config import SURECHANTILLONNAGE_VENTES_COMPARABLES, SURFACE_MIN_VENTES_COMPARABLES
+
+import numpy as np
+import polars as pl
+from scipy.spatial import cKDTree
+from tqdm import tqdm
+
+from projection import ajouter_projection
+from tri_spatial import ecrire_parquet_spatial
+
+
+# Features de ventes comparables (le signal prix le plus fort apres les POI) :
+# pour chaque mutation, les k ventes les plus proches dans un rayon donne, parmi les ventes STRICTEMENT anterieures
+# (date_mutation) et dans une fenetre temporelle. On en tire le prix median au m2 et le nombre de ventes trouvees.
+#
+# Pas de fuite d'information (look-ahead) : une vente ne voit jamais une vente du meme jour ou posterieure.
+#
+# Passage a l'echelle : pas de comparaison toutes-paires, et pas de lecture du fichier national en memoire.
+# Le fichier est traite departement par departement (scan paresseux, seules les colonnes utiles sont lues) : les ventes du
+# departement sont interrogees, les candidats sont toutes les ventes de sa boite elargie du rayon (ventes des departements
+# voisins comprises). Le fichier etant trie par cle de Hilbert, le filtre sur la boite ne lit que les row groups utiles.
+# Dans un departement, on traite les ventes dans l'ordre des dates, mois par mois.
+# Pour chaque mois, on construit un KD-Tree uniquement sur les ventes de la fenetre [debut du mois - fenetre, fin du mois),
+# on interroge les k * surechantillonnage plus proches voisins, puis on filtre par date.
+# Si le filtre en elimine trop (voisins sature mais pas assez de ventes valides), on repasse en requete exacte
+# query_ball_point pour ces seules lignes : le resultat est exact.
+
+
+COLONNES_COMPARABLES = ["nb_ventes_comparables", "prix_m2_median_comparables"]
+COLONNES_LECTURE = ["date_mutation", "x_proj", "y_proj", "prix_par_m2_habitable", "surface_reelle_bati", "code_departement"]
+COLONNE_LIGNE = "_ligne" # indice de ligne du fichier, pour rattacher les resultats sans changer l'ordre
+
+
+def _k_premiers_valides(valide, k):
+    # Masque des k premiers voisins valides par ligne (les voisins sont deja tries par distance)
+    return valide & (np.cumsum(valide, axis=1) <= k)
+
+
+def _mediane_par_ligne(prix, garde):
+    # Mediane des prix gardes par ligne (NaN si aucun)
+    prix_garde = np.where(garde, prix, np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning) # ligne sans comparable -> NaN, normal
+        return np.nanmedian(prix_garde, axis=1)
+
+
+def calculer_ventes_comparables(df, k=K_VENTES_COMPARABLES, rayon=RAYON_VENTES_COMPARABLES,
+                                fenetre_jours=FENETRE_JOURS_VENTES_COMPARABLES,
+                                surechantillonnage=SURECHANTILLONNAGE_VENTES_COMPARABLES,
+                                surface_min=SURFACE_MIN_VENTES_COMPARABLES, requete=None):
+    # ==Input==
+    # df : DataFrame Polars avec date_mutation, x_proj, y_proj, prix_par_m2_habitable, surface_reelle_bati
+    # requete : masque numpy des lignes a calculer (None = toutes). Les autres lignes ne servent que de candidats
+    #
+    # ==Output==
+    # df avec deux colonnes en plus (meme ordre de lignes) :
+    #   nb_ventes_comparables       : nombre de ventes anterieures retenues (<= k)
+    #   prix_m2_median_comparables  : prix median au m2 de ces ventes (null si aucune)
+
+    df = ajouter_projection(df)
+    n = df.height
+
+    jours = df["date_mutation"].cast(pl.Date).cast(pl.Int32).to_numpy()
+    mois = df.select((pl.col("date_mutation").dt.year() * 12 + pl.col("date_mutation").dt.month()).alias("mois"))["mois"].to_numpy()
+    coords = df.select(["x_proj", "y_proj"]).to_numpy().astype(np.float64)
+    prix = df["prix_par_m2_habitable"].cast(pl.Float64).to_numpy()
+    surface = df["surface_reelle_bati"].cast(pl.Float64).fill_null(0).to_numpy()
+
+    # Seules les ventes avec un prix au m2 exploitable servent de comparables
+    coords_ok = np.isfinite(coords).all(axis=1)
+    comparable = coords_ok & np.isfinite(prix) & (surface >= surface_min)
+    a_calculer = coords_ok if requete is None else coords_ok & np.asarray(requete, dtype=bool)
+
+    # Tri par date (stable) : les ventes d'une fenetre temporelle sont contigues
+    ordre = np.argsort(jours, kind="stable")
+    jours_t, mois_t, coords_t = jours[ordre], mois[ordre], coords[ordre]
+    prix_t, comparable_t, a_calculer_t = prix[ordre], comparable[ordre], a_calculer[ordre]
+
+    nb_resultat = np.zeros(n, dtype=np.int32)
+    mediane_resultat = np.full(n, np.nan)
+
+    # Debut de chaque mois dans le tableau trie
+    debuts_mois = np.flatnonzero(np.r_[True, mois_t[1:] != mois_t[:-1]])
+    fins_mois = np.r_[debuts_mois[1:], n]
+
+    for debut, fin in tqdm(list(zip(debuts_mois, fins_mois)), desc="Ventes comparables (par mois)", leave=False):
+        # Candidats : ventes comparables dans [premier jour du mois - fenetre, dernier jour du mois)
+        lo = np.searchsorted(jours_t, jours_t[debut] - fenetre_jours, side="left")
+        hi = np.searchsorted(jours_t, jours_t[fin - 1], side="left")
+        candidats = lo + np.flatnonzero(comparable_t[lo:hi])
+
+        requetes = debut + np.flatnonzero(a_calculer_t[debut:fin])
+        if len(candidats) == 0 or len(requetes) == 0:
+            continue
+
+        tree = cKDTree(coords_t[candidats])
+        k_requete = min(k * surechantillonnage, len(candidats))
+        dist, idx = tree.query(coords_t[requetes], k=k_requete, distance_upper_bound=np.nextafter(rayon, np.inf))
+        dist = dist.reshape(len(requetes), k_requete)
+        idx = idx.reshape(len(requetes), k_requete)
+
+        trouve = np.isfinite(dist)
+        idx_sur = np.where(trouve, idx, 0) # idx == len(candidats) quand rien n'est trouve
+        jours_voisins = jours_t[candidats[idx_sur]]
+        jour_requete = jours_t[requetes][:, None]
+        # Pas de look-ahead : strictement anterieure, et dans la fenetre
+        valide = trouve & (jours_voisins < jour_requete) & (jours_voisins >= jour_requete - fenetre_jours)
+
+        garde = _k_premiers_valides(valide, k)
+        nb = garde.sum(axis=1)
+        mediane = _mediane_par_ligne(prix_t[candidats[idx_sur]], garde)
+
+        # Lignes saturees : tous les voisins demandes sont dans le rayon mais le filtre date en a trop elimine
+        # -> requete exacte sur le disque complet pour ces lignes uniquement
+        saturees = np.flatnonzero(trouve.all(axis=1) & (nb < k) & (k_requete < len(candidats)))
+        for i in saturees:
+            point = coords_t[requetes[i]]
+            voisins = np.asarray(tree.query_ball_point(point, r=rayon), dtype=np.int64)
+            jours_v = jours_t[candidats[voisins]]
+            ok = (jours_v < jours_t[requetes[i]]) & (jours_v >= jours_t[requetes[i]] - fenetre_jours)
+            voisins = voisins[ok]
+            if len(voisins) == 0:
+                continue
+            distances = np.linalg.norm(coords_t[candidats[voisins]] - point, axis=1)
+            voisins = voisins[np.argsort(distances, kind="stable")[:k]]
+            nb[i] = len(voisins)
+            mediane[i] = np.median(prix_t[candidats[voisins]])
+
+        nb_resultat[ordre[requetes]] = nb
+        mediane_resultat[ordre[requetes]] = mediane
+
+    return df.with_columns([
+        pl.Series("nb_ventes_comparables", nb_resultat),
+        pl.Series("prix_m2_median_comparables", mediane_resultat).fill_nan(None)
+    ])
+
+
+def _emprises_departements(lf, rayon):
+    # Boite (x_proj, y_proj) de chaque departement, elargie du rayon : zone des candidats de ses ventes
+    return (lf.filter(pl.col("code_departement").is_not_null())
+              .group_by("code_departement")
+              .agg([(pl.col("x_proj").min() - rayon).alias("xmin"), (pl.col("y_proj").min() - rayon).alias("ymin"),
+                    (pl.col("x_proj").max() + rayon).alias("xmax"), (pl.col("y_proj").max() + rayon).alias("ymax")])
+              .drop_nulls()
+              .sort("code_departement")
+              .collect(engine="streaming"))
+
+
+def rajout_ventes_comparables(chemin_df_parquet=PATH_FICHIER_DF_VF_OSM, rayon=RAYON_VENTES_COMPARABLES):
+    # Etape du pipeline : ajoute les colonnes au fichier enrichi OSM (les etapes suivantes les transportent)
+    # Calcul departement par departement (memoire bornee par le plus gros departement), puis reecriture en streaming
+    lf = ajouter_projection(pl.scan_parquet(chemin_df_parquet)).with_row_index(COLONNE_LIGNE)
+    lf = lf.select([COLONNE_LIGNE] + COLONNES_LECTURE)
+
+    emprises = _emprises_departements(lf, rayon)
+    resultats = []
+    for dep in tqdm(emprises.iter_rows(named=True), total=emprises.height, desc="Ventes comparables (par departement)"):
+        df_zone = lf.filter(pl.col("x_proj").is_between(dep["xmin"], dep["xmax"])
+                            & pl.col("y_proj").is_between(dep["ymin"], dep["ymax"])).collect()
+        du_departement = (df_zone["code_departement"] == dep["code_departement"]).fill_null(False)
+        df_zone = calculer_ventes_comparables(df_zone, rayon=rayon, requete=du_departement.to_numpy())
+        resultats.append(df_zone.filter(du_departement).select([COLONNE_LIGNE] + COLONNES_COMPARABLES))
+
+    df_comparables = pl.concat(resultats) if resultats else pl.DataFrame(
+        schema={COLONNE_LIGNE: pl.UInt32, "nb_ventes_comparables": pl.Int32, "prix_m2_median_comparables": pl.Float64})
+
+    # Reecriture en streaming (fichier temporaire puis remplacement) : meme ordre de lignes, tri spatial et row groups conserves
+    lf = pl.scan_parquet(chemin_df_parquet)
+    lf = lf.drop([col for col in COLONNES_COMPARABLES if col in lf.collect_schema().names()])
+    lf = (lf.with_row_index(COLONNE_LIGNE)
+            .join(df_comparables.lazy(), on=COLONNE_LIGNE, how="left", maintain_order="left")
+            .with_columns(pl.col("nb_ventes_comparables").fill_null(0)) # sans coordonnees ni departement : aucune vente
+            .drop(COLONNE_LIGNE))
+    fichier_temporaire = Path(chemin_df_parquet).with_suffix(".tmp.parquet")
+    ecrire_parquet_spatial(lf, fichier_temporaire)
+    os.replace(fichier_temporaire, chemin_df_parquet)
+
+
+def ventes_comparables_a_calculer(chemin_df_parquet=PATH_FICHIER_DF_VF_OSM):
+    # Vrai si le fichier n'a pas encore les colonnes de ventes comparables (voir pipeline_final.py)
+    colonnes = pl.scan_parquet(chemin_df_parquet).collect_schema().names()
+    return not all(col in colonnes for col in COLONNES_COMPARABLES)
+
+
+if __name__ == "__main__":
+    print("Ajout des ventes comparables a df_vf_oms.parquet en cours...")
+    rajout_ventes_comparables()
+    print("==== FIN ---")